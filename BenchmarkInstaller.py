@@ -0,0 +1,575 @@
+#!/usr/bin/python3
+# Download benchmark for the CurseForge modpack installer by Ricard Grace
+# Runs the installer's download engine against a local stand-in for the CurseForge API and CDN,
+# so download performance can be measured without touching the real thing.
+import sys
+import os
+import json
+import re
+import time
+import random
+import hashlib
+import threading
+import socket
+import argparse
+import logging
+import subprocess
+import zipfile
+import http.server
+
+import InstallModPack
+
+
+# === CONSTANTS ===
+# PATHS
+LOG_FILE: str = os.path.join(InstallModPack.CWD, "modpack_benchmark_log.txt")
+FAKE_MODPACK_FILE: str = "fake_modpack.zip"
+# FAKE SERVER
+FAKE_DATA_BLOCK_SIZE: int = 1024*1024 # Every fake mod file is cut from one block of random bytes this big
+FAKE_CHUNK_SIZE: int = 16*1024 # Fake files are sent in chunks of this many bytes so bandwidth can be limited
+FAKE_RETRY_AFTER: int = 1 # Seconds sent in Retry-After with injected 429s
+FAKE_SERVER_BACKLOG: int = 1024 # Connections waiting to be accepted by the fake server
+FAKE_PROJECT_ID_START: int = 100000
+FAKE_FILE_ID_START: int = 4000000
+FAKE_MOD_SIZE_MIN: int = 1024
+FAKE_MOD_SIZE_MAX: int = 128*1024*1024
+FAKE_MINECRAFT_VERSION: str = "1.20.1"
+FAKE_FORGE_ID: str = "forge-47.2.0"
+# MISC
+KB_TO_BYTES: int = 1024
+# ARGUMENT DEFAULTS
+DEFAULT_MOD_COUNTS: list[int] = [50, 200]
+DEFAULT_THREAD_COUNTS: list[int] = [1, 4, 16]
+DEFAULT_MOD_SIZE: float = 256.0 # Mean mod size in KB
+DEFAULT_LATENCY: float = 20.0 # in ms
+DEFAULT_BANDWIDTH: float = 0.0 # in KB/s per connection, 0 is unlimited
+DEFAULT_SEED: int = 1
+DEFAULT_PORT: int = 0 # Any free port
+DEFAULT_BENCHMARK_TEMP: str = "modpack_benchmark_temp"
+
+
+def main(args: dict) -> int:
+    """
+    Runs every combination of mod count, download engine and download thread count against a fake server and reports the results
+    """
+    mod_counts: list[int] = sorted(set(max(x, 1) for x in args["mods"]))
+    thread_counts: list[int] = sorted(set(max(x, 1) for x in args["threads"]))
+    engines: list[str] = [x for x in InstallModPack.DOWNLOAD_ENGINES if x in args["engines"]]
+    fpath_temp: str = os.path.realpath(args["tempfolder"])
+    if not InstallModPack.generateFolder(fpath_temp):
+        InstallModPack.logError(f"Failed to prepare benchmark folder '{fpath_temp}'")
+        return 1
+
+    # Every pack is a prefix of the same set of mods, so only the largest needs generating
+    InstallModPack.logInfo(f"Generating {max(mod_counts)} fake mods...")
+    fake_mods: list[dict] = generateFakeMods(max(mod_counts), int(args["modsize"]*KB_TO_BYTES), args["seed"])
+    server = FakeCurseForgeServer(fake_mods, args["latency"]/1000, int(args["bandwidth"]*KB_TO_BYTES), args["errorrate"], args["throttlerate"], args["truncaterate"], args["seed"], args["port"], args["apiratelimit"])
+    api_url: str = server.start()
+    InstallModPack.logInfo(f"Fake CurseForge server running at {api_url}")
+
+    if args["serve"]:
+        # Leave the server running for manual testing with the installer itself
+        fpath_modpack: str = os.path.join(fpath_temp, FAKE_MODPACK_FILE)
+        writeFakeModpack(fpath_modpack, fake_mods[:mod_counts[0]])
+        InstallModPack.logInfo(f"Wrote fake modpack with {mod_counts[0]} mods to '{fpath_modpack}'")
+        print(f"Try: python InstallModPack.py \"{fpath_modpack}\" -apiurl {api_url} -noforge -noprofile\nPress Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        server.stop()
+        return 0
+
+    results: list[dict] = []
+    for mod_count in mod_counts:
+        for engine in engines:
+            for thread_count in thread_counts:
+                InstallModPack.logInfo(f"Benchmarking {mod_count} mods with {thread_count} {engine}...")
+                server.resetCounters()
+                result: dict = runBenchmarkCase(fpath_temp, api_url, fake_mods[:mod_count], thread_count, args["resolvethreads"], engine, args["adaptivethreads"], args["apirate"])
+                result["server"] = dict(server.counters)
+                results.append(result)
+    server.stop()
+
+    printResults(results)
+    if args["output"]:
+        with open(args["output"], "w") as f:
+            json.dump({"settings": {k: v for k, v in args.items() if k not in ("casemanifest", "caseresult")}, "results": results}, f, indent=4)
+        InstallModPack.logInfo(f"Wrote results to '{args['output']}'")
+    return 0
+
+
+# ===========================
+# HELPER FUNCTIONS BELOW HERE
+# ===========================
+
+# === Fake Server ===
+class FakeCurseForgeHTTPServer(http.server.ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when hundreds of downloads connect at once, which a real CDN would not
+    request_queue_size: int = FAKE_SERVER_BACKLOG
+
+
+class FakeCurseForgeServer():
+    """
+    A local stand-in for the parts of the CurseForge API and CDN the installer uses:
+        POST /v1/mods/files                              Bulk file details
+        GET  /v1/mods/{projectID}/files/{fileID}/download-url   Single download location
+        GET  /cdn/{fileID}/{fileName}                    Redirects to the file like the real CDN
+        GET  /files/{fileID // 1000}/{fileID % 1000}/{fileName} The file itself. Supports Range and ETag.
+    Latency, bandwidth and injected faults (500s, 429s and truncated bodies) are configurable,
+    as is a rate limit on API requests which throttles them like the real API.
+    """
+    def __init__(self, fake_mods: list[dict], latency: float=0.0, bandwidth: int=0, error_rate: float=0.0, throttle_rate: float=0.0, truncate_rate: float=0.0, seed: int=DEFAULT_SEED, port: int=DEFAULT_PORT, api_rate_limit: float=0.0):
+        self.mods: dict[str, dict] = {x["fileID"]: x for x in fake_mods}
+        self.latency: float = latency # Seconds added to every request
+        self.bandwidth: int = bandwidth # Bytes per second per connection, 0 is unlimited
+        self.error_rate: float = error_rate
+        self.throttle_rate: float = throttle_rate
+        self.truncate_rate: float = truncate_rate
+        self.api_rate_limit: float = api_rate_limit # API requests allowed per second before throttling them, 0 is unlimited
+        self.api_window: int = 0 # The second API requests are being counted for
+        self.api_window_requests: int = 0
+        self.block: bytes = makeFakeDataBlock(seed)
+        self.random: random.Random = random.Random(seed)
+        self.lock: threading.Lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.resetCounters()
+        self.server: http.server.ThreadingHTTPServer = FakeCurseForgeHTTPServer(("127.0.0.1", port), FakeCurseForgeRequestHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.thread: threading.Thread|None = None
+
+
+    def start(self) -> str:
+        """
+        Starts serving in the background. Returns the base URL of the server.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url()
+
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def resetCounters(self) -> None:
+        with self.lock:
+            self.counters = {"api": 0, "cdn": 0, "bytes": 0, "errors": 0, "throttled": 0, "truncated": 0}
+
+
+    def count(self, counter: str, amount: int=1) -> None:
+        with self.lock:
+            self.counters[counter] += amount
+
+
+    def isOverAPIRate(self) -> bool:
+        """
+        Counts an API request against the rate limit. Returns if it went over.
+        """
+        if not self.api_rate_limit:
+            return False
+        with self.lock:
+            window: int = int(time.monotonic())
+            if window != self.api_window:
+                self.api_window = window
+                self.api_window_requests = 0
+            self.api_window_requests += 1
+            return self.api_window_requests > self.api_rate_limit
+
+
+    def pickFault(self, truncatable: bool) -> str|None:
+        """
+        Randomly decides if a request should fail, and how
+        """
+        with self.lock:
+            roll: float = self.random.random()
+        if roll < self.error_rate:
+            return "error"
+        roll -= self.error_rate
+        if roll < self.throttle_rate:
+            return "throttle"
+        roll -= self.throttle_rate
+        if truncatable and roll < self.truncate_rate:
+            return "truncate"
+        return None
+
+
+class FakeCurseForgeRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real thing
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"[FAKE SERVER] {format % args}")
+
+
+    def do_POST(self) -> None:
+        fake: FakeCurseForgeServer = self.server.fake
+        body: bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.startRequest("api", fake.pickFault(False)):
+            return
+        if self.path != "/v1/mods/files":
+            self.sendBody(404, b"")
+            return
+        try:
+            file_ids: list[int] = json.loads(body)["fileIds"]
+        except Exception:
+            self.sendBody(400, b"")
+            return
+        data: list[dict] = [makeFakeFileObject(fake.mods[str(x)], self.baseURL()) for x in file_ids if str(x) in fake.mods]
+        self.sendBody(200, json.dumps({"data": data}).encode("utf-8"), "application/json")
+
+
+    def do_GET(self) -> None:
+        fake: FakeCurseForgeServer = self.server.fake
+        match = re.match(r"^/v1/mods/(\d+)/files/(\d+)/download-url$", self.path)
+        if match:
+            if not self.startRequest("api", fake.pickFault(False)):
+                return
+            mod: dict|None = fake.mods.get(match[2])
+            if not mod or mod["projectID"] != match[1]:
+                self.sendBody(404, b"")
+                return
+            self.sendBody(200, json.dumps({"data": makeFakeDownloadURL(mod, self.baseURL())}).encode("utf-8"), "application/json")
+            return
+
+        match = re.match(r"^/cdn/(\d+)/[^/]+$", self.path)
+        if match:
+            if not self.startRequest("cdn", fake.pickFault(False)):
+                return
+            mod: dict|None = fake.mods.get(match[1])
+            if not mod:
+                self.sendBody(404, b"")
+                return
+            self.sendBody(302, b"", extra_headers={"Location": makeFakeFilePath(mod)})
+            return
+
+        match = re.match(r"^/files/(\d+)/(\d+)/[^/]+$", self.path)
+        if match:
+            fault: str|None = fake.pickFault(True)
+            if not self.startRequest("cdn", fault):
+                return
+            mod: dict|None = fake.mods.get(str(int(match[1])*1000 + int(match[2])))
+            if not mod:
+                self.sendBody(404, b"")
+                return
+            self.sendFile(mod, fault == "truncate")
+            return
+
+        self.sendBody(404, b"")
+
+
+    def startRequest(self, counter: str, fault: str|None) -> bool:
+        """
+        Applies latency and any error or throttle fault to a request.
+        Returns if the request should carry on.
+        """
+        fake: FakeCurseForgeServer = self.server.fake
+        fake.count(counter)
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fault == "error":
+            fake.count("errors")
+            self.sendBody(500, b"")
+            return False
+        if fault == "throttle" or (counter == "api" and fake.isOverAPIRate()):
+            fake.count("throttled")
+            self.sendBody(429, b"", extra_headers={"Retry-After": str(FAKE_RETRY_AFTER)})
+            return False
+        return True
+
+
+    def sendBody(self, code: int, body: bytes, content_type: str="text/plain", extra_headers: dict={}) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def sendFile(self, mod: dict, truncate: bool) -> None:
+        """
+        Sends the contents of a fake mod, honouring Range requests
+        """
+        fake: FakeCurseForgeServer = self.server.fake
+        etag: str = f"\"{mod['sha1']}\""
+        start: int = 0
+        end: int = mod["size"] - 1
+        partial: bool = False
+        match = re.match(r"^bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            start = int(match[1])
+            end = min(int(match[2]), end) if match[2] else end
+            if start > end:
+                self.sendBody(416, b"", extra_headers={"Content-Range": f"bytes */{mod['size']}"})
+                return
+            partial = True
+
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", "application/java-archive")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{mod['size']}")
+        self.end_headers()
+
+        # Cut the body off half way through if truncating
+        stop: int = start + (end - start + 1)//2 if truncate else end + 1
+        position: int = start
+        while position < stop:
+            chunk: bytes = readFakeData(fake.block, mod["offset"] + position, min(FAKE_CHUNK_SIZE, stop - position))
+            self.wfile.write(chunk)
+            position += len(chunk)
+            fake.count("bytes", len(chunk))
+            if fake.bandwidth:
+                time.sleep(len(chunk)/fake.bandwidth)
+        if truncate:
+            fake.count("truncated")
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+
+
+    def baseURL(self) -> str:
+        return self.server.fake.url()
+
+
+# === Fake Data ===
+def makeFakeDataBlock(seed: int) -> bytes:
+    return random.Random(seed).randbytes(FAKE_DATA_BLOCK_SIZE)
+
+
+def readFakeData(block: bytes, position: int, length: int) -> bytes:
+    """
+    Returns length bytes of the endless stream made by repeating the block, starting at position
+    """
+    position %= len(block)
+    chunk: bytes = block[position:position+length]
+    while len(chunk) < length:
+        chunk += block[:length-len(chunk)]
+    return chunk
+
+
+def generateFakeMods(count: int, size_mean: int, seed: int=DEFAULT_SEED) -> list[dict]:
+    """
+    Makes a list of fake mods with sizes spread around the mean.
+    Each mod's contents start at a different point of the shared data block so they all have different hashes.
+    """
+    rng: random.Random = random.Random(seed)
+    block: bytes = makeFakeDataBlock(seed)
+    fake_mods: list[dict] = []
+    for i in range(0, count):
+        size: int = int(min(max(rng.expovariate(1/size_mean), FAKE_MOD_SIZE_MIN), FAKE_MOD_SIZE_MAX))
+        fake_mod: dict = {
+            "projectID": str(FAKE_PROJECT_ID_START + i),
+            "fileID": str(FAKE_FILE_ID_START + i),
+            "fileName": f"fake-mod-{i:04}-1.0.jar",
+            "size": size,
+            "offset": rng.randrange(0, FAKE_DATA_BLOCK_SIZE)
+        }
+        sha1 = hashlib.sha1()
+        md5 = hashlib.md5()
+        for position in range(0, size, FAKE_DATA_BLOCK_SIZE):
+            chunk: bytes = readFakeData(block, fake_mod["offset"] + position, min(FAKE_DATA_BLOCK_SIZE, size - position))
+            sha1.update(chunk)
+            md5.update(chunk)
+        fake_mod["sha1"] = sha1.hexdigest()
+        fake_mod["md5"] = md5.hexdigest()
+        fake_mods.append(fake_mod)
+    return fake_mods
+
+
+def makeFakeFileObject(fake_mod: dict, base_url: str) -> dict:
+    """
+    Returns a fake mod as the file object the CurseForge API would give for it
+    """
+    return {
+        "id": int(fake_mod["fileID"]),
+        "modId": int(fake_mod["projectID"]),
+        "fileName": fake_mod["fileName"],
+        "fileLength": fake_mod["size"],
+        "downloadUrl": makeFakeDownloadURL(fake_mod, base_url),
+        "hashes": [{"value": fake_mod["sha1"], "algo": InstallModPack.HASH_ALGO_SHA1}, {"value": fake_mod["md5"], "algo": InstallModPack.HASH_ALGO_MD5}]
+    }
+
+
+def makeFakeDownloadURL(fake_mod: dict, base_url: str) -> str:
+    return f"{base_url}/cdn/{fake_mod['fileID']}/{fake_mod['fileName']}"
+
+
+def makeFakeFilePath(fake_mod: dict) -> str:
+    file_id: int = int(fake_mod["fileID"])
+    return f"/files/{file_id // 1000}/{file_id % 1000}/{fake_mod['fileName']}"
+
+
+def makeFakeManifest(fake_mods: list[dict]) -> dict:
+    return {
+        "minecraft": {"version": FAKE_MINECRAFT_VERSION, "modLoaders": [{"id": FAKE_FORGE_ID, "primary": True}]},
+        "manifestType": "minecraftModpack",
+        "manifestVersion": 1,
+        "name": "Fake Benchmark Pack",
+        "version": "1.0.0",
+        "files": [{"projectID": int(x["projectID"]), "fileID": int(x["fileID"]), "required": True} for x in fake_mods],
+        "overrides": InstallModPack.MODPACK_OVERRIDES_FOLDER
+    }
+
+
+def writeFakeModpack(fpath_modpack: str, fake_mods: list[dict]) -> None:
+    """
+    Writes a modpack zip for the fake mods which the installer can install from the fake server
+    """
+    with zipfile.ZipFile(fpath_modpack, "w") as f:
+        f.writestr(InstallModPack.MANIFEST_FILE, json.dumps(makeFakeManifest(fake_mods), indent=4))
+        f.writestr(f"{InstallModPack.MODPACK_OVERRIDES_FOLDER}/config/fake.cfg", "fake=true\n")
+
+
+# === Benchmark ===
+def runBenchmarkCase(fpath_temp: str, api_url: str, fake_mods: list[dict], thread_count: int, resolve_thread_count: int=InstallModPack.DEFAULT_RESOLVE_THREADS, engine: str=InstallModPack.DEFAULT_DOWNLOAD_ENGINE, adaptive: bool=False, api_rate: float=InstallModPack.DEFAULT_API_RATE) -> dict:
+    """
+    Runs a single benchmark in a new process, so each case gets its own peak memory figure.
+    Returns the results of the case.
+    """
+    fpath_case: str = os.path.join(fpath_temp, f"case_{len(fake_mods)}_{engine}_{thread_count}")
+    InstallModPack.regenerateFolder(fpath_case)
+    fpath_manifest: str = os.path.join(fpath_case, InstallModPack.MANIFEST_FILE)
+    fpath_result: str = os.path.join(fpath_case, "result.json")
+    with open(fpath_manifest, "w") as f:
+        json.dump(makeFakeManifest(fake_mods), f)
+
+    command: list[str] = [sys.executable, os.path.realpath(__file__), "-casemanifest", fpath_manifest, "-caseresult", fpath_result, "-apiurl", api_url, "-threads", str(thread_count), "-resolvethreads", str(resolve_thread_count), "-engines", engine, "-apirate", str(api_rate)] + (["-adaptivethreads"] if adaptive else [])
+    case_result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if case_result.returncode != 0 or not os.path.isfile(fpath_result):
+        logging.error(case_result.stderr.decode(errors="replace"))
+        raise Exception(f"Benchmark case failed with exit code {case_result.returncode}")
+    with open(fpath_result, "r") as f:
+        result: dict = json.load(f)
+    InstallModPack.removeFile(fpath_case)
+    return result
+
+
+def runBenchmarkCaseProcess(fpath_manifest: str, fpath_result: str, api_url: str, thread_count: int, resolve_thread_count: int=InstallModPack.DEFAULT_RESOLVE_THREADS, engine: str=InstallModPack.DEFAULT_DOWNLOAD_ENGINE, adaptive: bool=False, api_rate: float=InstallModPack.DEFAULT_API_RATE) -> int:
+    """
+    The body of a benchmark case process. Downloads every mod in the manifest and writes the measurements to the result file.
+    """
+    fpath_case: str = os.path.dirname(fpath_manifest)
+    logging.basicConfig(filename=os.path.join(fpath_case, "case_log.txt"), level=logging.DEBUG, format="%(asctime)s %(levelname).3s: %(message)s")
+    mod_list: list[dict] = InstallModPack.readManifestModList(InstallModPack.readManifestFile(fpath_manifest))
+    InstallModPack.api_rate_limiter.configure(api_rate)
+
+    time_start: float = time.perf_counter()
+    successful: bool = InstallModPack.downloadModList(mod_list, fpath_case, thread_count, True, None, api_url, InstallModPack.HTTPConnectionPool(), resolve_thread_count, engine, adaptive)
+    wall_time: float = time.perf_counter() - time_start
+
+    fpath_mods: str = os.path.join(fpath_case, InstallModPack.MODS_FOLDER)
+    size_total: int = sum(os.path.getsize(os.path.join(fpath_mods, x)) for x in os.listdir(fpath_mods))
+    latencies: list[float] = sorted(x["downloadSeconds"] for x in mod_list if "downloadSeconds" in x)
+    result: dict = {
+        "mods": len(mod_list),
+        "engine": engine,
+        "threads": thread_count,
+        "resolveThreads": resolve_thread_count,
+        "adaptive": adaptive,
+        "apiRate": api_rate,
+        "successful": successful,
+        "failed": len([x for x in mod_list if not x.get("file")]),
+        "wallTime": wall_time,
+        "bytes": size_total,
+        "throughput": size_total/wall_time if wall_time else 0.0,
+        "latencyP50": InstallModPack.getPercentile(latencies, 50),
+        "latencyP99": InstallModPack.getPercentile(latencies, 99),
+        "peakMemory": InstallModPack.getPeakMemoryUsage()
+    }
+    with open(fpath_result, "w") as f:
+        json.dump(result, f)
+    return 0
+
+
+def printResults(results: list[dict]) -> None:
+    header: str = f"{'Mods':>6} {'Engine':>8} {'Threads':>8} {'Wall (s)':>9} {'MB/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'Peak RSS (MB)':>14} {'Failed':>7} {'429s':>5} {'500s':>5} {'Cut':>5}"
+    print(f"\n{header}\n{'='*len(header)}")
+    for r in results:
+        p50: str = f"{r['latencyP50']*1000:.0f}" if r["latencyP50"] is not None else "-"
+        p99: str = f"{r['latencyP99']*1000:.0f}" if r["latencyP99"] is not None else "-"
+        peak: str = f"{r['peakMemory']/InstallModPack.MB_TO_BYTES:.1f}" if r["peakMemory"] is not None else "-"
+        print(f"{r['mods']:>6} {r['engine']:>8} {r['threads']:>8} {r['wallTime']:>9.2f} {r['throughput']/InstallModPack.MB_TO_BYTES:>8.2f} {p50:>9} {p99:>9} {peak:>14} {r['failed']:>7} {r['server']['throttled']:>5} {r['server']['errors']:>5} {r['server']['truncated']:>5}")
+    print()
+
+
+# ==================
+# SCRIPT STARTS HERE
+# ==================
+if __name__ == '__main__':
+    # Process arguments
+    try:
+        arg_parser = argparse.ArgumentParser(description="Benchmarks the modpack installer's mod downloads against a local fake CurseForge server.")
+        arg_parser.add_argument("-mods", "-m", nargs="+", type=int, default=DEFAULT_MOD_COUNTS,
+                                help=f"The number of mods in each synthetic modpack to benchmark. Default is {' '.join(str(x) for x in DEFAULT_MOD_COUNTS)}.")
+        arg_parser.add_argument("-threads", "-th", nargs="+", type=int, default=DEFAULT_THREAD_COUNTS,
+                                help=f"The download thread counts to benchmark each modpack with. For the asyncio engine this is the number of downloads at once. Default is {' '.join(str(x) for x in DEFAULT_THREAD_COUNTS)}.")
+        arg_parser.add_argument("-engines", "-e", nargs="+", choices=InstallModPack.DOWNLOAD_ENGINES, default=InstallModPack.DOWNLOAD_ENGINES,
+                                help=f"The download engines to benchmark each modpack with. Default is {' '.join(InstallModPack.DOWNLOAD_ENGINES)}.")
+        arg_parser.add_argument("-resolvethreads", "-rt", type=int, default=InstallModPack.DEFAULT_RESOLVE_THREADS,
+                                help=f"The number of threads looking up mods with the fake API in every benchmark. Default is {InstallModPack.DEFAULT_RESOLVE_THREADS}.")
+        arg_parser.add_argument("-adaptivethreads", "-at", action="store_true",
+                                help="Let the installer tune the number of downloads at once in every benchmark, starting from each thread count.")
+        arg_parser.add_argument("-apirate", "-ar", type=float, default=InstallModPack.DEFAULT_API_RATE,
+                                help=f"The installer's API requests per second limit in every benchmark. 0 is unlimited. Default is {InstallModPack.DEFAULT_API_RATE}.")
+        arg_parser.add_argument("-apiratelimit", "-arl", type=float, default=0.0,
+                                help=f"API requests per second the fake server allows before throttling them with HTTP 429 and a Retry-After of {FAKE_RETRY_AFTER}s. Default is unlimited.")
+        arg_parser.add_argument("-modsize", "-ms", type=float, default=DEFAULT_MOD_SIZE,
+                                help=f"The mean size of each fake mod in KB. Default is {DEFAULT_MOD_SIZE}.")
+        arg_parser.add_argument("-latency", "-la", type=float, default=DEFAULT_LATENCY,
+                                help=f"Latency added by the fake server to every request in ms. Default is {DEFAULT_LATENCY}.")
+        arg_parser.add_argument("-bandwidth", "-bw", type=float, default=DEFAULT_BANDWIDTH,
+                                help="Bandwidth limit of each connection to the fake server in KB/s. Default is unlimited.")
+        arg_parser.add_argument("-errorrate", "-er", type=float, default=0.0,
+                                help="Fraction of requests the fake server fails with HTTP 500.")
+        arg_parser.add_argument("-throttlerate", "-tr", type=float, default=0.0,
+                                help=f"Fraction of requests the fake server throttles with HTTP 429 and a Retry-After of {FAKE_RETRY_AFTER}s.")
+        arg_parser.add_argument("-truncaterate", "-tu", type=float, default=0.0,
+                                help="Fraction of file downloads the fake server cuts off half way through.")
+        arg_parser.add_argument("-seed", type=int, default=DEFAULT_SEED,
+                                help=f"Random seed for the fake mods and injected faults. Default is {DEFAULT_SEED}.")
+        arg_parser.add_argument("-port", "-p", type=int, default=DEFAULT_PORT,
+                                help="The port for the fake server. By default any free port is used.")
+        arg_parser.add_argument("-tempfolder", "-tf", default=DEFAULT_BENCHMARK_TEMP,
+                                help=f"The working folder for the benchmark. Anything in this folder could be overwritten or removed. By default it is '{DEFAULT_BENCHMARK_TEMP}'")
+        arg_parser.add_argument("-output", "-o",
+                                help="Also write the results to this JSON file.")
+        arg_parser.add_argument("-serve", "-s", action="store_true",
+                                help="Only run the fake server (and write a fake modpack for the smallest mod count) for use with the installer's -apiurl flag.")
+        # Used internally to run each benchmark case in its own process
+        arg_parser.add_argument("-casemanifest", help=argparse.SUPPRESS)
+        arg_parser.add_argument("-caseresult", help=argparse.SUPPRESS)
+        arg_parser.add_argument("-apiurl", help=argparse.SUPPRESS)
+        args: argparse.Namespace = arg_parser.parse_args()
+    except SystemExit:
+        # Normal exit is an exception.
+        sys.exit(0)
+
+    if args.casemanifest:
+        sys.exit(runBenchmarkCaseProcess(args.casemanifest, args.caseresult, args.apiurl, args.threads[0], args.resolvethreads, args.engines[0], args.adaptivethreads, args.apirate))
+
+    # Setup logging
+    try:
+        logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG, format="%(asctime)s %(levelname).3s: %(message)s", datefmt="%d/%m/%y %H:%M:%S", filemode="w")
+    except:
+        print(f"Failed to setup logging. LOG_FILE={LOG_FILE} Crashing...", file=sys.stderr)
+        sys.exit(1)
+
+    r: int = 1
+    try:
+        r = main(vars(args))
+    except:
+        print(f"FATAL CRASH. See {LOG_FILE} for details.")
+        logging.exception("=== BENCHMARK CRASH ===")
+    sys.exit(r)
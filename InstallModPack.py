@@ -5,8 +5,11 @@ import json
 import urllib.parse
 import zipfile
 import os
-import urllib.request
 import urllib.error
+import urllib.request
+import http.client
+import http.server
+import ssl
 import re
 import shutil
 import subprocess
@@ -16,6 +19,31 @@ import threading
 import logging
 import argparse
 import random
+import heapq
+import mmap
+import concurrent.futures
+import email.utils
+import email.parser
+import asyncio
+import hashlib
+import ipaddress
+import cProfile
+import pstats
+import tracemalloc
+import zlib
+import typing
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+try:
+    import fcntl # Not available on Windows
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt # Only available on Windows
+except ImportError:
+    msvcrt = None
 
 
 # === BUILD INFO ===
@@ -27,6 +55,10 @@ APP_VERSION: str = "v2.0.0"
 # PATHS
 CWD: str = os.path.dirname(os.path.realpath(sys.argv[0]))
 LOG_FILE: str = os.path.join(CWD, "modpack_installer_log.txt")
+REPORT_FILE: str = os.path.join(CWD, "modpack_installer_report.json")
+PROFILE_FILE: str = os.path.join(CWD, "modpack_installer_profile.txt") # Top functions when profiling
+PROFILE_STATS_FILE: str = os.path.join(CWD, "modpack_installer_profile.prof") # Full profile in pstats format
+PROFILE_MEMORY_FILE: str = os.path.join(CWD, "modpack_installer_memory.txt") # Top allocators at each phase when profiling
 MINECRAFT_FPATH_DEFAULT: str = os.path.join(os.getenv("APPDATA", "/"), ".minecraft") # If APPDATA is not an environment variable this path will likely be invalid but will not cause a crash.
 # URL DOWNLOAD
 DOWNLOAD_TRIES_MAX: int = 3 # Attempt downloads up to this many times before giving up
@@ -34,17 +66,97 @@ DOWNLOAD_TIMEOUT: int = 5 # Timeouts for downloads
 DOWNLOAD_RETRY_WAIT_MIN: int = 1 # Download retry min wait time
 DOWNLOAD_RETRY_WAIT_SPREAD: int = 2 # Download retry random scatter time
 DOWNLOAD_STEP_TRIES_MAX: int = 3 # Only allow running the entire download step this many times before failing
+MOD_DOWNLOAD_TRIES_MAX: int = 5 # Each mod is tried this many times by the download threads before it is reported as failed
+DOWNLOAD_RETRY_BACKOFF_BASE: float = 1.0 # Mod retries wait this long the first time, doubling each retry
+DOWNLOAD_RETRY_BACKOFF_MAX: float = 30.0 # Mod retries never wait longer than this, unless told to by the server
+DOWNLOAD_CHUNK_SIZE: int = 64*1024 # Downloads are streamed to disk in chunks of this many bytes. One buffer per thread.
+DOWNLOAD_PART_SUFFIX: str = ".part" # Files being downloaded are written under this suffix and renamed when complete
+DOWNLOAD_PART_INFO_SUFFIX: str = ".json" # Sidecar next to each partial download recording how to resume it
+SEGMENTED_DOWNLOAD_THRESHOLD: int = 32*1024*1024 # Files at least this many bytes are downloaded in several parts at once
+SEGMENTED_DOWNLOAD_SEGMENTS: int = 4 # How many parts to split large files into
+SEGMENTED_DOWNLOAD_THREADS: int = 8 # Threads shared by all segmented downloads
+DOWNLOAD_REDIRECTS_MAX: int = 10 # Follow at most this many redirects for a single request
+POOL_IDLE_CONNECTIONS_MAX: int = 16 # Keep at most this many idle connections open per host
+HTTP_REDIRECT_CODES: tuple[int, ...] = (301, 302, 303, 307, 308)
+DOWNLOAD_ENGINE_THREADS: str = "threads" # A thread per download
+DOWNLOAD_ENGINE_ASYNCIO: str = "asyncio" # A task per download on one event loop
+DOWNLOAD_ENGINES: list[str] = [DOWNLOAD_ENGINE_THREADS, DOWNLOAD_ENGINE_ASYNCIO]
+# ADAPTIVE CONCURRENCY
+ADAPTIVE_CONCURRENCY_MIN: int = 1 # The adaptive controller never runs fewer downloads at once than this
+ADAPTIVE_CONCURRENCY_MAX: int = 64 # or more than this, unless started higher with -downloadthreads
+ADAPTIVE_INTERVAL: float = 1.0 # Seconds of downloads measured before each adjustment
+ADAPTIVE_SAMPLES_MIN: int = 4 # Downloads finished in an interval before it is used for an adjustment, unless there were 429s
+ADAPTIVE_INCREASE_STEP: int = 1 # Downloads added at once when things are going well (additive increase)
+ADAPTIVE_DECREASE_FACTOR: float = 0.5 # Downloads at once are multiplied by this on 429s or errors (multiplicative decrease)
+ADAPTIVE_ERROR_RATE_MAX: float = 0.05 # Fraction of downloads failing with server errors or timeouts which counts as overloading the server
+ADAPTIVE_LATENCY_TOLERANCE: float = 2.0 # Latency this many times the best seen, without more throughput, means more downloads at once only queue up
+ADAPTIVE_THROUGHPUT_GAIN_MIN: float = 0.05 # Throughput has to grow by at least this fraction to count as improving
+# CURSEFORGE API
+CURSEFORGE_API_URL_DEFAULT: str = "https://api.curseforge.com"
+RESOLVE_BATCH_SIZE: int = 500 # Maximum number of files to look up in a single bulk API request
+RESOLVE_PIPELINE_BATCH_SIZE: int = 100 # The resolve threads look up this many files at a time, so downloads can start before everything is resolved
+TRANSFER_QUEUE_MAX: int = 64 # The resolve threads wait while this many mods are waiting to be downloaded
+API_RATE_PAUSE_DEFAULT: float = 5.0 # Seconds every API request waits after a 429 which did not say how long to wait
+HASH_ALGO_SHA1: int = 1 # CurseForge hash algorithm IDs
+HASH_ALGO_MD5: int = 2
 # FOLDER/FILE NAMES
 MANIFEST_FILE: str = "manifest.json"
 MINECRAFT_PROFILE_FILE: str = "launcher_profiles.json"
 MINECRAFT_VERSIONS_FOLDER: str = "versions"
+MINECRAFT_LIBRARIES_FOLDER: str = "libraries"
+FORGE_INSTALL_PROFILE_FILE: str = "install_profile.json" # Every forge installer jar has one of these
 MODS_FOLDER: str = "mods"
+PARTIAL_FOLDER: str = "partial" # Partial downloads are kept here in the temp folder so they can be resumed
 MODPACK_OVERRIDES_FOLDER: str = "overrides"
+INSTALL_LOCK_FILE: str = "modpack_install_lock.json"
+INSTALL_LOCK_VERSION: int = 1
+BATCH_CACHE_SUFFIX: str = "_batch_cache" # With -nocache, batch installs share mods through a throwaway cache next to the temp folder
+# CACHE PEERS
+PEER_MODS_PATH: str = "mods" # Cache servers serve mods under /mods/{projectID}/{fileID}
+PEER_FORGE_PATH: str = "forge" # and forge installers under /forge/{forgeInstallerFile}
+PEER_HEADER_FILE_NAME: str = "X-Mod-File-Name" # Only informational. Mods are always saved under the name from the API.
+PEER_HEADER_SHA1: str = "X-Sha1"
+PEER_PART_SUFFIX: str = ".peer.part" # Files from cache peers are written under this suffix and renamed once complete
+FORGE_INSTALLER_SUFFIX: str = "-installer.jar"
+FORGE_MAVEN_HASH_SUFFIX: str = ".sha1" # The forge maven publishes the SHA1 hash of each installer next to it. Forge installers from peers must match it.
+# OFFLINE BUNDLES
+BUNDLE_INDEX_FILE: str = "bundle_index.json" # Lists everything in an offline bundle along with its hash
+BUNDLE_INDEX_VERSION: int = 1
+BUNDLE_FOLDER: str = "bundle" # The modpack and forge installer are taken out of a bundle to here in the temp folder
+BUNDLE_MODPACK_FOLDER: str = "modpack" # Folders inside a bundle
+BUNDLE_MODS_FOLDER: str = "mods" # Mods are stored under their SHA1 hash
+BUNDLE_FORGE_FOLDER: str = "forge"
+# MOD CACHE
+CACHE_INDEX_FILE: str = "cache_index.json"
+CACHE_LOCK_FILE: str = "cache_index.lock" # Held by an installer while it writes the index or evicts, as caches can be shared
+CACHE_ORPHAN_AGE: float = 60*60 # Files not in the index are only removed once this many seconds old, as another installer may be about to add them
+CACHE_FILES_FOLDER: str = "files"
+FORGE_CACHE_FOLDER: str = "forge" # Forge installers are kept here in the cache, named by minecraft and forge version
+FORGE_CACHE_HASH_SUFFIX: str = ".sha1" # Sidecar next to each cached forge installer holding its hash
+CACHE_INDEX_VERSION: int = 1
+HASH_CHUNK_SIZE: int = 1024*1024 # Read files in chunks of this many bytes when hashing
+HASH_VERIFY_THREADS: int = max(min(os.cpu_count() or 1, 4), 1) # Threads used to check the hashes of downloaded mods
+# ZIP EXTRACTION
+ZIP_EXTRACT_THREADS: int = max(min(os.cpu_count() or 1, 8), 1) # Threads used to extract large modpack zips
+ZIP_EXTRACT_THREADED_FILES: int = 256 # Folders with at least this many files are extracted with threads
+ZIP_EXTRACT_THREADED_SIZE: int = 64*1024*1024 # Folders with at least this many bytes are extracted with threads
+ZIP_EXTRACT_CHUNK_SIZE: int = 1024*1024 # Extract files in chunks of this many bytes
+SYNC_MTIME_TOLERANCE: float = 2.0 # Files within this many seconds of each other count as unchanged. Zip times only have 2 second resolution.
+# RUN REPORT
+REPORT_VERSION: int = 1
+PROFILE_TOP_COUNT: int = 40 # Functions and allocating lines listed in the profile files
+PROFILE_TRACEMALLOC_FRAMES: int = 1 # Stack frames kept per allocation when profiling memory. More is slower.
+# FILE LINKING
+FICLONE: int = 0x40049409 # Linux ioctl which reflinks one file to another on file systems that support it (btrfs, XFS, ...)
 # MISC
 PROGRESS_BAR_SIZE: int = 40
-REMOVE_SLEEP: float = 1.0
+REMOVE_SLEEP: float = 1.0 # Removing a folder used to wait this long for the OS to catch up. Used to report the time background removal saves.
+REMOVE_THREADS: int = 2 # Threads deleting removed folders in the background
+REMOVE_TRASH_SUFFIX: str = ".trash" # Removed folders are renamed with this suffix while they are deleted
 # MINECRAFT MEMORY
 GB_TO_MB: int = 1024
+GB_TO_BYTES: int = 1024*1024*1024
+MB_TO_BYTES: int = 1024*1024
 MEMORY_MIN: float = 1.0
 MEMORY_MAX: float = 32.0 # Anything beyond this is crazy. Especially since the benefits start to break down after 10GB.
 # HTTP HEADERS
@@ -57,6 +169,13 @@ DEFAULT_DOWNLOAD_HEADERS: dict[str, str] = {
 # ARGUMENT DEFAULTS
 DEFAULT_INSTALL_TEMP: str = "modpack_install_temp"
 DEFAULT_DOWNLOAD_THREADS: int = 4
+DEFAULT_RESOLVE_THREADS: int = 2
+DEFAULT_DOWNLOAD_ENGINE: str = DOWNLOAD_ENGINE_THREADS
+DEFAULT_API_RATE: float = 20.0 # API requests per second
+DEFAULT_CACHE_FOLDER: str = os.path.join(CWD, "modpack_cache")
+DEFAULT_CACHE_SIZE: float = 10.0 # in GB
+DEFAULT_PEER_HOST: str = "127.0.0.1" # Cache servers only serve this machine unless given a host to listen on
+DEFAULT_PEER_PORT: int = 8765
 DEFAULT_MEMORY_MAX: float = 4.0 # in GB
 DEFAULT_JAVA_ARGS: str = "-XX:+UnlockExperimentalVMOptions -XX:+UseG1GC -XX:G1NewSizePercent=20 -XX:G1ReservePercent=20 -XX:MaxGCPauseMillis=50 -XX:G1HeapRegionSize=16M -Djava.net.preferIPv4Stack=true"
 # PARAMETER NAMES
@@ -68,9 +187,7 @@ def main(args: dict) -> int:
     Does main really need an explanation?
     """
     # Give the user something nice to look at
-    title: str = f"| {appVersionStr()} |"
-    title_border: str = "="*len(title)
-    print(f"{title_border}\n{title}\n{title_border}")
+    printTitle()
 
     # Do some checks/processing on arguments
     logging.info("Processing arguments...")
@@ -88,15 +205,48 @@ def main(args: dict) -> int:
     no_profile: bool = args["noprofile"]
     auto_accept: bool = args["autoaccept"]
     download_thread_count: int = max(args["downloadthreads"], 1)
+    resolve_thread_count: int = max(args["resolvethreads"], 1)
+    download_engine: str = args["downloadengine"]
+    adaptive_threads: bool = args["adaptivethreads"]
+    api_rate_limiter.configure(max(args["apirate"], 0.0))
     forge_installer_headless: bool = args["forgeheadless"]
     modpack_memory_max: float = args["memorymax"]
     modpack_java_args: str = args["javaargs"]
+    no_cache: bool = args["nocache"]
+    fpath_cache: str = os.path.realpath(args["cachefolder"])
+    cache_size_max: int = int(max(args["cachesize"], 0.0) * GB_TO_BYTES)
+    api_url: str = args["apiurl"].rstrip("/")
+    full_install: bool = args["fullinstall"]
+    link_files: bool = args["linkfiles"]
+    sync_hash: bool = args["synchash"]
+    http_pool: HTTPConnectionPool = HTTPConnectionPool()
+    peers: CachePeers|None = CachePeers(args["peer"]) if args["peer"] else None
+
+    # An offline bundle brings the modpack zip, mods and forge installer with it, so nothing needs the network
+    fpath_bundle: str|None = None
+    bundle_index: dict|None = None
+    if isBundle(fpath_modpack):
+        run_report.phase("read bundle")
+        logInfo("Reading offline bundle...")
+        fpath_bundle = fpath_modpack
+        try:
+            bundle_index = readBundleIndex(fpath_bundle)
+            if not generateFolder(fpath_install_temp):
+                raise Exception("Failed to prepare temporary folder")
+            fpath_modpack = extractBundle(fpath_bundle, bundle_index, os.path.join(fpath_install_temp, BUNDLE_FOLDER))
+        except Exception as e:
+            # Something happened. This is unrecoverable.
+            print(f"Error while reading bundle '{fpath_bundle}'", file=sys.stderr)
+            raise e
+        logInfo(f"> Done! Installing offline from a bundle of {len(bundle_index['mods'])} mods")
 
-    # Unzip the supplied modpack zip file
+    # Read the manifest straight out of the supplied modpack zip file
+    run_report.phase("read manifest")
+    manifest: dict
     if not no_unzip:
-        logInfo("Unzipping modpack zip...")
+        logInfo("Reading modpack zip...")
         try:
-            unzipToDir(fpath_modpack, fpath_install_temp)
+            manifest = unzipManifest(fpath_modpack, fpath_install_temp)
         except Exception as e:
             # Something happened. This is unrecoverable.
             print(f"Error while unzipping modpack file '{fpath_modpack}'", file=sys.stderr)
@@ -105,16 +255,16 @@ def main(args: dict) -> int:
     else:
         logInfo("Skipping modpack unzip due to flag...")
 
-    # Read the contents of the manifest file
-    logInfo("Reading modpack manifest...")
-    fpath_manifest = os.path.join(fpath_install_temp, MANIFEST_FILE)
-    try:
-        manifest = readManifestFile(fpath_manifest)
-    except Exception as e:
-        # Something happened. This is unrecoverable.
-        print(f"Error while reading manifest file '{fpath_manifest}'", file=sys.stderr)
-        raise e
-    logInfo("> Done!")
+        # Read the contents of the manifest file kept from a previous run
+        logInfo("Reading modpack manifest...")
+        fpath_manifest = os.path.join(fpath_install_temp, MANIFEST_FILE)
+        try:
+            manifest = readManifestFile(fpath_manifest)
+        except Exception as e:
+            # Something happened. This is unrecoverable.
+            print(f"Error while reading manifest file '{fpath_manifest}'", file=sys.stderr)
+            raise e
+        logInfo("> Done!")
 
     # Parse the manifest file
     logInfo("Parsing manifest file...")
@@ -131,11 +281,12 @@ def main(args: dict) -> int:
             modpack_version = manifest["version"]
     except Exception as e:
         # Something happened. This is unrecoverable.
-        print(f"Error while parsing manifest file '{fpath_manifest}'", file=sys.stderr)
+        print(f"Error while parsing manifest of modpack '{fpath_modpack}'", file=sys.stderr)
         raise e
     logInfo("> Done!")
 
     # Prompt the user with details of the installation and if they want to continue
+    run_report.phase("confirm")
     message=f"""Modpack Name: {modpack_name}
 Modpack Version: {modpack_version}
 Forge Version: {forge_version}
@@ -152,65 +303,178 @@ Modpack Profile Name: {modpack_profile_name}"""
         logInfo("Installation cancelled. Exiting...")  
         return 0
 
+    # Forge only depends on the manifest, so download and install it while the mods download
+    forge_future: concurrent.futures.Future|None = None
+    if not no_forge:
+        logInfo("Starting forge download and install alongside the mod downloads...")
+        forge_pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(1, "forge")
+        fpath_forge_cache: str|None = os.path.join(fpath_cache, FORGE_CACHE_FOLDER) if not no_cache else None
+        if bundle_index:
+            # The forge installer taken out of the bundle is laid out like the cache
+            fpath_forge_cache = os.path.join(fpath_install_temp, BUNDLE_FOLDER, BUNDLE_FORGE_FOLDER)
+        forge_future = forge_pool.submit(installForge, minecraft_version, forge_version, fpath_install_temp, fpath_minecraft, forge_installer_headless, http_pool, fpath_forge_cache, force=full_install, offline=bundle_index is not None, peers=peers)
+        forge_pool.shutdown(wait=False)
+
     # Start the process of downloading all the required mods.
+    run_report.phase("download mods")
+    fpath_install_mods: str = os.path.join(fpath_install, MODS_FOLDER)
+    mod_list: list[dict] = []
+    install_lock: dict|None = None
+    mods_keep: list[dict] = [] # Lock entries of installed mods which are unchanged
+    mods_remove: list[dict] = [] # Lock entries of installed mods which need to go
+    mods_downloaded: list[dict] = [] # Lock entries of mods left in the temporary folder by a previous run
+    # Extract the mod list from the manifest file
+    logInfo("Detecting mods...")
+    mod_list = readManifestModList(manifest)
+    logInfo(f"Detected {len(mod_list)} mods in modpack")
+
+    # Only install what changed since the last install, if we know what that was
+    if not full_install:
+        install_lock = readInstallLock(fpath_install)
+    if install_lock:
+        mod_list, mods_keep, mods_remove = diffInstallLock(mod_list, install_lock, fpath_install_mods)
+        logInfo(f"Updating previous install: {len(mod_list)} mods to install, {len(mods_keep)} unchanged, {len(mods_remove)} to remove")
+    else:
+        logInfo("Doing full install of all mods")
+
     if not no_download:
-        # Extract the mod list from the manifest file
-        logInfo("Detecting mods...")
-        mod_list: list[dict] = readManifestModList(manifest)
-        logInfo(f"Detected {len(mod_list)} mods in modpack")
-
-        # Run the download loop
-        logInfo("Starting download loop...")
-        if downloadModList(mod_list, fpath_install_temp, download_thread_count, auto_accept):
+        # Open the shared mod cache so previously downloaded mods do not need to be downloaded again
+        mod_cache: ModCache|None = None
+        if bundle_index:
+            logInfo("Skipping mod cache as mods come from the bundle...")
+        elif not no_cache:
+            logInfo(f"Loading mod cache '{fpath_cache}'...")
+            mod_cache = ModCache(fpath_cache, cache_size_max, FileInstaller(link_files))
+            mod_cache.load()
+        else:
+            logInfo("Skipping mod cache due to flag...")
+
+        # Run the download loop, or take the mods out of the bundle
+        run_report.mod_list = mod_list
+        download_successful: bool
+        if bundle_index:
+            logInfo(f"Taking {len(mod_list)} mods out of the bundle...")
+            download_successful = installBundleMods(fpath_bundle, bundle_index, mod_list, fpath_install_temp)
+        else:
+            logInfo("Starting download loop...")
+            download_successful = downloadModList(mod_list, fpath_install_temp, download_thread_count, auto_accept, mod_cache, api_url, http_pool, resolve_thread_count, download_engine, adaptive_threads, peers)
+
+        # Keep the cache within its size limit and remember what is in it for next time
+        if mod_cache:
+            logInfo(f"Mod cache: {mod_cache.hits} hits, {mod_cache.misses} misses")
+            try:
+                mod_cache.evict()
+                mod_cache.save()
+            except Exception as e:
+                logging.exception("Failed to update mod cache")
+                logWarn(f"Failed to update mod cache: {e}")
+
+        logInfo(f"Connection pool: {http_pool.hits} reused, {http_pool.misses} new connections")
+        logMemoryUsage()
+        if download_successful:
             logInfo(f"Successfully downloaded all mods.")
+            # Remember which file is which mod, so the downloads can be installed again with -nodownload
+            try:
+                writeInstallLock(fpath_install_temp, modpack_name, modpack_version, [makeInstallLockEntry(mod) for mod in mod_list])
+            except Exception as e:
+                logging.exception("Failed to write temporary install lock file")
+                logWarn(f"Failed to write temporary install lock file. The downloaded mods cannot be reused with -nodownload: {e}")
         else:
             logInfo("> Exiting install with download error.")
+            if forge_future and not forge_future.done():
+                logInfo("Waiting for forge install to finish before exiting...")
+                concurrent.futures.wait([forge_future])
             return 1
 
         # Clear the progress bar
         print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
     else:
         logInfo("Skipping mod download due to flag...")
-
-    # Download and install forge
-    if not no_forge:
-        # TODO, get forge installer headless command
-        # Download
-        logInfo("Downloading forge installer...")
-        try:
-            forge_file = downloadForgeInstaller(minecraft_version, forge_version, fpath_install_temp)
-        except Exception as e:
-            logError("Failed to download forge")
-            logInfo("> Exiting install with forge error.")
+        # Every mod which is not already installed has to have been left in the temporary folder by a previous run
+        mods_found: list[dict]|None = findDownloadedMods(mod_list, fpath_install_temp)
+        if mods_found is None:
+            logError("Mods in temporary install folder missing. Install without -nodownload to download them.")
+            logInfo("> Exiting install with installation error")
+            if forge_future and not forge_future.done():
+                logInfo("Waiting for forge install to finish before exiting...")
+                concurrent.futures.wait([forge_future])
             return 1
-
-        # Install
-        logInfo(f"> Running forge installer '{forge_file}'...")
-        if forge_installer_headless:
-            print("\tRunning in headless mode due to flag. Please hold (puts on hold music)...")
-        else:
-            print("\tIt will show up in a seperate window. Follow the installation prompts then come back here.")
-        # TODO, check for java installation
+        mods_downloaded = mods_found
+        logInfo(f"Found {len(mods_downloaded)} mods to install in the temporary folder")
+
+    # Wait for forge, which has been installing alongside the mod downloads
+    run_report.phase("wait for forge")
+    if forge_future:
+        if not forge_future.done():
+            logInfo("Waiting for forge install to finish...")
         try:
-            runForgeInstaller(fpath_install_temp, forge_file, fpath_minecraft, forge_installer_headless)
+            forge_install_name: str = forge_future.result()
         except Exception as e:
-            logError("Failed to install forge")
-            logInfo("> Exiting install with forge error")
-            return 1
-        logInfo("Detected forge installer closed without error")
-
-        # Check the installed version of forge exists
-        forge_install_name: str = isForgeVersionInstalled(fpath_minecraft, minecraft_version, forge_version)
-        if not forge_install_name:
-            # Could not find the forge installation...
-            logError("Failed to find forge installation. Was it installed?")
+            logging.exception("Failed to install forge")
+            logError(f"Failed to install forge: {e}")
             logInfo("> Exiting install with forge error")
             return 1
-
         logInfo(f"Found forge version '{forge_install_name}' - install successful!")
     else:
         logInfo("Skipping forge download and install due to flag...")
+    # Nothing else needs the network
+    http_pool.close()
+
+    # Lay out the modpack from the mods in the temporary folder
+    pack: dict = {"fpath": fpath_modpack, "name": modpack_name, "version": modpack_version, "minecraftVersion": minecraft_version, "forgeVersion": forge_version, "fpathInstall": fpath_install}
+    fpath_install_temp_mods: str = os.path.join(fpath_install_temp, MODS_FOLDER)
+    mod_files: list[tuple[str, dict]]
+    if no_download:
+        mod_files = [(os.path.join(fpath_install_temp_mods, x["fileName"]), x) for x in mods_downloaded]
+    else:
+        mod_files = [(os.path.join(fpath_install_temp_mods, x["file"]["fileName"]), makeInstallLockEntry(x)) for x in mod_list]
+    result: int = installModpack(pack, mod_files, install_lock, mods_keep, mods_remove, fpath_minecraft, fpath_install_temp, modpack_profile_name, modpack_memory_max, modpack_java_args, auto_accept=auto_accept, no_profile=no_profile, full_install=full_install, link_files=link_files, sync_hash=sync_hash)
+    if result != 0:
+        return result
+
+    # INSTALLATION IS FINALLY COMPLETE!!!
+    logInfo("Installation complete!")
 
+    # Ask for post cleanup
+    run_report.phase("clean up")
+    message = """Temporary installation files keep the mods downloaded
+by this install, so they can be installed again with
+-nodownload as long as they are not cleaned up (installing
+another modpack will also clean them up). Can be useful for
+repairing or debugging the install without downloading
+them again.
+Note: After an update only the changed mods were downloaded,
+so only those are kept. The mod cache is not affected."""
+    query = "Clean up temporary installation data? (y/n)"
+    if showPromptYN(message, query, auto_accept):
+        # Do cleanup
+        logInfo("Doing temporary install data cleanup...")
+        removeFile(fpath_install_temp)
+
+    logMemoryUsage()
+    logInfo("Everything done!")
+    logInfo("> Exiting with success!")
+    return 0
+
+
+def installModpack(pack: dict, mod_files: list[tuple[str, dict]], install_lock: dict|None, mods_keep: list[dict], mods_remove: list[dict], fpath_minecraft: str, fpath_install_temp: str|None, modpack_profile_name: str, modpack_memory_max: float, modpack_java_args: str, *, auto_accept: bool, no_profile: bool, full_install: bool, link_files: bool, sync_hash: bool, phase_prefix: str="") -> int:
+    """
+    Lays out a modpack whose mods are already downloaded: sets up its profile, removes what the last install left
+    behind, installs the mods and overrides, then writes the install lock.
+    The modpack is described by pack ("fpath", "name", "version", "minecraftVersion", "forgeVersion", "fpathInstall").
+    mod_files lists where to install each mod from along with its lock entry. The unchanged mods (mods_keep) are left
+    alone and the old ones (mods_remove) removed, as worked out by diffInstallLock against install_lock.
+    Returns the exit code, like main.
+    """
+    fpath_modpack: str = pack["fpath"]
+    modpack_name: str = pack["name"]
+    modpack_version: str = pack["version"]
+    minecraft_version: str = pack["minecraftVersion"]
+    forge_version: str = pack["forgeVersion"]
+    fpath_install: str = pack["fpathInstall"]
+    fpath_install_mods: str = os.path.join(fpath_install, MODS_FOLDER)
+
+    run_report.phase(f"{phase_prefix}profile")
     if not no_profile:
         logInfo(f"Setting up modpack profile '{modpack_profile_name}'")
 
@@ -287,6 +551,7 @@ if it is going to respect the value in Java args."""
         logInfo("Skipping profile setup due to flag...")
 
     # Do instalation by copying all the relevant mods over to the target directory
+    run_report.phase(f"{phase_prefix}remove old files")
     logInfo("Copying mods to install directory")
     # Ensure the target directory exists
     if not generateFolder(fpath_install):
@@ -295,243 +560,2198 @@ if it is going to respect the value in Java args."""
         return 1
 
 
-    fpath_install_temp_overrides: str = os.path.join(fpath_install_temp, MODPACK_OVERRIDES_FOLDER)
+    # Overrides come straight from the modpack zip, unless an old style unzipped copy is being reused
+    fpath_install_temp_overrides: str|None = os.path.join(fpath_install_temp, MODPACK_OVERRIDES_FOLDER) if fpath_install_temp else None
+    overrides_unzipped: bool = bool(fpath_install_temp_overrides) and os.path.isdir(fpath_install_temp_overrides)
+    override_files: dict[str, dict]
+    if overrides_unzipped:
+        override_files = listFolder(fpath_install_temp_overrides)
+    else:
+        override_files = listZipFolder(fpath_modpack, MODPACK_OVERRIDES_FOLDER)
 
-    # Clear override folders in install location
+    # Remove overrides which are no longer part of the modpack. Everything else is updated in place.
     logInfo("Removing old installed overrides...")
-    overrides: list[str] = os.listdir(fpath_install_temp_overrides)
-    for override in overrides:
-        fpath_install_temp_override: str = os.path.join(fpath_install_temp_overrides, override)
-        logging.info(f"Processing override '{fpath_install_temp_override}'")
-        if not os.path.isdir(fpath_install_temp_override):
-            # Must be a directory to regenerate the directory.
-            continue
-        fpath_install_override: str = os.path.join(fpath_install, override)
-        # Regenerate the target override directories
-        if not regenerateFolder(fpath_install_override):
-            logError("Failed to prepare install override directory")
-            logInfo("> Exiting with install error")
-            return 1
+    overrides_previous: list[str]|None = None
+    if not full_install:
+        previous_lock: dict|None = install_lock or readInstallLock(fpath_install)
+        overrides_previous = previous_lock.get("overrides") if previous_lock else None
+    if overrides_previous is None:
+        # Without knowing what the last install put there, clear out anything the modpack does not have in the
+        # override folders. The mods folder is dealt with below.
+        logInfo("> No record of previously installed overrides. Removing everything not in the modpack from override folders.")
+    override_folders: list[str] = sorted(set(x.split("/")[0] for x in override_files if "/" in x and x.split("/")[0] != MODS_FOLDER))
+    try:
+        removed_count: int = removeOldFiles(fpath_install, override_files, overrides_previous, override_folders)
+    except Exception as e:
+        logging.exception("Failed to remove old overrides")
+        logError("Failed to remove old installed overrides")
+        logInfo("> Exiting with install error")
+        return 1
+    logInfo(f"> Removed {removed_count} old override files")
 
-    # Make sure the mods folder is empty and exists
-    logInfo("Removing old installed mods...")
-    fpath_install_mods = os.path.join(fpath_install, MODS_FOLDER)
-    if not regenerateFolder(fpath_install_mods):
-            logError("Failed to prepare install override directory")
+    if install_lock:
+        # Only remove the mods which were changed or removed from the modpack
+        logInfo(f"Removing {len(mods_remove)} old installed mods...")
+        if not generateFolder(fpath_install_mods):
+            logError("Failed to prepare install mods directory")
             logInfo("> Exiting with install error")
             return 1
+        for lock_entry in mods_remove:
+            fpath_installed_mod: str = os.path.join(fpath_install_mods, lock_entry["fileName"])
+            if os.path.isfile(fpath_installed_mod):
+                logging.info(f"Removing installed mod '{fpath_installed_mod}'")
+                os.remove(fpath_installed_mod)
+    else:
+        # Make sure the mods folder is empty and exists
+        logInfo("Removing old installed mods...")
+        if not regenerateFolder(fpath_install_mods):
+                logError("Failed to prepare install override directory")
+                logInfo("> Exiting with install error")
+                return 1
 
     # Copy base mods (non-overrides) into install location
+    run_report.phase(f"{phase_prefix}install mods")
+    file_installer: FileInstaller = FileInstaller(link_files)
     logInfo("Installing base mods...")
-    fpath_install_temp_mods = os.path.join(fpath_install_temp, MODS_FOLDER)
-    if os.path.isdir(fpath_install_temp_mods):
-        # Copy all the mods from the install temp to the install location
-        copyReplaceFile(fpath_install_temp_mods, fpath_install_mods)
+    for fpath_mod_source, lock_entry in mod_files:
+        fpath_mod: str = os.path.join(fpath_install_mods, lock_entry["fileName"])
+        try:
+            method: str = file_installer.install(fpath_mod_source, fpath_mod)
+        except Exception as e:
+            # This should only occur due to user intervention (bad user) or from one of the skip flags being used incorrectly.
+            logging.exception(f"Failed to install mod '{fpath_mod_source}'")
+            logError(f"Failed to install mod '{lock_entry['fileName']}'. Did you remove it? {e}")
+            logInfo("> Exiting install with installation error")
+            return 1
+        logging.info(f"Installed file ({method}) '{fpath_mod_source}' => '{fpath_mod}'")
+
+    # Copy overrides, skipping any which are already installed and unchanged
+    run_report.phase(f"{phase_prefix}install overrides")
+    logInfo("Installing overrides...")
+    if overrides_unzipped:
+        override_count, override_size = syncFolder(fpath_install_temp_overrides, override_files, fpath_install, file_installer, sync_hash)
     else:
-        # This should only occur due to user intervention (bad user) or from one of the skip flags being used incorrectly.
-        logError("Mods in temporary install folder missing. Did you remove them?")
-        logInfo("> Exiting install with installation error")
+        override_count, override_size = syncZipFolder(fpath_modpack, MODPACK_OVERRIDES_FOLDER, override_files, fpath_install, sync_hash)
+    logInfo(f"> Updated {override_count} of {len(override_files)} override files ({override_size/MB_TO_BYTES:.1f} MB), {len(override_files) - override_count} unchanged")
+    logInfo(f"Installed files: {file_installer.report()}")
+
+    # Remember exactly what was installed so the next update only has to deal with what changed
+    run_report.phase(f"{phase_prefix}write install lock")
+    lock_entries: list[dict] = mods_keep + [x[1] for x in mod_files]
+    try:
+        writeInstallLock(fpath_install, modpack_name, modpack_version, lock_entries, list(override_files))
+    except Exception as e:
+        logging.exception("Failed to write install lock file")
+        logWarn(f"Failed to write install lock file. The next install will reinstall every mod: {e}")
+
+    logInfo(f"Installed modpack '{modpack_name}'")
+    return 0
+
+
+def installModpacks(args: dict) -> int:
+    """
+    Installs several modpacks in one go.
+    The mods of every modpack are merged into one deduplicated download into the mod cache, sharing the same download
+    workers and connections, while forge is installed once for each distinct version. Each modpack is then laid out
+    by installModpack straight from the cache.
+    """
+    printTitle()
+
+    # Do some checks/processing on arguments
+    logging.info("Processing batch arguments...")
+    fpath_modpacks: list[str] = [os.path.realpath(x) for x in args["fpath_modpack"]]
+    for fpath_modpack in fpath_modpacks:
+        if not os.path.exists(fpath_modpack):
+            print(f"Modpack file '{fpath_modpack}' does not exist! Please check where it is located and try again.\n\tExiting...", file=sys.stderr)
+            logging.info(f"Failed to find input modpack file at path '{fpath_modpack}'")
+            return 1
+    if args["nounzip"] or args["nodownload"]:
+        logError("-nounzip and -nodownload can only be used when installing a single modpack")
+        return 1
+    if any(isBundle(x) for x in fpath_modpacks):
+        logError("Offline bundles can only be installed one at a time")
+        return 1
+    if args["modpackname"]:
+        logWarn("Ignoring -modpackname as several modpacks are being installed. Each modpack gets its own default profile name.")
+    fpath_install_temp: str = os.path.realpath(args["tempfolder"])
+    fpath_minecraft: str = os.path.realpath(args["minecraftpath"])
+    no_forge: bool = args["noforge"]
+    auto_accept: bool = args["autoaccept"]
+    download_thread_count: int = max(args["downloadthreads"], 1)
+    resolve_thread_count: int = max(args["resolvethreads"], 1)
+    download_engine: str = args["downloadengine"]
+    adaptive_threads: bool = args["adaptivethreads"]
+    api_rate_limiter.configure(max(args["apirate"], 0.0))
+    forge_installer_headless: bool = args["forgeheadless"]
+    no_cache: bool = args["nocache"]
+    fpath_cache: str = os.path.realpath(args["cachefolder"])
+    cache_size_max: int = int(max(args["cachesize"], 0.0) * GB_TO_BYTES)
+    api_url: str = args["apiurl"].rstrip("/")
+    full_install: bool = args["fullinstall"]
+    link_files: bool = args["linkfiles"]
+    http_pool: HTTPConnectionPool = HTTPConnectionPool()
+    peers: CachePeers|None = CachePeers(args["peer"]) if args["peer"] else None
+    if no_cache:
+        # Shared downloads are handed from one modpack to the next through a cache, so use a throwaway one
+        fpath_cache = f"{fpath_install_temp}{BATCH_CACHE_SUFFIX}"
+        logInfo(f"Using temporary mod cache '{fpath_cache}' for the batch due to flag...")
+
+    # Read the manifest of every modpack straight out of its zip file
+    run_report.phase("read manifests")
+    logInfo(f"Reading {len(fpath_modpacks)} modpack zips...")
+    packs: list[dict] = []
+    for fpath_modpack in fpath_modpacks:
+        try:
+            with zipfile.ZipFile(fpath_modpack, 'r') as f:
+                manifest: dict = parseManifest(f.read(MANIFEST_FILE))
+            modpack_name: str = manifest["name"].strip()
+            packs.append({
+                "fpath": fpath_modpack,
+                "name": modpack_name,
+                "version": manifest.get("version", "Not Supplied"),
+                "minecraftVersion": manifest["minecraft"]["version"],
+                "forgeVersion": re.findall(r'[0-9.]*$', manifest["minecraft"]["modLoaders"][0]["id"])[0],
+                "fpathInstall": os.path.join(fpath_minecraft, modpack_name),
+                "modList": readManifestModList(manifest)
+                })
+        except Exception as e:
+            # Something happened. This is unrecoverable.
+            print(f"Error while reading manifest of modpack '{fpath_modpack}'", file=sys.stderr)
+            raise e
+    logInfo("> Done!")
+
+    # Modpacks installed into the same folder would each be laid out over the other, against a stale install lock
+    packs_by_folder: dict[str, list[dict]] = {}
+    for pack in packs:
+        packs_by_folder.setdefault(os.path.normcase(pack["fpathInstall"]), []).append(pack)
+    duplicates: list[list[dict]] = [x for x in packs_by_folder.values() if len(x) > 1]
+    if duplicates:
+        for duplicate in duplicates:
+            logError(f"Modpacks {', '.join(repr(x['fpath']) for x in duplicate)} would all install into '{duplicate[0]['fpathInstall']}'")
+        logError("Each modpack in a batch needs its own name. Install modpacks with the same name one at a time.")
         return 1
 
-    # Copy overrides
-    logInfo("Installing overrides...")
-    if os.path.isdir(fpath_install_temp_overrides):
-        copyReplaceFile(fpath_install_temp_overrides, fpath_install)
+    # Merge every modpack's mods into one list, downloading each mod once however many modpacks share it.
+    # Mods which are already installed and unchanged are left out, as main does for a single modpack.
+    logInfo("Merging mod lists...")
+    mod_list: list[dict] = []
+    mod_keys: set[str] = set()
+    mod_count: int = 0
+    for pack in packs:
+        mod_count += len(pack["modList"])
+        pack["installLock"] = readInstallLock(pack["fpathInstall"]) if not full_install else None
+        pack["modsKeep"] = []
+        pack["modsRemove"] = []
+        if pack["installLock"]:
+            pack["modList"], pack["modsKeep"], pack["modsRemove"] = diffInstallLock(pack["modList"], pack["installLock"], os.path.join(pack["fpathInstall"], MODS_FOLDER))
+        for mod in pack["modList"]:
+            mod_key: str = makeModCacheKey(mod["projectID"], mod["fileID"])
+            if mod_key not in mod_keys:
+                mod_keys.add(mod_key)
+                mod_list.append(dict(mod))
+    forge_versions: list[tuple[str, str]] = list(dict.fromkeys((x["minecraftVersion"], x["forgeVersion"]) for x in packs))
+    logInfo(f"Detected {mod_count} mods in {len(packs)} modpacks, {len(mod_list)} to download once duplicates and installed mods are left out")
+
+    # Prompt the user with details of every installation and if they want to continue
+    run_report.phase("confirm")
+    message: str = "\n\n".join(f"""Modpack Name: {x['name']}
+Modpack Version: {x['version']}
+Forge Version: {x['forgeVersion']}
+Minecraft Version: {x['minecraftVersion']}
+Modpack Install Location: {x['fpathInstall']}""" for x in packs)
+    message += f"""
+
+Minecraft Path: {fpath_minecraft}
+Mods To Download: {len(mod_list)} (of {mod_count} in all modpacks)
+Forge Versions: {len(forge_versions)}
+Profiles are created with the default name and -memorymax, without asking."""
+    prompt = "Details of modpack installations above. Continue? (y/n)"
+    if showPromptYN(message, prompt, auto_accept):
+        logInfo("Continuing with installation...")
     else:
-        # This should only occur due to user intervention (bad user) or from one of the skip flags being used incorrectly.
-        logError("Overrides in temporary install folder missing. Did you remove them?")
-        logInfo("> Exiting install with installation error")
+        # Gracefully exit without error
+        logInfo("Installation cancelled. Exiting...")
+        return 0
+
+    # Downloads land in the temporary folder before going into the cache
+    if not regenerateFolder(fpath_install_temp, [PARTIAL_FOLDER]):
+        logError(f"Failed to prepare temporary folder '{fpath_install_temp}'")
         return 1
 
-    # INSTALLATION IS FINALLY COMPLETE!!!
-    logInfo("Installation complete!")
+    # Install each distinct forge version once, one after another, while the mods download
+    forge_futures: dict[tuple[str, str], concurrent.futures.Future] = {}
+    if not no_forge:
+        logInfo(f"Starting {len(forge_versions)} forge downloads and installs alongside the mod downloads...")
+        forge_pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(1, "forge")
+        fpath_forge_cache: str|None = os.path.join(fpath_cache, FORGE_CACHE_FOLDER) if not no_cache else None
+        for minecraft_version, forge_version in forge_versions:
+            forge_futures[(minecraft_version, forge_version)] = forge_pool.submit(installForge, minecraft_version, forge_version, fpath_install_temp, fpath_minecraft, forge_installer_headless, http_pool, fpath_forge_cache, force=full_install, peers=peers)
+        forge_pool.shutdown(wait=False)
+
+    # Download every mod of every modpack into the cache in one go
+    run_report.phase("download mods")
+    logInfo(f"Loading mod cache '{fpath_cache}'...")
+    mod_cache: ModCache = ModCache(fpath_cache, cache_size_max, FileInstaller(link_files))
+    mod_cache.load()
+    logInfo("Starting download loop...")
+    run_report.mod_list = mod_list
+    download_successful: bool = downloadModList(mod_list, fpath_install_temp, download_thread_count, auto_accept, mod_cache, api_url, http_pool, resolve_thread_count, download_engine, adaptive_threads, peers)
+    logInfo(f"Mod cache: {mod_cache.hits} hits, {mod_cache.misses} misses")
+    # Not evicted until every modpack is installed, or mods for later modpacks could be thrown away
+    mod_cache.save()
+    logInfo(f"Connection pool: {http_pool.hits} reused, {http_pool.misses} new connections")
+    logMemoryUsage()
+    if download_successful:
+        logInfo(f"Successfully downloaded all mods.")
+    else:
+        logInfo("> Exiting install with download error.")
+        if forge_futures:
+            logInfo("Waiting for forge installs to finish before exiting...")
+            concurrent.futures.wait(forge_futures.values())
+        if no_cache:
+            removeFile(fpath_cache)
+        return 1
+    # Clear the progress bar
+    print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+
+    # Wait for forge, which has been installing alongside the mod downloads
+    run_report.phase("wait for forge")
+    forge_failed: set[tuple[str, str]] = set()
+    for forge_key, forge_future in forge_futures.items():
+        if not forge_future.done():
+            logInfo(f"Waiting for forge install of {forge_key[1]} to finish...")
+        try:
+            forge_install_name: str = forge_future.result()
+        except Exception as e:
+            logging.exception(f"Failed to install forge {forge_key}")
+            logError(f"Failed to install forge {forge_key[1]} for minecraft {forge_key[0]}: {e}")
+            forge_failed.add(forge_key)
+            continue
+        logInfo(f"Found forge version '{forge_install_name}' - install successful!")
+    # Nothing else needs the network
+    http_pool.close()
+
+    # Lay out each modpack. Forge is already installed and every mod is in the cache, so nothing is downloaded.
+    logInfo("Installing each modpack from the mod cache...")
+    results: list[int] = []
+    for i, pack in enumerate(packs):
+        phase_prefix: str = f"install modpack {i + 1}: "
+        run_report.phase(f"{phase_prefix}find mods")
+        logInfo(f"Installing modpack {i + 1} of {len(packs)}: '{pack['name']}'")
+        if (pack["minecraftVersion"], pack["forgeVersion"]) in forge_failed:
+            logError(f"Skipping modpack '{pack['name']}' as its forge version failed to install")
+            results.append(1)
+            continue
+        try:
+            mod_files: list[tuple[str, dict]] = []
+            for mod in pack["modList"]:
+                cached: dict|None = mod_cache.lookup(mod["projectID"], mod["fileID"])
+                if not cached:
+                    raise Exception(f"Mod {mod['projectID']}/{mod['fileID']} is missing from the mod cache")
+                mod_files.append((cached.pop("path"), {"projectID": mod["projectID"], "fileID": mod["fileID"], **cached}))
+            results.append(installModpack(pack, mod_files, pack["installLock"], pack["modsKeep"], pack["modsRemove"], fpath_minecraft, None, f"modpack - {pack['name']}", args["memorymax"], args["javaargs"], auto_accept=True, no_profile=args["noprofile"], full_install=full_install, link_files=link_files, sync_hash=args["synchash"], phase_prefix=phase_prefix))
+        except Exception as e:
+            logging.exception(f"Failed to install modpack '{pack['fpath']}'")
+            logError(f"Failed to install modpack '{pack['name']}': {e}")
+            results.append(1)
+
+    # Keep the cache within its size limit now every modpack has what it needs
+    run_report.phase("clean up")
+    logInfo("Doing temporary install data cleanup...")
+    removeFile(fpath_install_temp)
+    if not no_cache:
+        try:
+            mod_cache.evict()
+            mod_cache.save()
+        except Exception as e:
+            logging.exception("Failed to update mod cache")
+            logWarn(f"Failed to update mod cache: {e}")
+    else:
+        removeFile(fpath_cache)
 
-    # Ask for post cleanup
-    message = """Temporary installation files can allow for a quick
-reinstall as long as they are not cleaned up (installing)
-another mod will also clean them up. Can be useful for
-doing a quick reinstall/repair/debugging without 
-redownloading everything.
-Note: Only useful in combination with certain flags when
-running the installer."""
-    query = "Clean up temporary installation data? (y/n)"
-    if showPromptYN(message, query, auto_accept):
-        # Do cleanup
-        logInfo("Doing temporary install data cleanup...")
-        removeFile(fpath_install_temp)
+    for pack, r in zip(packs, results):
+        logInfo(f"> {pack['name']}: {'installed' if r == 0 else 'FAILED'}")
+    failed_count: int = sum(1 for x in results if x != 0)
+    if failed_count:
+        logInfo(f"> Exiting with {failed_count} of {len(packs)} modpacks failing to install")
+        return 1
+    logInfo("> Exiting with success!")
+    return 0
 
-    logInfo("Everything done!")
+
+def exportBundle(args: dict) -> int:
+    """
+    Resolves and downloads everything a modpack needs, then writes it to an offline bundle instead of installing it.
+    The bundle holds the modpack zip, every mod and the forge installer along with an index of their hashes, and can
+    be installed by main on any number of machines without network access.
+    """
+    printTitle()
+
+    # Do some checks/processing on arguments
+    logging.info("Processing export arguments...")
+    if len(args["fpath_modpack"]) != 1:
+        logError("Only one modpack can be exported to a bundle at a time")
+        return 1
+    fpath_modpack: str = os.path.realpath(args["fpath_modpack"][0])
+    if not os.path.isfile(fpath_modpack) or isBundle(fpath_modpack):
+        print(f"Modpack file '{fpath_modpack}' does not exist or is already a bundle! Please check where it is located and try again.\n\tExiting...", file=sys.stderr)
+        logging.info(f"Failed to find input modpack file at path '{fpath_modpack}'")
+        return 1
+    fpath_bundle: str = os.path.realpath(args["exportbundle"])
+    fpath_install_temp: str = os.path.realpath(args["tempfolder"])
+    no_forge: bool = args["noforge"]
+    auto_accept: bool = args["autoaccept"]
+    download_thread_count: int = max(args["downloadthreads"], 1)
+    resolve_thread_count: int = max(args["resolvethreads"], 1)
+    download_engine: str = args["downloadengine"]
+    adaptive_threads: bool = args["adaptivethreads"]
+    api_rate_limiter.configure(max(args["apirate"], 0.0))
+    no_cache: bool = args["nocache"]
+    fpath_cache: str = os.path.realpath(args["cachefolder"])
+    cache_size_max: int = int(max(args["cachesize"], 0.0) * GB_TO_BYTES)
+    api_url: str = args["apiurl"].rstrip("/")
+    link_files: bool = args["linkfiles"]
+    http_pool: HTTPConnectionPool = HTTPConnectionPool()
+    peers: CachePeers|None = CachePeers(args["peer"]) if args["peer"] else None
+
+    # Read the manifest straight out of the supplied modpack zip file
+    run_report.phase("read manifest")
+    logInfo("Reading modpack zip...")
+    try:
+        manifest: dict = unzipManifest(fpath_modpack, fpath_install_temp)
+        minecraft_version: str = manifest["minecraft"]["version"]
+        forge_version: str = re.findall(r'[0-9.]*$', manifest["minecraft"]["modLoaders"][0]["id"])[0]
+        modpack_name: str = manifest["name"].strip()
+    except Exception as e:
+        # Something happened. This is unrecoverable.
+        print(f"Error while reading manifest of modpack '{fpath_modpack}'", file=sys.stderr)
+        raise e
+    mod_list: list[dict] = readManifestModList(manifest)
+    logInfo(f"> Done! Detected {len(mod_list)} mods in modpack '{modpack_name}'")
+
+    # Get the forge installer while the mods download. It is only put in the bundle, not run.
+    forge_future: concurrent.futures.Future|None = None
+    if not no_forge:
+        forge_pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(1, "forge")
+        fpath_forge_cache: str|None = os.path.join(fpath_cache, FORGE_CACHE_FOLDER) if not no_cache else None
+        forge_future = forge_pool.submit(getForgeInstaller, minecraft_version, forge_version, fpath_install_temp, http_pool, fpath_forge_cache, peers=peers)
+        forge_pool.shutdown(wait=False)
+    else:
+        logInfo("Leaving forge out of the bundle due to flag...")
+
+    # Download every mod, as the bundle has to work for a fresh install
+    run_report.phase("download mods")
+    mod_cache: ModCache|None = None
+    if not no_cache:
+        logInfo(f"Loading mod cache '{fpath_cache}'...")
+        mod_cache = ModCache(fpath_cache, cache_size_max, FileInstaller(link_files))
+        mod_cache.load()
+    logInfo("Starting download loop...")
+    run_report.mod_list = mod_list
+    download_successful: bool = downloadModList(mod_list, fpath_install_temp, download_thread_count, auto_accept, mod_cache, api_url, http_pool, resolve_thread_count, download_engine, adaptive_threads, peers)
+    if mod_cache:
+        logInfo(f"Mod cache: {mod_cache.hits} hits, {mod_cache.misses} misses")
+        try:
+            mod_cache.evict()
+            mod_cache.save()
+        except Exception as e:
+            logging.exception("Failed to update mod cache")
+            logWarn(f"Failed to update mod cache: {e}")
+    if not download_successful:
+        logInfo("> Exiting export with download error.")
+        if forge_future:
+            concurrent.futures.wait([forge_future])
+        return 1
+    # Clear the progress bar
+    print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+
+    run_report.phase("wait for forge")
+    fpath_forge: str|None = None
+    if forge_future:
+        try:
+            fpath_forge = os.path.join(fpath_install_temp, forge_future.result())
+        except Exception as e:
+            logging.exception("Failed to download forge installer")
+            logError(f"Failed to download forge installer: {e}")
+            logInfo("> Exiting export with forge error")
+            return 1
+    http_pool.close()
+
+    # Write everything out to the bundle
+    run_report.phase("write bundle")
+    logInfo(f"Writing bundle '{fpath_bundle}'...")
+    try:
+        bundle_size: int = writeBundle(fpath_bundle, fpath_modpack, minecraft_version, forge_version, mod_list, os.path.join(fpath_install_temp, MODS_FOLDER), fpath_forge)
+    except Exception as e:
+        logging.exception("Failed to write bundle")
+        logError(f"Failed to write bundle '{fpath_bundle}': {e}")
+        return 1
+    logInfo(f"> Wrote bundle of {len(mod_list)} mods{'' if fpath_forge else ' without forge'} ({bundle_size/MB_TO_BYTES:.1f} MB)")
+    print(f"Install it without network access with: InstallModPack.py \"{fpath_bundle}\"")
+
+    run_report.phase("clean up")
+    removeFile(fpath_install_temp)
     logInfo("> Exiting with success!")
     return 0
 
 
+def serveCache(args: dict) -> int:
+    """
+    Serves the mod and forge installer caches read only over HTTP until stopped, for other installers to use with -peer
+    """
+    printTitle()
+
+    fpath_cache: str = os.path.realpath(args["cachefolder"])
+    host, _, port = args["servecache"].rpartition(":")
+    if not port.isdigit():
+        logError(f"Bad address to serve the cache on '{args['servecache']}'. Expected host:port, e.g. '{DEFAULT_PEER_HOST}:{DEFAULT_PEER_PORT}'")
+        return 1
+
+    try:
+        cache_server: CacheServer = CacheServer(fpath_cache, host or DEFAULT_PEER_HOST, int(port))
+    except Exception as e:
+        logging.exception("Failed to start cache server")
+        logError(f"Cannot serve the mod cache: {e}")
+        return 1
+    url: str = cache_server.start()
+    logInfo(f"Serving mod cache '{fpath_cache}' at {url}")
+    if ipaddress.ip_address(cache_server.server.server_address[0]).is_loopback:
+        print(f"Only this machine can use it, with: -peer {url}\nTo share it with other machines, serve it on their network, e.g. -servecache 0.0.0.0:{DEFAULT_PEER_PORT}")
+    else:
+        print(f"Other installers can use it with: -peer http://<this machine's address>:{cache_server.server.server_address[1]}")
+    print("Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    cache_server.stop()
+    logInfo(f"Stopped serving. Served {cache_server.requests} files ({cache_server.bytes/MB_TO_BYTES:.1f} MB)")
+    return 0
+
+
 # ===========================
 # HELPER FUNCTIONS BELOW HERE
 # ===========================
 
 # === Threading ===
 class DownloadThreadData():
-    def __init__(self, mod_list: list[dict], fpath_mods_temp: str):
+    def __init__(self, mod_list: list[dict], fpath_mods_temp: str, fpath_partial: str, verify_pool: concurrent.futures.ThreadPoolExecutor, mod_cache: "ModCache|None"=None, api_url: str=CURSEFORGE_API_URL_DEFAULT, http_pool: "HTTPConnectionPool|None"=None, mod_nums: list[int]|None=None, mod_nums_unresolved: list[int]|None=None, controller: "ConcurrencyController|None"=None, peers: "CachePeers|None"=None):
         self.mod_list: list[dict] = mod_list
-        self.error_list: list[str] = []
+        self.error_list: list[dict] = [] # {"mod_num", "mod", "error"} for each mod which ran out of tries
         self.mod_list_lock: threading.Lock = threading.Lock()
+        self.mod_queue_changed: threading.Condition = threading.Condition(self.mod_list_lock)
         self.error_list_lock: threading.Lock = threading.Lock()
-        self.mod_list_position = 0
+        # Only the mods numbered in mod_nums are downloaded if given.
+        # The mods in mod_nums_unresolved need their download location looking up before they can be downloaded.
+        if mod_nums is None:
+            mod_nums = list(range(0, len(mod_list)))
+        mod_nums_unresolved = mod_nums_unresolved or []
+        unresolved: set[int] = set(mod_nums_unresolved)
+        # Mods waiting to be looked up by the resolve threads, in batches
+        self.resolve_queue: list[list[int]] = [mod_nums_unresolved[i:i+RESOLVE_PIPELINE_BATCH_SIZE] for i in range(0, len(mod_nums_unresolved), RESOLVE_PIPELINE_BATCH_SIZE)]
+        # Mods waiting to be downloaded as (not before time, mod number, attempt), ordered by when they can next be tried.
+        # The resolve threads wait while this holds TRANSFER_QUEUE_MAX mods so they do not run too far ahead.
+        self.mod_queue: list[tuple[float, int, int]] = [(0.0, x, 1) for x in mod_nums if x not in unresolved]
+        heapq.heapify(self.mod_queue)
         self.mods_done = 0
-        self.mods_total: int = len(self.mod_list)
+        self.mods_total: int = len(mod_nums)
+        # Mod number => when the first attempt at the mod started
+        self.mod_started: dict[int, float] = {}
         self.fpath_mods_temp = fpath_mods_temp
+        self.fpath_partial: str = fpath_partial
+        self.verify_pool: concurrent.futures.ThreadPoolExecutor = verify_pool
+        self.mod_cache: ModCache|None = mod_cache
+        self.api_url: str = api_url
+        self.http_pool: HTTPConnectionPool|None = http_pool
+        self.controller: ConcurrencyController|None = controller # Limits how many workers download at once, if given
+        self.peers: CachePeers|None = peers # Asked for mods before CurseForge, if given
+        # Queue metrics
+        self.queue_depth_max: int = len(self.mod_queue)
+        self.queue_depth_total: int = 0
+        self.queue_depth_samples: int = 0
+        self.resolve_wait_seconds: float = 0.0 # Time resolve threads spent waiting for room in the download queue
+        self.transfer_wait_seconds: float = 0.0 # Time download threads spent waiting for a mod to download
+
+
+    def takeResolveBatch(self) -> list[int]|None:
+        """
+        Returns the next batch of mod numbers to resolve, or None once there are none left
+        """
+        with self.mod_queue_changed:
+            return self.resolve_queue.pop(0) if self.resolve_queue else None
+
+
+    def queueMod(self, mod_num: int) -> None:
+        """
+        Hands a resolved mod over to the download threads, waiting until there is room in the download queue
+        """
+        with self.mod_queue_changed:
+            time_start: float = time.perf_counter()
+            while len(self.mod_queue) >= TRANSFER_QUEUE_MAX:
+                self.mod_queue_changed.wait()
+            self.resolve_wait_seconds += time.perf_counter() - time_start
+            heapq.heappush(self.mod_queue, (0.0, mod_num, 1))
+            self.queue_depth_max = max(self.queue_depth_max, len(self.mod_queue))
+            self.mod_queue_changed.notify_all()
+
+
+    def takeMod(self) -> tuple[int, int]|None:
+        """
+        Waits for the next mod which is ready to be tried.
+        Returns its mod number and attempt, or None once every mod is done.
+        """
+        with self.mod_queue_changed:
+            time_start: float = time.perf_counter()
+            while True:
+                if self.mods_done >= self.mods_total:
+                    return None
+                now: float = time.time()
+                if self.mod_queue and self.mod_queue[0][0] <= now:
+                    _, mod_num, attempt = heapq.heappop(self.mod_queue)
+                    self.mod_started.setdefault(mod_num, time.perf_counter())
+                    self.transfer_wait_seconds += time.perf_counter() - time_start
+                    # There is room in the queue for the resolve threads again
+                    self.mod_queue_changed.notify_all()
+                    return mod_num, attempt
+                # Nothing ready. Either wait for a retry to come due, a mod to be resolved or for another thread to finish.
+                wait: float|None = self.mod_queue[0][0] - now if self.mod_queue else None
+                self.mod_queue_changed.wait(wait)
+
+
+    def sampleQueueDepth(self) -> None:
+        with self.mod_queue_changed:
+            self.queue_depth_total += len(self.mod_queue)
+            self.queue_depth_samples += 1
+
+
+    def retryMod(self, mod_num: int, attempt: int, delay: float) -> None:
+        """
+        Puts a failed mod back into the queue to be tried again after the delay.
+        Retries never wait for room in the queue.
+        """
+        with self.mod_queue_changed:
+            heapq.heappush(self.mod_queue, (time.time() + delay, mod_num, attempt + 1))
+            self.queue_depth_max = max(self.queue_depth_max, len(self.mod_queue))
+            self.mod_queue_changed.notify_all()
+
+
+    def finishMod(self, mod_num: int) -> None:
+        """
+        Marks a mod as done, regardless of whether it was successful
+        """
+        with self.mod_queue_changed:
+            # Remember how long the mod took from its first attempt to being done, including retries
+            self.mod_list[mod_num]["downloadSeconds"] = time.perf_counter() - self.mod_started.get(mod_num, time.perf_counter())
+            self.mods_done += 1
+            if self.mods_done >= self.mods_total:
+                # Wake up any threads waiting on retries so they can stop
+                self.mod_queue_changed.notify_all()
+
+
+class ConcurrencyController():
+    """
+    Tunes how many download workers may download at once while downloads run, using additive increase and
+    multiplicative decrease (AIMD) like TCP congestion control.
+    Every ADAPTIVE_INTERVAL seconds the downloads finished since the last adjustment are looked at:
+    - Any 429s or too many server errors and timeouts mean the server is overloaded, so the limit is cut by ADAPTIVE_DECREASE_FACTOR.
+    - Latency growing well past the best seen without throughput growing means downloads are only queueing up, so the limit drops by one.
+    - Otherwise, if every allowed worker was busy, the limit grows by ADAPTIVE_INCREASE_STEP. Until the first cut it
+      doubles instead (slow start), so it does not take minutes to find a good limit.
+    Workers call acquire before each download and release after it. More workers than the limit can be running,
+    the extra ones wait in acquire.
+    """
+    def __init__(self, initial: int, minimum: int=ADAPTIVE_CONCURRENCY_MIN, maximum: int=ADAPTIVE_CONCURRENCY_MAX):
+        self.minimum: int = minimum
+        self.maximum: int = max(maximum, initial)
+        self.limit: int = min(max(initial, minimum), self.maximum)
+        self.lock: threading.Lock = threading.Lock()
+        self.changed: threading.Condition = threading.Condition(self.lock)
+        self.active: int = 0 # Workers currently downloading
+        self.stopped: bool = False
+        self.slow_start: bool = True # Grow quickly until the first sign of trouble
+        self.time_cut: float = 0.0 # When the limit was last cut. Failures of downloads started before then were already dealt with.
+        self.time_start: float = time.perf_counter()
+        self.history: list[tuple[float, int, str]] = [(0.0, self.limit, "start")] # (seconds since start, limit, reason) for every change
+        self.latency_best: float|None = None # Lowest mean latency of any interval
+        self.throughput_last: float|None = None
+        self.resetWindow()
+
+
+    def resetWindow(self) -> None:
+        self.window_start: float = time.perf_counter()
+        self.window_requests: int = 0
+        self.window_errors: int = 0 # Server errors and timeouts
+        self.window_throttled: int = 0 # 429s
+        self.window_latency: float = 0.0
+        self.window_bytes: int = 0
+        self.window_active_max: int = self.active
+
+
+    def acquire(self) -> bool:
+        """
+        Waits until the worker is allowed to start a download.
+        Returns False if the controller was stopped instead.
+        """
+        with self.changed:
+            while self.active >= self.limit and not self.stopped:
+                self.changed.wait()
+            return self.tryAcquireLocked()
+
+
+    def tryAcquire(self) -> bool:
+        """
+        Starts a download if the limit allows it, without waiting. Used by asyncio tasks, which wait in their own way.
+        """
+        with self.lock:
+            return self.tryAcquireLocked()
+
+
+    def tryAcquireLocked(self) -> bool:
+        if self.stopped or self.active >= self.limit:
+            return False
+        self.active += 1
+        self.window_active_max = max(self.window_active_max, self.active)
+        return True
 
 
-def downloadModList(mod_list: list[dict], fpath_install_temp: str, download_thread_count: int, auto_accept: bool=False) -> bool:
+    def release(self) -> None:
+        with self.changed:
+            self.active -= 1
+            self.changed.notify()
+
+
+    def stop(self) -> None:
+        """
+        Wakes up every waiting worker so it can stop
+        """
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+
+
+    def record(self, seconds: float, size: int, error: Exception|None=None) -> None:
+        """
+        Records the outcome of a single download
+        """
+        with self.lock:
+            self.window_requests += 1
+            self.window_latency += seconds
+            self.window_bytes += size
+            if time.perf_counter() - seconds < self.time_cut:
+                return
+            if isinstance(error, DownloadError) and error.code == 429:
+                self.window_throttled += 1
+            elif error is not None and (not isinstance(error, DownloadError) or error.code is None or error.code >= 500):
+                self.window_errors += 1
+
+
+    def update(self) -> None:
+        """
+        Adjusts the limit once enough of the current interval has been measured. Called regularly by whatever shows progress.
+        """
+        with self.changed:
+            elapsed: float = time.perf_counter() - self.window_start
+            if elapsed < ADAPTIVE_INTERVAL or (self.window_requests < ADAPTIVE_SAMPLES_MIN and not self.window_throttled):
+                return
+            latency: float = self.window_latency/self.window_requests if self.window_requests else 0.0
+            throughput: float = self.window_bytes/elapsed
+            error_rate: float = self.window_errors/self.window_requests if self.window_requests else 0.0
+            improving: bool = self.throughput_last is None or throughput > self.throughput_last*(1 + ADAPTIVE_THROUGHPUT_GAIN_MIN)
+
+            limit: int = self.limit
+            reason: str = ""
+            if self.window_throttled or error_rate > ADAPTIVE_ERROR_RATE_MAX:
+                limit = int(self.limit*ADAPTIVE_DECREASE_FACTOR)
+                reason = f"{self.window_throttled} throttled, {error_rate:.0%} errors"
+                self.slow_start = False
+                self.time_cut = time.perf_counter()
+            elif self.latency_best is not None and latency > self.latency_best*ADAPTIVE_LATENCY_TOLERANCE and not improving:
+                limit = self.limit - 1
+                reason = f"latency {latency*1000:.0f}ms up from {self.latency_best*1000:.0f}ms without more throughput"
+                self.slow_start = False
+            elif self.window_active_max >= self.limit:
+                limit = self.limit*2 if self.slow_start else self.limit + ADAPTIVE_INCREASE_STEP
+                reason = f"all busy at {throughput/MB_TO_BYTES:.2f} MB/s, latency {latency*1000:.0f}ms"
+            limit = min(max(limit, self.minimum), self.maximum)
+
+            if self.window_requests and not self.window_throttled and not self.window_errors:
+                self.latency_best = latency if self.latency_best is None else min(self.latency_best, latency)
+            self.throughput_last = throughput
+            self.resetWindow()
+            if limit != self.limit:
+                logging.info(f"Download concurrency {self.limit} -> {limit}: {reason}")
+                self.history.append((time.perf_counter() - self.time_start, limit, reason))
+                self.limit = limit
+                self.changed.notify_all()
+
+
+    def report(self) -> None:
+        """
+        Logs how the limit changed over time
+        """
+        limits: list[int] = [x[1] for x in self.history]
+        logInfo(f"Download concurrency: started at {limits[0]}, ended at {limits[-1]} (between {min(limits)} and {max(limits)}, {len(limits)-1} changes)")
+        logging.info("Download concurrency over time: " + ", ".join(f"{x[0]:.1f}s={x[1]}" for x in self.history))
+
+
+def downloadModList(mod_list: list[dict], fpath_install_temp: str, download_thread_count: int, auto_accept: bool=False, mod_cache: "ModCache|None"=None, api_url: str=CURSEFORGE_API_URL_DEFAULT, http_pool: "HTTPConnectionPool|None"=None, resolve_thread_count: int=DEFAULT_RESOLVE_THREADS, download_engine: str=DEFAULT_DOWNLOAD_ENGINE, adaptive: bool=False, peers: "CachePeers|None"=None) -> bool:
     """
     Runs the download loop with retries
+    Downloading is split into two stages with their own threads. The resolve threads look up where mods live with the
+    API in batches and feed a bounded queue, which the download threads take mods from to transfer the files.
+    The asyncio download engine does the same with tasks on an event loop instead of threads.
+    Failed mods are retried with backoff by the download threads. If some mods still fail,
+    only those mods are downloaded again when retrying the download step.
+    Mods found in the mod cache (if given) are taken from there instead of being downloaded.
+    Otherwise the cache peers (if given) are asked for each mod before CurseForge. Mods from peers are checked like
+    any other download, and go to CurseForge instead if the check fails.
+    All threads share the same pool of HTTP connections.
+    If adaptive, download_thread_count is only where the number of downloads at once starts, and a ConcurrencyController
+    tunes it from there as the downloads go.
     Returns if download was successful
     """
-    download_successful = False
-    for i in range(0, DOWNLOAD_STEP_TRIES_MAX): # Allow retries up to a max
-        # Prepare where all the mods are going to be downloaded to
-        logInfo("Preparing temporary download folder...")
-        fpath_mods_temp = os.path.join(fpath_install_temp, MODS_FOLDER)
-        if not regenerateFolder(fpath_mods_temp):
-            logError(f"Failed to prepare download folder '{fpath_mods_temp}'")
-            raise Exception("Failed to prepare download folder")
-
-        # Prepare download threads
-        logInfo("Downloading mods...")
-        thread_data = DownloadThreadData(mod_list, fpath_mods_temp)
-        download_threads: list[threading.Thread] = []
-
-        # Spawn download threads
-        for i in range(0, download_thread_count):
-            thread = threading.Thread(target=downloadModsThread, args=(thread_data,))
-            download_threads.append(thread)
-            thread.daemon = True
-            thread.start()
-
-        # Wait for download threads to do their job and update progesss bar
-        while True:
-            if thread_data.mods_done >= thread_data.mods_total:
-                # Everything appears to be downloaded.
-                # Clear the progress bar
-                print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
-                logInfo("All downloads complete. Waiting for threads to stop...")
-                # The threads should kill themselves. Wait for them to end.
-                for thread in download_threads:
-                    thread.join()
-                print("> Done!")
-                break
+    http_pool = http_pool or default_http_pool
+
+    # Prepare where all the mods are going to be downloaded to
+    logInfo("Preparing temporary download folder...")
+    fpath_mods_temp = os.path.join(fpath_install_temp, MODS_FOLDER)
+    if not regenerateFolder(fpath_mods_temp):
+        logError(f"Failed to prepare download folder '{fpath_mods_temp}'")
+        raise Exception("Failed to prepare download folder")
+    # Partial downloads from earlier attempts and runs are kept so they can be resumed
+    fpath_partial: str = os.path.join(fpath_install_temp, PARTIAL_FOLDER)
+    if not generateFolder(fpath_partial):
+        logError(f"Failed to prepare partial download folder '{fpath_partial}'")
+        raise Exception("Failed to prepare partial download folder")
+
+    # Downloads are checked by a separate pool of threads so hashing does not hold up the transfers
+    verify_pool = concurrent.futures.ThreadPoolExecutor(HASH_VERIFY_THREADS, "verify")
+    # With adaptive concurrency, enough workers are started for the controller to go up to its maximum
+    worker_count: int = max(ADAPTIVE_CONCURRENCY_MAX, download_thread_count) if adaptive else download_thread_count
+    concurrency: int = download_thread_count
+    try:
+        download_successful = False
+        mod_nums: list[int] = list(range(0, len(mod_list)))
+        for i in range(0, DOWNLOAD_STEP_TRIES_MAX): # Allow retries up to a max
+            # Mods not in the cache need their download location looking up first, unless an earlier round already did
+            mod_nums_unresolved: list[int] = [x for x in mod_nums if not mod_list[x].get("downloadUrl") and (not mod_cache or not mod_cache.contains(mod_list[x]["projectID"], mod_list[x]["fileID"]))]
+
+            # Prepare download threads. The controller carries on from where it got to in earlier rounds.
+            logInfo(f"Downloading {len(mod_nums)} mods ({len(mod_nums_unresolved)} to resolve)...")
+            controller: ConcurrencyController|None = ConcurrencyController(concurrency, maximum=worker_count) if adaptive else None
+            if download_engine == DOWNLOAD_ENGINE_ASYNCIO:
+                thread_data = AsyncDownloadData(mod_list, fpath_mods_temp, fpath_partial, verify_pool, mod_cache, api_url, http_pool, mod_nums, mod_nums_unresolved, controller, peers)
+                asyncio.run(downloadModsAsync(thread_data, worker_count, resolve_thread_count))
             else:
-                # Update the progress bar
-                time.sleep(0.1)
-                writeProgressBar(thread_data.mods_done, thread_data.mods_total)
-
-        # Check for any download errors and offer retry
-        download_error_count = len(thread_data.error_list)
-        if download_error_count > 0:
-            logError(f"Failed to download {download_error_count} mods after {DOWNLOAD_TRIES_MAX+1} tries!")
-            for error_str in thread_data.error_list:
-                print(f"\t{error_str}", file=sys.stderr)
-            if showPromptYN("", "Retry download?", auto_accept):
-                logInfo("> Retrying...")
-                continue
+                thread_data = DownloadThreadData(mod_list, fpath_mods_temp, fpath_partial, verify_pool, mod_cache, api_url, http_pool, mod_nums, mod_nums_unresolved, controller, peers)
+                runDownloadThreads(thread_data, worker_count, resolve_thread_count)
+            logQueueMetrics(thread_data)
+            if controller:
+                controller.report()
+                concurrency = controller.limit
+
+            # Check for any download errors and offer retry
+            download_error_count = len(thread_data.error_list)
+            if download_error_count > 0:
+                logError(f"Failed to download {download_error_count} mods after {MOD_DOWNLOAD_TRIES_MAX} tries!")
+                for error in thread_data.error_list:
+                    print(f"\t[ERROR MOD {error['mod_num']}]\t{error['error']}", file=sys.stderr)
+                if showPromptYN("", "Retry download?", auto_accept):
+                    # Keep everything which was downloaded and only go again for what failed
+                    logInfo("> Retrying failed mods...")
+                    mod_nums = sorted(x["mod_num"] for x in thread_data.error_list)
+                    continue
+                else:
+                    # The user has opted to cancel downloading
+                    return False
             else:
-                # The user has opted to cancel downloading
-                return False
+                # Download successful! Break retry loop
+                download_successful = True
+                break
+
+        #check for max retries
+        if not download_successful:
+            logInfo("Max download retries reached, stopping download")
+            return False
+
+        # Everything is good
+        return True
+    finally:
+        verify_pool.shutdown()
+        api_rate_limiter.report()
+        if peers:
+            peers.report()
+
+
+def runDownloadThreads(thread_data: DownloadThreadData, download_thread_count: int, resolve_thread_count: int) -> None:
+    """
+    Runs one round of downloads with a thread per resolve and download worker, showing progress until every mod is done
+    """
+    download_threads: list[threading.Thread] = []
+
+    # Spawn resolve threads, but no more than there are batches to resolve
+    for i in range(0, min(resolve_thread_count, len(thread_data.resolve_queue))):
+        thread = threading.Thread(target=resolveModsThread, args=(thread_data,))
+        download_threads.append(thread)
+        thread.daemon = True
+        thread.start()
+
+    # Spawn download threads
+    for i in range(0, download_thread_count):
+        thread = threading.Thread(target=downloadModsThread, args=(thread_data,))
+        download_threads.append(thread)
+        thread.daemon = True
+        thread.start()
+
+    # Wait for download threads to do their job and update progesss bar
+    while True:
+        if thread_data.mods_done >= thread_data.mods_total:
+            # Everything appears to be downloaded.
+            # Clear the progress bar
+            print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+            logInfo("All downloads complete. Waiting for threads to stop...")
+            # The threads should kill themselves. Wait for them to end.
+            if thread_data.controller:
+                thread_data.controller.stop()
+            for thread in download_threads:
+                thread.join()
+            print("> Done!")
+            break
         else:
-            # Download successful! Break retry loop
-            download_successful = True
+            # Update the progress bar
+            time.sleep(0.1)
+            thread_data.sampleQueueDepth()
+            if thread_data.controller:
+                thread_data.controller.update()
+            writeProgressBar(thread_data.mods_done, thread_data.mods_total)
+
+
+def resolveModsThread(thread_data: DownloadThreadData) -> None:
+    """
+    A function meant to be called from a thread which runs as a deamon.
+    Looks up where batches of mods live with the API and hands them to the download threads.
+    Mods which still have no download location are handed over anyway and looked up again by the download threads,
+    which retry them with backoff.
+    Terminates it self when there are no more mods to resolve.
+    """
+    while True:
+        batch: list[int]|None = thread_data.takeResolveBatch()
+        if batch is None:
             break
+        time_start: float = time.perf_counter()
+        try:
+            resolveModList([thread_data.mod_list[x] for x in batch], thread_data.api_url, thread_data.http_pool)
+            time_batch: float = time.perf_counter() - time_start
+            for mod_num in batch:
+                mod: dict = thread_data.mod_list[mod_num]
+                addModTiming(mod, "resolveSeconds", time_batch)
+                if mod.get("downloadUrl"):
+                    continue
+                time_mod: float = time.perf_counter()
+                try:
+                    mod["downloadUrl"] = requestModDownloadLink(mod["projectID"], mod["fileID"], thread_data.api_url, thread_data.http_pool)
+                except Exception as e:
+                    logging.warning(f"Failed to resolve mod {mod}, leaving it to the download threads: {e}")
+                addModTiming(mod, "resolveSeconds", time.perf_counter() - time_mod)
+        except Exception as e:
+            logging.exception(f"Failed to resolve batch of mods {batch}")
+        finally:
+            run_report.span("resolve", "resolve", time_start, {"mods": len(batch)})
+            # Every mod has to reach the download threads, or they would wait for it forever
+            for mod_num in batch:
+                thread_data.queueMod(mod_num)
 
-    #check for max retries
-    if not download_successful:
-        logInfo("Max download retries reached, stopping download")
-        return False
 
-    # Everything is good
-    return True
+def logQueueMetrics(thread_data: DownloadThreadData) -> None:
+    """
+    Reports how full the download queue ran and how long each stage waited on the other.
+    Resolve threads waiting means downloading is the bottleneck. Download threads waiting means resolving is, or retries are backing off.
+    """
+    depth_mean: float = thread_data.queue_depth_total/thread_data.queue_depth_samples if thread_data.queue_depth_samples else 0.0
+    logInfo(f"Download queue depth: mean {depth_mean:.1f}, max {thread_data.queue_depth_max} (limit {TRANSFER_QUEUE_MAX})")
+    logInfo(f"> Resolve threads waited {thread_data.resolve_wait_seconds:.1f}s for room, download threads waited {thread_data.transfer_wait_seconds:.1f}s for mods")
 
 
 def downloadModsThread(thread_data: DownloadThreadData) -> None:
     """
     A function meant to be called from a thread which runs as a deamon.
-    Consumes mods from the mod list and downloads them.
+    Consumes mods from the mod queue and downloads them.
+    Failed mods are put back into the queue with a backoff until they run out of tries.
     Terminates it self when there are no more mods to download.
     """
     while True:
-        # Get the next mod in the list and download it
-        with thread_data.mod_list_lock:
-            # Ensure there are still mods left to consume
-            if thread_data.mod_list_position >= thread_data.mods_total:
+        # Wait until the concurrency controller allows another download, if there is one
+        if thread_data.controller and not thread_data.controller.acquire():
+            break
+        try:
+            if not downloadNextMod(thread_data):
                 break
-            # Get the next mod to consume
-            mod_num: int = thread_data.mod_list_position
-            mod: dict = thread_data.mod_list[mod_num]
-            thread_data.mod_list_position += 1
+        finally:
+            if thread_data.controller:
+                thread_data.controller.release()
+
+
+def downloadNextMod(thread_data: DownloadThreadData) -> bool:
+    """
+    Takes the next mod from the mod queue and downloads it, or finds it in the cache.
+    Returns False once there are no more mods to download.
+    """
+    # Get the next mod in the queue and download it
+    next_mod: tuple[int, int]|None = thread_data.takeMod()
+    if next_mod is None:
+        return False
+    mod_num, attempt = next_mod
+    mod: dict = thread_data.mod_list[mod_num]
 
-        logging.info(f"Consuming mod {mod}...")
+    logging.info(f"Consuming mod {mod} (Attempt {attempt})...")
 
-        # Download the mod. Retry handling is already done for us
+    # Check the cache before going anywhere near the network
+    if thread_data.mod_cache:
         try:
-            mod_name = downloadMod(mod["projectID"], mod["fileID"], thread_data.fpath_mods_temp)
-            print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
-            logInfo(f"[MOD {mod_num:04}] Download successful: {mod_name}")
+            mod_file: dict|None = thread_data.mod_cache.fetch(mod["projectID"], mod["fileID"], thread_data.fpath_mods_temp)
         except Exception as e:
-            with thread_data.error_list_lock:
-                thread_data.error_list.append(f"[ERROR MOD {mod_num}]\t{e}")
+            logging.exception(f"Failed to fetch mod {mod} from cache")
+            mod_file = None
+        if mod_file:
+            mod["file"] = mod_file
+            addModTiming(mod, "cached", 1)
             print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
-            logError(f"[MOD {mod_num:04}] {e}")
+            logInfo(f"[MOD {mod_num:04}] Found in cache: {mod_file['fileName']}")
+            thread_data.finishMod(mod_num)
+            return True
+
+    # Download the mod. Retries are handled by the mod queue and go straight to CurseForge.
+    time_start: float = time.perf_counter()
+    try:
+        mod_name: str|None = None
+        if thread_data.peers and attempt == 1:
+            mod_name = thread_data.peers.fetchMod(mod, thread_data.fpath_mods_temp, thread_data.fpath_partial, thread_data.http_pool)
+            if mod_name:
+                addModTiming(mod, "peer", 1)
+        if not mod_name:
+            mod_name = downloadMod(mod, thread_data.fpath_mods_temp, thread_data.fpath_partial, thread_data.api_url, thread_data.http_pool)
+    except Exception as e:
+        recordModTransfer(thread_data, mod_num, attempt, time_start, None, e)
+        failMod(thread_data, mod_num, attempt, e)
+        return True
+    recordModTransfer(thread_data, mod_num, attempt, time_start, mod_name)
 
-        # Regardless of if we were actually successful, consider it done
-        with thread_data.mod_list_lock:
-            thread_data.mods_done += 1
+    # Check the download in the background so this thread can get on with the next one
+    thread_data.verify_pool.submit(verifyModThread, thread_data, mod_num, attempt, mod_name)
+    return True
 
 
-# === Networking Ops ===
-def downloadURL(url: str, headers: dict=DEFAULT_DOWNLOAD_HEADERS):
+def recordModTransfer(thread_data: DownloadThreadData, mod_num: int, attempt: int, time_start: float, mod_name: str|None, error: Exception|None=None) -> None:
     """
-    Attempts to download the given URL. The URL should already be quoted if needed.
-    Retries download on error.
-    Returns the open URL handle
-    Raises exceptions on error.
+    Records a single attempt at transferring a mod for the run report and the concurrency controller
     """
-    last_error: Exception = Exception("Did not attempt download")
-    for attempt in range(1, DOWNLOAD_TRIES_MAX+1):
-        try:
-            logging.info(f"Downloading '{url}' (Attempt {attempt})")
-            request = urllib.request.Request(url, headers=headers)
-            response: urllib.request._UrlopenRet = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
-            return response
-        except urllib.error.HTTPError as e:
-            last_error = Exception(f"HTTP ERROR {e.code}: {url}")
-        except urllib.error.URLError as e:
-            last_error = Exception(f"URL ERROR {e.reason}: {url}")
-        except:
-            last_error = Exception(f"UNKNOWN ERROR (probably timeout): {url}")
+    seconds: float = time.perf_counter() - time_start
+    mod: dict = thread_data.mod_list[mod_num]
+    size: int = os.path.getsize(os.path.join(thread_data.fpath_mods_temp, mod_name)) if mod_name else 0
+    addModTiming(mod, "transferSeconds", seconds)
+    mod.setdefault("timing", {})["attempts"] = attempt
+    run_report.span(f"mod {mod_num}", "transfer", time_start, {"attempt": attempt, "bytes": size, "error": str(error) if error else None})
+    if thread_data.controller:
+        thread_data.controller.record(seconds, size, error)
 
-        # Wait a random amount of time before retrying
-        time.sleep(DOWNLOAD_RETRY_WAIT_MIN + random.random()*DOWNLOAD_RETRY_WAIT_SPREAD)
 
-    logging.error(f"Download exceeded maximum retries: {last_error}")
-    raise last_error
+def verifyModThread(thread_data: DownloadThreadData, mod_num: int, attempt: int, mod_name: str) -> None:
+    """
+    A function meant to be run in the verify pool once a mod has been downloaded.
+    Checks the downloaded file against the size and hashes the API gave for it.
+    Mods which fail the check are deleted and go back into the mod queue.
+    """
+    mod: dict = thread_data.mod_list[mod_num]
+    fpath_mod: str = os.path.join(thread_data.fpath_mods_temp, mod_name)
+    time_start: float = time.perf_counter()
+    try:
+        mod_file: dict = verifyModFile(mod, fpath_mod)
+    except Exception as e:
+        removeBadDownload(fpath_mod)
+        failMod(thread_data, mod_num, attempt, e)
+        return
+    finally:
+        addModTiming(mod, "verifySeconds", time.perf_counter() - time_start)
+        run_report.span(f"verify {mod_num}", "verify", time_start)
+
+    mod["file"] = mod_file
+    print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+    logInfo(f"[MOD {mod_num:04}] Download successful: {mod_name}")
+    # Remember the mod for next time. Failing to do so is not fatal to the install.
+    if thread_data.mod_cache:
+        try:
+            thread_data.mod_cache.store(mod["projectID"], mod["fileID"], fpath_mod, mod_file["sha1"])
+        except Exception as e:
+            logging.exception(f"Failed to store mod {mod} in cache")
+    thread_data.finishMod(mod_num)
 
 
-def downloadMod(projectID: str, fileID: str, fpath_mods_temp: str) -> str:
+def verifyModFile(mod: dict, fpath_mod: str) -> dict:
     """
-    Downloads and saves a single mod
+    Checks a downloaded mod file against the expected size and hashes from the API, where known.
+    Returns the file name, size and SHA1 hash of the mod file.
+    Raises an exception if the file does not match.
     """
-    mod_location_url: str = makeModLocationDownloadLink(projectID, fileID)
+    size: int = os.path.getsize(fpath_mod)
+    if mod.get("fileLength") is not None and size != mod["fileLength"]:
+        raise Exception(f"Downloaded mod is {size} bytes but should be {mod['fileLength']} bytes")
 
-    try:
-        response: urllib.request._UrlopenRet = downloadURL(mod_location_url, fixHeader(API_DOWNLOAD_HEADERS))
-    except Exception as e:
-        # Failed to download the url
-        raise Exception(f"Failed to retrieve mod download location: {e}")
+    expected: dict = mod.get("hashes") or {}
+    algorithms: list[str] = ["sha1"] + (["md5"] if "md5" in expected and "sha1" not in expected else [])
+    file_hashes: dict[str, str] = hashFileMapped(fpath_mod, algorithms)
+    for algorithm, expected_hash in expected.items():
+        if algorithm in file_hashes and file_hashes[algorithm] != expected_hash.lower():
+            raise Exception(f"Downloaded mod {algorithm} hash '{file_hashes[algorithm]}' does not match expected '{expected_hash}'")
+    return {"fileName": os.path.basename(fpath_mod), "size": size, "sha1": file_hashes["sha1"]}
 
-    # The response should contain the link to download the mod.
-    link: str = json.loads(response.read().decode('utf-8'))["data"]
-    match = re.findall(r"^(https?://)(.*)", link)
-    if not match:
-        raise Exception("Failed to extract mod download URL")
+
+def removeBadDownload(fpath_mod: str) -> None:
+    """
+    Deletes a downloaded mod which failed its checks so it is downloaded again
+    """
+    try:
+        if os.path.isfile(fpath_mod):
+            os.remove(fpath_mod)
+    except OSError:
+        logging.exception(f"Failed to remove bad download '{fpath_mod}'")
+
+
+def failMod(thread_data: DownloadThreadData, mod_num: int, attempt: int, error: Exception) -> None:
+    """
+    Puts a failed mod back into the mod queue with a backoff, or reports it as failed once it is out of tries
+    """
+    print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+    if attempt < MOD_DOWNLOAD_TRIES_MAX:
+        delay: float = getRetryDelay(attempt, error.retry_after if isinstance(error, DownloadError) else None)
+        logWarn(f"[MOD {mod_num:04}] {error} (Attempt {attempt}, retrying in {delay:.1f}s)")
+        thread_data.retryMod(mod_num, attempt, delay)
+        return
+    with thread_data.error_list_lock:
+        thread_data.error_list.append({"mod_num": mod_num, "mod": thread_data.mod_list[mod_num], "error": str(error)})
+    logError(f"[MOD {mod_num:04}] {error}")
+    # Regardless of if we were actually successful, consider it done
+    thread_data.finishMod(mod_num)
+
+
+def getRetryDelay(attempt: int, retry_after: float|None=None) -> float:
+    """
+    Returns how long to wait before the next attempt of a download using exponential backoff with jitter.
+    A Retry-After value sent by the server takes priority when it is longer.
+    """
+    delay: float = min(DOWNLOAD_RETRY_BACKOFF_BASE * 2**(attempt-1), DOWNLOAD_RETRY_BACKOFF_MAX)
+    # Jitter between half and the full delay so threads which failed together do not retry together
+    delay = delay/2 + random.random()*delay/2
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# === Mod Cache ===
+class ModCache():
+    """
+    Persistent content-addressed store of mods shared between installs.
+    Mod files are stored under their SHA1 hash and the index maps each (projectID, fileID) to a stored file.
+    The least recently used files are evicted once the cache grows beyond its size limit.
+    """
+    def __init__(self, fpath_cache: str, size_max: int, installer: "FileInstaller|None"=None):
+        self.fpath_cache: str = fpath_cache
+        self.fpath_index: str = os.path.join(fpath_cache, CACHE_INDEX_FILE)
+        self.fpath_lock: str = os.path.join(fpath_cache, CACHE_LOCK_FILE)
+        self.fpath_files: str = os.path.join(fpath_cache, CACHE_FILES_FOLDER)
+        self.size_max: int = size_max
+        self.installer: FileInstaller = installer or FileInstaller() # Moves files in and out of the cache
+        self.lock: threading.Lock = threading.Lock()
+        # "mods" maps "<projectID>-<fileID>" => {"hash", "fileName"}
+        # "files" maps "<hash>" => {"size", "lastUsed"}
+        self.mods: dict[str, dict] = {}
+        self.files: dict[str, dict] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+
+    def load(self, create_folders: bool=True) -> None:
+        """
+        Loads the cache index from disk, creating the cache folders if needed and create_folders is set.
+        A missing or unreadable index results in an empty cache.
+        """
+        if create_folders:
+            os.makedirs(self.fpath_files, exist_ok=True)
+        if not os.path.isfile(self.fpath_index):
+            logging.info(f"No mod cache index at '{self.fpath_index}'. Starting empty cache.")
+            return
+        try:
+            with open(self.fpath_index, "r") as f:
+                index: dict = json.load(f)
+            if index.get("version") != CACHE_INDEX_VERSION:
+                raise Exception(f"Unsupported cache index version '{index.get('version')}'")
+            self.mods = index["mods"]
+            self.files = index["files"]
+        except Exception as e:
+            logging.exception("Failed to read mod cache index")
+            logWarn(f"Mod cache index is unreadable, starting with an empty cache: {e}")
+            self.mods = {}
+            self.files = {}
+        logging.info(f"Loaded mod cache with {len(self.mods)} mods in {len(self.files)} files")
+
+
+    def save(self) -> None:
+        """
+        Writes the cache index to disk. The index is replaced atomically so a crash cannot corrupt it.
+        Other installers may share the cache, so whatever they wrote since this index was loaded is merged in first.
+        """
+        with CacheLock(self.fpath_lock), self.lock:
+            self.mergeIndex()
+            index: dict = {"version": CACHE_INDEX_VERSION, "mods": self.mods, "files": self.files}
+            fpath_index_temp: str = f"{self.fpath_index}.{os.getpid()}.tmp"
+            with open(fpath_index_temp, "w") as f:
+                json.dump(index, f, indent=4)
+            os.replace(fpath_index_temp, self.fpath_index)
+        logging.info(f"Saved mod cache index '{self.fpath_index}'")
+
+
+    def mergeIndex(self) -> float|None:
+        """
+        Merges the index on disk, as written by other installers sharing the cache, into this one.
+        Files are kept if they are still on disk, with the latest last used time from either index.
+        Must be called holding both the cache lock file and the lock.
+        Returns when the index on disk was last written, or None if there is none.
+        """
+        try:
+            index_mtime: float = os.path.getmtime(self.fpath_index)
+            with open(self.fpath_index, "r") as f:
+                index: dict = json.load(f)
+            if index.get("version") != CACHE_INDEX_VERSION:
+                raise Exception(f"Unsupported cache index version '{index.get('version')}'")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.exception("Failed to read mod cache index to merge")
+            return None
+
+        files: dict[str, dict] = dict(index["files"])
+        for file_hash, file_entry in self.files.items():
+            if file_hash in files:
+                files[file_hash] = {**file_entry, "lastUsed": max(file_entry["lastUsed"], files[file_hash]["lastUsed"])}
+            else:
+                files[file_hash] = file_entry
+        self.files = {k: v for k, v in files.items() if os.path.isfile(self.makeFilePath(k))}
+        self.mods = {k: v for k, v in {**index["mods"], **self.mods}.items() if v["hash"] in self.files}
+        return index_mtime
+
+
+    def contains(self, projectID: str, fileID: str) -> bool:
+        """
+        Returns if the index has a file for the given mod. The file itself is only checked when fetched.
+        """
+        with self.lock:
+            entry: dict|None = self.mods.get(makeModCacheKey(projectID, fileID))
+            return bool(entry) and entry["hash"] in self.files
+
+
+    def lookup(self, projectID: str, fileID: str) -> dict|None:
+        """
+        Returns the file name, size, hash and path of a cached mod without counting it as used,
+        or None if the mod is not in the cache.
+        """
+        with self.lock:
+            entry: dict|None = self.mods.get(makeModCacheKey(projectID, fileID))
+            file_entry: dict|None = self.files.get(entry["hash"]) if entry else None
+            if not entry or not file_entry:
+                return None
+            fpath_cached: str = self.makeFilePath(entry["hash"])
+            if not os.path.isfile(fpath_cached) or os.path.getsize(fpath_cached) != file_entry["size"]:
+                return None
+            return {"fileName": entry["fileName"], "size": file_entry["size"], "sha1": entry["hash"], "path": fpath_cached}
+
+
+    def fetch(self, projectID: str, fileID: str, fpath_dest_folder: str) -> dict|None:
+        """
+        Copies (or links) a cached mod into the destination folder.
+        Returns the file name, size and hash of the mod file, or None if the mod is not in the cache.
+        """
+        with self.lock:
+            entry: dict|None = self.mods.get(makeModCacheKey(projectID, fileID))
+            file_entry: dict|None = self.files.get(entry["hash"]) if entry else None
+            if not entry or not file_entry:
+                self.misses += 1
+                return None
+            fpath_cached: str = self.makeFilePath(entry["hash"])
+            if not os.path.isfile(fpath_cached) or os.path.getsize(fpath_cached) != file_entry["size"]:
+                # The file went missing or was damaged behind our back. Forget about it.
+                logging.warning(f"Cached file '{fpath_cached}' is missing or the wrong size. Dropping it.")
+                self.files.pop(entry["hash"], None)
+                self.misses += 1
+                return None
+            file_entry["lastUsed"] = time.time()
+            self.hits += 1
+            mod_file: dict = {"fileName": entry["fileName"], "size": file_entry["size"], "sha1": entry["hash"]}
+
+        self.installer.install(fpath_cached, os.path.join(fpath_dest_folder, mod_file["fileName"]))
+        return mod_file
+
+
+    def store(self, projectID: str, fileID: str, fpath_mod: str, file_hash: str|None=None) -> dict:
+        """
+        Adds a downloaded mod file to the cache. The SHA1 hash of the file is calculated if not given.
+        Files with identical contents are only stored once.
+        Returns the file name, size and hash of the mod file.
+        """
+        file_hash = file_hash or hashFile(fpath_mod)
+        fpath_cached: str = self.makeFilePath(file_hash)
+        if not os.path.isfile(fpath_cached):
+            os.makedirs(os.path.dirname(fpath_cached), exist_ok=True)
+            # Copy to a temporary name first so other readers never see a half written file
+            fpath_cached_temp: str = f"{fpath_cached}.{threading.get_ident()}.tmp"
+            self.installer.install(fpath_mod, fpath_cached_temp)
+            os.replace(fpath_cached_temp, fpath_cached)
+
+        with self.lock:
+            self.mods[makeModCacheKey(projectID, fileID)] = {"hash": file_hash, "fileName": os.path.basename(fpath_mod)}
+            self.files[file_hash] = {"size": os.path.getsize(fpath_cached), "lastUsed": time.time()}
+            mod_file: dict = {"fileName": os.path.basename(fpath_mod), "size": self.files[file_hash]["size"], "sha1": file_hash}
+        logging.info(f"Stored mod '{fpath_mod}' in cache as '{file_hash}'")
+        return mod_file
+
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used files until the cache fits within its size limit.
+        Also cleans up any files on disk the index does not know about, unless they could still be on their way
+        into the index of another installer sharing the cache.
+        """
+        with CacheLock(self.fpath_lock), self.lock:
+            index_mtime: float|None = self.mergeIndex()
+
+            # Drop files that are not in the index (e.g. left over from a crash). Files being stored are left alone, as
+            # are files newer than the index on disk, which other installers may not have written to the index yet.
+            time_orphan: float = min(index_mtime or 0.0, time.time() - CACHE_ORPHAN_AGE)
+            for folder in os.listdir(self.fpath_files):
+                fpath_folder: str = os.path.join(self.fpath_files, folder)
+                if not os.path.isdir(fpath_folder):
+                    continue
+                for file in os.listdir(fpath_folder):
+                    if file in self.files or file.endswith(".tmp"):
+                        continue
+                    fpath_file: str = os.path.join(fpath_folder, file)
+                    try:
+                        stat: os.stat_result = os.stat(fpath_file)
+                        if max(stat.st_mtime, stat.st_ctime) >= time_orphan:
+                            continue
+                        logging.info(f"Removing unindexed cache file '{file}'")
+                        os.remove(fpath_file)
+                    except OSError:
+                        logging.exception(f"Failed to remove unindexed cache file '{file}'")
+
+            # Evict oldest files first
+            size_total: int = sum(x["size"] for x in self.files.values())
+            for file_hash in sorted(self.files, key=lambda x: self.files[x]["lastUsed"]):
+                if size_total <= self.size_max:
+                    break
+                logging.info(f"Evicting cache file '{file_hash}'")
+                fpath_cached: str = self.makeFilePath(file_hash)
+                try:
+                    if os.path.isfile(fpath_cached):
+                        os.remove(fpath_cached)
+                except OSError:
+                    # Most likely being copied out by another installer on Windows. Try again next time.
+                    logging.exception(f"Failed to evict cache file '{file_hash}'")
+                    continue
+                size_total -= self.files.pop(file_hash)["size"]
+
+            # Forget mods which no longer have a file
+            self.mods = {k: v for k, v in self.mods.items() if v["hash"] in self.files}
+        logging.info(f"Mod cache size after eviction: {size_total} bytes")
+
+
+    def makeFilePath(self, file_hash: str) -> str:
+        # Spread files over sub folders so no single folder gets too large
+        return os.path.join(self.fpath_files, file_hash[:2], file_hash)
+
+
+class CacheLock():
+    """
+    Holds a lock file for as long as it is entered, so installers sharing a cache take turns to change it.
+    Uses flock, or msvcrt locking on Windows. Either is released by the OS if the installer dies.
+    """
+    def __init__(self, fpath_lock: str):
+        self.fpath_lock: str = fpath_lock
+        self.f = None
+
+
+    def __enter__(self) -> "CacheLock":
+        self.f = open(self.fpath_lock, "a+b")
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            self.f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1) # Gives up after 10 seconds
+                    break
+                except OSError:
+                    logging.info(f"Still waiting for cache lock '{self.fpath_lock}'")
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        elif msvcrt:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        self.f.close()
+        self.f = None
+
+
+# === Cache Peers ===
+class CachePeers():
+    """
+    Other installers serving their mod and forge installer caches over HTTP (see CacheServer), which are asked for
+    files before CurseForge. Peers are tried in the order given and any file they do not have comes from CurseForge.
+    Nothing from a peer is trusted until its hash checks out, so a bad peer can only cost time. Peers which cannot be
+    reached are not asked again for the rest of the install.
+    """
+    def __init__(self, urls: list[str]):
+        self.urls: list[str] = [x.rstrip("/") for x in urls]
+        self.lock: threading.Lock = threading.Lock()
+        self.down: set[str] = set() # Peers which could not be reached
+        self.hits: int = 0
+        self.misses: int = 0
+        self.bytes: int = 0
+
+
+    def getPeers(self) -> list[str]:
+        with self.lock:
+            return [x for x in self.urls if x not in self.down]
+
+
+    def markDown(self, url: str, error: Exception) -> None:
+        with self.lock:
+            if url in self.down:
+                return
+            self.down.add(url)
+        logWarn(f"Cache peer '{url}' cannot be reached. Not using it for the rest of the install: {error}")
+
+
+    def record(self, fpath_file: str|None) -> None:
+        with self.lock:
+            if fpath_file:
+                self.hits += 1
+                self.bytes += os.path.getsize(fpath_file)
+            else:
+                self.misses += 1
+
+
+    def fetchMod(self, mod: dict, fpath_mods_temp: str, fpath_partial: str, pool: "HTTPConnectionPool|None"=None) -> str|None:
+        """
+        Asks each peer in turn for a mod. Only a single attempt is made with each peer.
+        The file still needs checking against the size and hashes from the API like any other download, and is saved
+        under the file name from the API. Peers are only asked for mods the API gave a file name and SHA1 hash for, as
+        nothing else would show that a peer sent the right file.
+        Returns the name of the mod file saved in fpath_mods_temp, or None if no peer had it.
+        """
+        pool = pool or default_http_pool
+        fpath_part: str|None = self.startMod(mod, fpath_partial)
+        if not fpath_part:
+            return None
+        for url in self.getPeers():
+            try:
+                response: PooledResponse = pool.request("GET", makePeerModLink(url, mod["projectID"], mod["fileID"]), DEFAULT_DOWNLOAD_HEADERS)
+            except Exception as e:
+                self.requestFailed(url, f"mod {mod['projectID']}-{mod['fileID']}", e)
+                continue
+            try:
+                checkPeerResponse(response, mod)
+                writeResponseToFile(response, fpath_part)
+            except Exception as e:
+                logging.exception(f"Failed to get mod {mod} from cache peer '{url}'")
+                removePartialDownload(fpath_part)
+                continue
+            finally:
+                response.close()
+            return self.saveMod(mod, fpath_part, fpath_mods_temp)
+        self.record(None)
+        return None
+
+
+    async def fetchModAsync(self, mod: dict, fpath_mods_temp: str, fpath_partial: str, pool: "AsyncHTTPConnectionPool") -> str|None:
+        """
+        The asyncio version of fetchMod
+        """
+        fpath_part: str|None = self.startMod(mod, fpath_partial)
+        if not fpath_part:
+            return None
+        for url in self.getPeers():
+            try:
+                response: AsyncPooledResponse = await pool.request("GET", makePeerModLink(url, mod["projectID"], mod["fileID"]), DEFAULT_DOWNLOAD_HEADERS)
+            except Exception as e:
+                self.requestFailed(url, f"mod {mod['projectID']}-{mod['fileID']}", e)
+                continue
+            try:
+                checkPeerResponse(response, mod)
+                await writeResponseToFileAsync(response, fpath_part)
+            except Exception as e:
+                logging.exception(f"Failed to get mod {mod} from cache peer '{url}'")
+                await asyncio.to_thread(removePartialDownload, fpath_part)
+                continue
+            finally:
+                response.close()
+            return await asyncio.to_thread(self.saveMod, mod, fpath_part, fpath_mods_temp)
+        self.record(None)
+        return None
+
+
+    def startMod(self, mod: dict, fpath_partial: str) -> str|None:
+        """
+        Returns the path to download a mod from a peer to, or None (counted as a miss) if peers cannot be asked for it
+        """
+        if not mod.get("fileName") or not mod.get("hashes", {}).get("sha1"):
+            self.record(None)
+            return None
+        return os.path.join(fpath_partial, f"{makeModCacheKey(mod['projectID'], mod['fileID'])}{PEER_PART_SUFFIX}")
+
+
+    def saveMod(self, mod: dict, fpath_part: str, fpath_mods_temp: str) -> str:
+        """
+        Moves a mod from a peer into fpath_mods_temp under the file name from the API. Returns the file name.
+        """
+        mod_name: str = makeModFileName(mod, "")
+        fpath_mod: str = os.path.join(fpath_mods_temp, mod_name)
+        os.replace(fpath_part, fpath_mod)
+        self.record(fpath_mod)
+        return mod_name
+
+
+    def requestFailed(self, url: str, what: str, error: Exception) -> None:
+        """
+        Handles a failed request to a peer. A peer answering with an HTTP error just does not have the file.
+        """
+        if isinstance(error, urllib.error.HTTPError):
+            logging.info(f"Cache peer '{url}' does not have {what} (HTTP {error.code})")
+        else:
+            self.markDown(url, error)
+
+
+    def fetchForge(self, forge_file: str, forge_hash: str, fpath_install_temp: str, pool: "HTTPConnectionPool|None"=None) -> bool:
+        """
+        Asks each peer in turn for a forge installer, which is saved in the install temp folder.
+        The installer is run, so it must match the hash published by the forge maven (forge_hash), whatever the peer says.
+        Returns if a peer had the installer and it matched the hash.
+        """
+        pool = pool or default_http_pool
+        fpath_part: str = os.path.join(fpath_install_temp, f"{forge_file}{PEER_PART_SUFFIX}")
+        for url in self.getPeers():
+            try:
+                response: PooledResponse = pool.request("GET", makePeerForgeLink(url, forge_file), DEFAULT_DOWNLOAD_HEADERS)
+            except Exception as e:
+                self.requestFailed(url, f"forge installer '{forge_file}'", e)
+                continue
+            try:
+                file_hash: str|None = response.getheader(PEER_HEADER_SHA1)
+                if file_hash and file_hash.lower() != forge_hash:
+                    raise Exception(f"Peer has forge installer with hash '{file_hash}' but it should be '{forge_hash}'")
+                writeResponseToFile(response, fpath_part)
+                checkPeerFile(fpath_part, forge_hash)
+            except Exception as e:
+                logging.exception(f"Failed to get forge installer '{forge_file}' from cache peer '{url}'")
+                removePartialDownload(fpath_part)
+                continue
+            finally:
+                response.close()
+            fpath_forge: str = os.path.join(fpath_install_temp, forge_file)
+            os.replace(fpath_part, fpath_forge)
+            self.record(fpath_forge)
+            return True
+        self.record(None)
+        return False
+
+
+    def report(self) -> None:
+        logInfo(f"Cache peers: {self.hits} files ({self.bytes/MB_TO_BYTES:.1f} MB) from peers, {self.misses} not found, {len(self.down)} of {len(self.urls)} peers unreachable")
+
+
+def checkPeerResponse(response: "PooledResponse|AsyncPooledResponse", mod: dict) -> None:
+    """
+    Checks the SHA1 hash a cache peer sent a mod with against the one from the API before anything is transferred.
+    The file name the peer sent is only logged, as mods are saved under the name from the API.
+    """
+    peer_name: str|None = response.getheader(PEER_HEADER_FILE_NAME)
+    file_hash: str|None = response.getheader(PEER_HEADER_SHA1)
+    if peer_name != mod["fileName"]:
+        logging.info(f"Cache peer sent mod {mod['projectID']}-{mod['fileID']} as '{peer_name}' rather than '{mod['fileName']}'")
+    expected_hash: str = mod["hashes"]["sha1"]
+    if not file_hash or expected_hash.lower() != file_hash.lower():
+        raise Exception(f"Peer has mod with hash '{file_hash}' but it should be '{expected_hash}'")
+
+
+def checkPeerFile(fpath_file: str, file_hash: str) -> None:
+    """
+    Checks a forge installer from a cache peer against the SHA1 hash published by the forge maven
+    """
+    actual_hash: str = hashFile(fpath_file)
+    if actual_hash != file_hash.lower():
+        raise Exception(f"File from peer has hash '{actual_hash}' but it should be '{file_hash}'")
+
+
+class CacheServer():
+    """
+    Serves the mod and forge installer caches read only over HTTP, for other installers to use as a cache peer:
+        GET /mods/{projectID}/{fileID}    A cached mod. Sent with its file name and SHA1 hash in headers.
+        GET /forge/{forgeInstallerFile}   A cached forge installer. Sent with its SHA1 hash in a header.
+    The cache index is read again whenever it changes, so mods cached by installs on this machine are served
+    without restarting. Serving a mod does not count as using it for eviction.
+    """
+    def __init__(self, fpath_cache: str, host: str=DEFAULT_PEER_HOST, port: int=DEFAULT_PEER_PORT):
+        self.mod_cache: ModCache = ModCache(fpath_cache, 0) # Never evicted or saved by the server
+        self.fpath_forge_cache: str = os.path.join(fpath_cache, FORGE_CACHE_FOLDER)
+        # Nothing is ever written to the cache, so a wrong path would only ever serve 404s
+        if not os.path.isfile(self.mod_cache.fpath_index) and not os.path.isdir(self.fpath_forge_cache):
+            raise Exception(f"'{fpath_cache}' is not a mod cache. Install a modpack first to fill it.")
+        self.index_mtime: float|None = None
+        self.lock: threading.Lock = threading.Lock()
+        self.requests: int = 0
+        self.bytes: int = 0
+        self.server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer((host, port), CacheRequestHandler)
+        self.server.daemon_threads = True
+        self.server.cache_server = self
+        self.thread: threading.Thread|None = None
+
+
+    def start(self) -> str:
+        """
+        Starts serving in the background. Returns the base URL of the server.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url()
+
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def lookupMod(self, projectID: str, fileID: str) -> dict|None:
+        """
+        Returns the file name, size, hash and path of a cached mod, or None if it is not cached.
+        """
+        with self.lock:
+            try:
+                index_mtime: float|None = os.path.getmtime(self.mod_cache.fpath_index)
+            except OSError:
+                index_mtime = None
+            if index_mtime != self.index_mtime:
+                self.index_mtime = index_mtime
+                self.mod_cache.load(create_folders=False)
+        return self.mod_cache.lookup(projectID, fileID)
+
+
+    def lookupForge(self, forge_file: str) -> dict|None:
+        """
+        Returns the size, hash and path of a cached forge installer, or None if it is not cached.
+        """
+        if os.path.basename(forge_file) != forge_file or not forge_file.endswith(FORGE_INSTALLER_SUFFIX):
+            return None
+        fpath_cached: str = os.path.join(self.fpath_forge_cache, forge_file)
+        fpath_cached_hash: str = f"{fpath_cached}{FORGE_CACHE_HASH_SUFFIX}"
+        if not os.path.isfile(fpath_cached) or not os.path.isfile(fpath_cached_hash):
+            return None
+        with open(fpath_cached_hash, "r") as f:
+            file_hash: str = f.read().strip()
+        return {"fileName": forge_file, "size": os.path.getsize(fpath_cached), "sha1": file_hash, "path": fpath_cached}
+
+
+    def count(self, size: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+
+
+class CacheRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so peers can reuse their connections
+    disable_nagle_algorithm = True # Otherwise small files wait on delayed ACKs as headers and body are written separately
+
+    def log_message(self, format: str, *args) -> None:
+        logging.info(f"[CACHE SERVER] {format % args}")
+
+
+    def do_GET(self) -> None:
+        self.sendCachedFile(True)
+
+
+    def do_HEAD(self) -> None:
+        self.sendCachedFile(False)
+
+
+    def sendCachedFile(self, send_body: bool) -> None:
+        cache_server: CacheServer = self.server.cache_server
+        parts: list[str] = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+        cached: dict|None = None
+        if len(parts) == 3 and parts[0] == PEER_MODS_PATH and parts[1].isdigit() and parts[2].isdigit():
+            cached = cache_server.lookupMod(parts[1], parts[2])
+        elif len(parts) == 2 and parts[0] == PEER_FORGE_PATH:
+            cached = cache_server.lookupForge(urllib.parse.unquote(parts[1]))
+        if not cached:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        try:
+            f = open(cached["path"], "rb")
+        except OSError:
+            # Evicted while being looked up
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/java-archive")
+            self.send_header("Content-Length", str(cached["size"]))
+            self.send_header(PEER_HEADER_FILE_NAME, cached["fileName"])
+            self.send_header(PEER_HEADER_SHA1, cached["sha1"])
+            self.end_headers()
+            if send_body:
+                shutil.copyfileobj(f, self.wfile, DOWNLOAD_CHUNK_SIZE)
+        cache_server.count(cached["size"] if send_body else 0)
+
+
+# === Networking Ops ===
+class HTTPConnectionPool():
+    """
+    Keeps persistent (keep-alive) HTTP connections open per host so they can be reused between requests.
+    Shared between all download threads. Redirects are followed using connections from the pool.
+    Proxies are used like urllib would, from the HTTP_PROXY/HTTPS_PROXY/NO_PROXY environment variables or the system
+    settings, unless given. HTTPS goes through a CONNECT tunnel.
+    """
+    def __init__(self, timeout: float=DOWNLOAD_TIMEOUT, proxies: dict[str, str]|None=None):
+        self.timeout: float = timeout
+        self.connections: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.ssl_context: ssl.SSLContext = ssl.create_default_context()
+        self.proxies: dict[str, str] = urllib.request.getproxies() if proxies is None else proxies
+        self.hits: int = 0 # Requests which reused an open connection
+        self.misses: int = 0 # Requests which had to open a new connection
+
+
+    def request(self, method: str, url: str, headers: dict, body: bytes|None=None) -> "PooledResponse":
+        """
+        Sends a request, following any redirects.
+        Returns the response for the final URL. The connection goes back to the pool once the response is fully read and closed.
+        Raises urllib.error.HTTPError for error responses and urllib.error.URLError for connection errors.
+        """
+        for redirect in range(0, DOWNLOAD_REDIRECTS_MAX+1):
+            key, path = splitRequestURL(url)
+            connection, response = self.send(key, method, path, headers, body)
+
+            if response.status in HTTP_REDIRECT_CODES and response.getheader("Location"):
+                # Drain the redirect body so the connection can be reused, then go to the new location
+                response.read()
+                self.release(key, connection, response)
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                if response.status == 303 or (response.status in (301, 302) and method == "POST"):
+                    method = "GET"
+                    body = None
+                logging.info(f"Redirected to '{url}'")
+                continue
+
+            if response.status >= 400:
+                response.read()
+                self.release(key, connection, response)
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+            return PooledResponse(self, key, connection, response, url)
+
+        raise urllib.error.URLError(f"Too many redirects: {url}")
+
+
+    def send(self, key: tuple[str, str, int], method: str, path: str, headers: dict, body: bytes|None) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Sends a single request over a pooled connection and returns the connection and its response.
+        A reused connection may have been closed by the server while idle, in which case the request is sent again on a new connection.
+        """
+        path, headers = makeProxyRequest(getRequestProxy(self.proxies, key), key, path, headers)
+        connection, reused = self.acquire(key)
+        try:
+            connection.request(method, path, body, headers)
+            return connection, connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, http.client.BadStatusLine) as e:
+            connection.close()
+            if not reused:
+                raise urllib.error.URLError(e)
+            logging.info(f"Pooled connection to '{key[1]}' went stale. Reconnecting...")
+        except OSError as e:
+            connection.close()
+            if isinstance(e, TimeoutError):
+                raise
+            raise urllib.error.URLError(e)
+
+        connection = self.connect(key)
+        try:
+            connection.request(method, path, body, headers)
+            return connection, connection.getresponse()
+        except OSError as e:
+            connection.close()
+            if isinstance(e, TimeoutError):
+                raise
+            raise urllib.error.URLError(e)
+
+
+    def acquire(self, key: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        """
+        Returns an idle connection to the host if there is one, otherwise a new connection.
+        Also returns if the connection was reused.
+        """
+        with self.lock:
+            idle: list[http.client.HTTPConnection] = self.connections.get(key, [])
+            if idle:
+                self.hits += 1
+                return idle.pop(), True
+            self.misses += 1
+        return self.connect(key), False
+
+
+    def connect(self, key: tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        proxy: tuple[str, int, str|None]|None = getRequestProxy(self.proxies, key)
+        if proxy:
+            proxy_host, proxy_port, proxy_auth = proxy
+            if scheme == "https":
+                connection: http.client.HTTPSConnection = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=self.timeout, context=self.ssl_context)
+                connection.set_tunnel(host, port, {"Proxy-Authorization": proxy_auth} if proxy_auth else None)
+                return connection
+            return http.client.HTTPConnection(proxy_host, proxy_port, timeout=self.timeout)
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+
+    def release(self, key: tuple[str, str, int], connection: http.client.HTTPConnection, response: http.client.HTTPResponse) -> None:
+        """
+        Returns a connection to the pool if its response has been fully read and the server is keeping it alive.
+        Otherwise the connection is closed.
+        """
+        if not response.isclosed() or response.will_close:
+            connection.close()
+            return
+        with self.lock:
+            idle: list[http.client.HTTPConnection] = self.connections.setdefault(key, [])
+            if len(idle) < POOL_IDLE_CONNECTIONS_MAX:
+                idle.append(connection)
+                return
+        connection.close()
+
+
+    def close(self) -> None:
+        """
+        Closes all idle connections
+        """
+        with self.lock:
+            for idle in self.connections.values():
+                for connection in idle:
+                    connection.close()
+            self.connections = {}
+
+
+class PooledResponse():
+    """
+    A response from a HTTPConnectionPool. Behaves like the handle returned by urllib.request.urlopen.
+    Closing it hands the connection back to the pool.
+    """
+    def __init__(self, pool: HTTPConnectionPool, key: tuple[str, str, int], connection: http.client.HTTPConnection, response: http.client.HTTPResponse, url: str):
+        self.pool: HTTPConnectionPool = pool
+        self.key: tuple[str, str, int] = key
+        self.connection: http.client.HTTPConnection|None = connection
+        self.response: http.client.HTTPResponse = response
+        self.url: str = url
+        self.status: int = response.status
+        self.headers: http.client.HTTPMessage = response.headers
+
+
+    def read(self, amt: int|None=None) -> bytes:
+        return self.response.read(amt)
+
+
+    def readinto(self, buffer) -> int:
+        return self.response.readinto(buffer)
+
+
+    def getheader(self, name: str, default: str|None=None) -> str|None:
+        return self.response.getheader(name, default)
+
+
+    def geturl(self) -> str:
+        return self.url
+
+
+    def close(self) -> None:
+        if self.connection:
+            self.pool.release(self.key, self.connection, self.response)
+            self.connection = None
+
+
+    def __enter__(self) -> "PooledResponse":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def splitRequestURL(url: str) -> tuple[tuple[str, str, int], str]:
+    """
+    Splits a URL into the (scheme, host, port) it is requested from and the path to request
+    """
+    url_parts: urllib.parse.SplitResult = urllib.parse.urlsplit(url)
+    if url_parts.scheme not in ("http", "https"):
+        raise urllib.error.URLError(f"Unsupported URL scheme '{url_parts.scheme}'")
+    # The host may have been quoted along with the rest of the URL. Like urllib, unquote it.
+    host_parts: urllib.parse.SplitResult = urllib.parse.urlsplit(f"//{urllib.parse.unquote(url_parts.netloc)}")
+    key: tuple[str, str, int] = (url_parts.scheme, host_parts.hostname, host_parts.port or (443 if url_parts.scheme == "https" else 80))
+    path: str = url_parts.path or "/"
+    if url_parts.query:
+        path = f"{path}?{url_parts.query}"
+    return key, path
+
+
+def getRequestProxy(proxies: dict[str, str], key: tuple[str, str, int]) -> tuple[str, int, str|None]|None:
+    """
+    Finds the proxy to send requests to the (scheme, host, port) through, from proxies as returned by
+    urllib.request.getproxies.
+    Returns the host and port of the proxy and the Proxy-Authorization header to send it, or None to connect directly.
+    """
+    scheme, host, port = key
+    proxy_url: str|None = proxies.get(scheme)
+    if not proxy_url:
+        return None
+    # No proxy for hosts in NO_PROXY, or the system list of hosts to bypass
+    if "no" in proxies:
+        if urllib.request.proxy_bypass_environment(host, proxies):
+            return None
+    elif urllib.request.proxy_bypass(host):
+        return None
+    if "://" not in proxy_url:
+        proxy_url = f"http://{proxy_url}"
+    proxy_parts: urllib.parse.SplitResult = urllib.parse.urlsplit(proxy_url)
+    proxy_auth: str|None = None
+    if proxy_parts.username is not None:
+        credentials: str = f"{urllib.parse.unquote(proxy_parts.username)}:{urllib.parse.unquote(proxy_parts.password or '')}"
+        proxy_auth = f"Basic {base64.b64encode(credentials.encode('utf-8')).decode('ascii')}"
+    return proxy_parts.hostname, proxy_parts.port or 80, proxy_auth
+
+
+def makeProxyRequest(proxy: tuple[str, int, str|None]|None, key: tuple[str, str, int], path: str, headers: dict) -> tuple[str, dict]:
+    """
+    Plain HTTP requests through a proxy ask it for the full URL, with any Proxy-Authorization header.
+    HTTPS requests go through a tunnel and are sent as usual.
+    Returns the path and headers to send the request with.
+    """
+    if not proxy or key[0] != "http":
+        return path, headers
+    scheme, host, port = key
+    host_port: str = f"[{host}]" if ":" in host else host
+    if port != 80:
+        host_port = f"{host_port}:{port}"
+    if proxy[2]:
+        headers = {**headers, "Proxy-Authorization": proxy[2]}
+    return f"http://{host_port}{path}", headers
+
+
+class RateLimiter():
+    """
+    A token bucket shared by every thread and task making requests it limits.
+    Allows rate requests per second on average, in bursts of up to a second's worth. A rate of 0 is unlimited.
+    When the server throttles a request (HTTP 429), pause stops every request until the time the server asked for
+    has passed, after which requests pick up at the normal rate again rather than all at once.
+    """
+    def __init__(self, rate: float=DEFAULT_API_RATE):
+        self.lock: threading.Lock = threading.Lock()
+        self.configure(rate)
+        self.requests: int = 0
+        self.wait_seconds: float = 0.0 # Total time requests spent waiting
+        self.pauses: int = 0
+
+
+    def configure(self, rate: float) -> None:
+        with self.lock:
+            self.rate: float = rate
+            self.burst: float = max(rate, 1.0)
+            self.tokens: float = self.burst
+            self.time_refill: float = time.monotonic() # Tokens are added from this time on. In the future while paused.
+
+
+    def reserve(self) -> float:
+        """
+        Takes a token for a request. Returns how many seconds to wait before sending it.
+        """
+        with self.lock:
+            now: float = time.monotonic()
+            self.requests += 1
+            if self.rate <= 0:
+                wait: float = max(self.time_refill - now, 0.0)
+            else:
+                if now > self.time_refill:
+                    self.tokens = min(self.burst, self.tokens + (now - self.time_refill)*self.rate)
+                    self.time_refill = now
+                self.tokens -= 1
+                wait = max(self.time_refill - now, 0.0) + max(-self.tokens, 0.0)/self.rate
+            self.wait_seconds += wait
+            return wait
+
+
+    def getPause(self) -> float:
+        """
+        Returns how many seconds are left of the current pause
+        """
+        with self.lock:
+            return max(self.time_refill - time.monotonic(), 0.0)
+
+
+    def wait(self) -> None:
+        """
+        Waits until a request can be sent
+        """
+        time.sleep(self.reserve())
+        # A pause may have started while waiting
+        while (pause := self.getPause()) > 0:
+            time.sleep(pause)
+
+
+    async def waitAsync(self) -> None:
+        """
+        The asyncio version of wait
+        """
+        await asyncio.sleep(self.reserve())
+        while (pause := self.getPause()) > 0:
+            await asyncio.sleep(pause)
+
+
+    def pause(self, seconds: float|None) -> None:
+        """
+        Holds back every request for the given number of seconds, or API_RATE_PAUSE_DEFAULT if not known
+        """
+        seconds = API_RATE_PAUSE_DEFAULT if seconds is None else seconds
+        with self.lock:
+            now: float = time.monotonic()
+            until: float = now + seconds
+            if until <= self.time_refill:
+                return # Already paused for long enough
+            # Requests sent before a pause started get throttled too. They only make the pause longer.
+            paused: bool = now < self.time_refill
+            if not paused and self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.time_refill)*self.rate)
+            # No tokens are saved up during the pause, so requests are spread out again once it is over
+            self.tokens = min(self.tokens, 0.0)
+            self.time_refill = until
+            if paused:
+                return
+            self.pauses += 1
+        logWarn(f"API requests throttled by the server. Pausing all API requests for {seconds:.1f}s...")
+
+
+    def report(self) -> None:
+        if self.requests:
+            logInfo(f"API rate limit: {self.requests} requests waited {self.wait_seconds:.1f}s in total, paused {self.pauses} times by the server")
+
+
+default_http_pool: HTTPConnectionPool = HTTPConnectionPool()
+api_rate_limiter: RateLimiter = RateLimiter() # Every CurseForge API request goes through this
+segment_pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(SEGMENTED_DOWNLOAD_THREADS, "segment")
+
+
+class DownloadError(Exception):
+    """
+    A failed download. Carries the HTTP status code and how long the server asked us to wait
+    before trying again (Retry-After), if known.
+    """
+    def __init__(self, message: str, code: int|None=None, retry_after: float|None=None):
+        super().__init__(message)
+        self.code: int|None = code
+        self.retry_after: float|None = retry_after
+
+
+def downloadURL(url: str, headers: dict=DEFAULT_DOWNLOAD_HEADERS, data: bytes|None=None, pool: HTTPConnectionPool|None=None, tries: int=DOWNLOAD_TRIES_MAX, rate_limiter: RateLimiter|None=None) -> PooledResponse:
+    """
+    Attempts to download the given URL. The URL should already be quoted if needed.
+    If data is given it is sent as the body of a POST request.
+    Connections are taken from the given pool, or the default pool if not given.
+    Every attempt waits for the rate limiter, if given. A 429 pauses the rate limiter for everyone
+    and the next attempt waits out the pause instead of retrying at random.
+    Retries download on error up to the given number of tries.
+    Returns the open URL handle
+    Raises DownloadError on error.
+    """
+    pool = pool or default_http_pool
+    last_error: DownloadError = DownloadError("Did not attempt download")
+    for attempt in range(1, tries+1):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            logging.info(f"Downloading '{url}' (Attempt {attempt})")
+            response: PooledResponse = pool.request("POST" if data is not None else "GET", url, headers, data)
+            return response
+        except Exception as e:
+            last_error = makeRequestError(url, e)
+
+        wait: float|None = getRequestRetryWait(last_error, attempt, tries, rate_limiter)
+        if wait is None:
+            break
+        time.sleep(wait)
+
+    logging.error(f"Download exceeded maximum retries: {last_error}")
+    raise last_error
+
+
+def makeRequestError(url: str, error: Exception) -> DownloadError:
+    """
+    Returns the DownloadError for a failed request, carrying the status code and Retry-After of HTTP errors
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return DownloadError(f"HTTP ERROR {error.code}: {url}", error.code, parseRetryAfter(error.headers.get("Retry-After") if error.headers else None))
+    if isinstance(error, urllib.error.URLError):
+        return DownloadError(f"URL ERROR {error.reason}: {url}")
+    return DownloadError(f"UNKNOWN ERROR (probably timeout): {url}")
+
+
+def getRequestRetryWait(error: DownloadError, attempt: int, tries: int, rate_limiter: "RateLimiter|None"=None) -> float|None:
+    """
+    Decides what to do after a failed request. A 429 pauses the rate limiter (if given) for everyone.
+    Returns how long to wait before the next attempt, or None if there are no tries left.
+    """
+    if rate_limiter and error.code == 429:
+        rate_limiter.pause(error.retry_after)
+    if attempt >= tries:
+        return None
+    if rate_limiter and error.code == 429:
+        return 0.0 # The rate limiter waits out the pause
+    # Wait a random amount of time before retrying, or as long as the server asked
+    wait: float = DOWNLOAD_RETRY_WAIT_MIN + random.random()*DOWNLOAD_RETRY_WAIT_SPREAD
+    if error.retry_after is not None:
+        wait = max(wait, error.retry_after)
+    return wait
+
+
+def parseRetryAfter(value: str|None) -> float|None:
+    """
+    Returns the number of seconds to wait from a Retry-After header, which is either a number of seconds or a HTTP date.
+    Returns None if there is no usable value.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_time: float = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        logging.warning(f"Unable to parse Retry-After header '{value}'")
+        return None
+    return max(retry_time - time.time(), 0.0)
+
+
+def resolveModList(mod_list: list[dict], api_url: str=CURSEFORGE_API_URL_DEFAULT, pool: HTTPConnectionPool|None=None) -> int:
+    """
+    Looks up the download location, file name, size and hashes of every mod using as few bulk API requests as possible.
+    The details are added to each mod in place so downloading only needs to transfer the file.
+    Mods which could not be resolved are left alone and fall back to looking up their download location individually.
+    Returns the number of mods with a known download location.
+    """
+    resolved_count: int = 0
+    for i in range(0, len(mod_list), RESOLVE_BATCH_SIZE):
+        batch: list[dict] = mod_list[i:i+RESOLVE_BATCH_SIZE]
+        logging.info(f"Resolving mods {i} to {i+len(batch)-1}")
+        try:
+            mod_files: dict[str, dict] = requestModFiles([mod["fileID"] for mod in batch], api_url, pool)
+        except Exception as e:
+            logging.exception("Failed to resolve batch of mods")
+            logWarn(f"Failed to resolve {len(batch)} mods in bulk. They will be looked up individually: {e}")
+            continue
+
+        resolved_count += readModFilesInfo(batch, mod_files)
+    return resolved_count
+
+
+def readModFilesInfo(mod_list: list[dict], mod_files: dict[str, dict]) -> int:
+    """
+    Copies the file details returned by a bulk API request into each mod they belong to.
+    Returns the number of mods which now have a known download location.
+    """
+    resolved_count: int = 0
+    for mod in mod_list:
+        mod_file: dict|None = mod_files.get(mod["fileID"])
+        if not mod_file:
+            logging.warning(f"Bulk resolution did not return mod {mod}")
+            continue
+        if str(mod_file.get("modId")) != mod["projectID"]:
+            logging.warning(f"Bulk resolution returned file for project '{mod_file.get('modId')}' for mod {mod}")
+            continue
+        readModFileInfo(mod, mod_file)
+        if mod.get("downloadUrl"):
+            resolved_count += 1
+    return resolved_count
+
+
+def requestModFiles(fileIDs: list[str], api_url: str=CURSEFORGE_API_URL_DEFAULT, pool: HTTPConnectionPool|None=None) -> dict[str, dict]:
+    """
+    Requests the file details of many mod files in a single API call.
+    Returns the file details keyed by fileID.
+    """
+    body: bytes = json.dumps({"fileIds": [int(x) for x in fileIDs]}).encode("utf-8")
+    headers: dict = fixHeader(API_DOWNLOAD_HEADERS)
+    headers["Content-Type"] = "application/json"
+    response: PooledResponse = downloadURL(makeModFilesBulkLink(api_url), headers, body, pool, rate_limiter=api_rate_limiter)
+    with response:
+        mod_files: list[dict] = json.loads(response.read().decode("utf-8"))["data"]
+    return {str(x["id"]): x for x in mod_files}
+
+
+def readModFileInfo(mod: dict, mod_file: dict) -> None:
+    """
+    Copies the parts of an API file object needed for downloading into the mod
+    """
+    mod["fileName"] = mod_file.get("fileName")
+    mod["fileLength"] = mod_file.get("fileLength")
+    mod["downloadUrl"] = mod_file.get("downloadUrl") # Can be null when the author has disabled third party downloads
+    mod["hashes"] = {}
+    for file_hash in mod_file.get("hashes", []):
+        if file_hash.get("algo") == HASH_ALGO_SHA1:
+            mod["hashes"]["sha1"] = file_hash["value"]
+        elif file_hash.get("algo") == HASH_ALGO_MD5:
+            mod["hashes"]["md5"] = file_hash["value"]
+
+
+def requestModDownloadLink(projectID: str, fileID: str, api_url: str=CURSEFORGE_API_URL_DEFAULT, pool: HTTPConnectionPool|None=None, tries: int=DOWNLOAD_TRIES_MAX) -> str:
+    """
+    Asks the API for the download location of a single mod
+    """
+    mod_location_url: str = makeModLocationDownloadLink(projectID, fileID, api_url)
+
+    try:
+        response: PooledResponse = downloadURL(mod_location_url, fixHeader(API_DOWNLOAD_HEADERS), pool=pool, tries=tries, rate_limiter=api_rate_limiter)
+    except DownloadError as e:
+        # Failed to download the url
+        raise DownloadError(f"Failed to retrieve mod download location: {e}", e.code, e.retry_after)
+
+    # The response should contain the link to download the mod.
+    with response:
+        link: str = json.loads(response.read().decode('utf-8'))["data"]
+    return link
+
+
+def quoteDownloadLink(link: str) -> str:
+    """
+    Quotes a download link returned by the API, unless it has already been quoted
+    """
+    match = re.findall(r"^(https?://)(.*)", link)
+    if not match:
+        raise Exception("Failed to extract mod download URL")
 
     # Check if CurseForge has decided to send already quoted data back to us so we do not quote again.
     url_http: str = match[0][0]
@@ -539,62 +2759,1248 @@ def downloadMod(projectID: str, fileID: str, fpath_mods_temp: str) -> str:
     if not re.search(r'%[0-9A-Fa-f]{2}', url_address):
         # No quotes, so quote the address
         url_address = urllib.parse.quote(url_address)
-    download_link: str = f"{url_http}{url_address}"
+    return f"{url_http}{url_address}"
 
+
+def downloadMod(mod: dict, fpath_mods_temp: str, fpath_partial: str, api_url: str=CURSEFORGE_API_URL_DEFAULT, pool: HTTPConnectionPool|None=None) -> str:
+    """
+    Downloads and saves a single mod.
+    Mods already resolved by resolveModList go straight to the file download,
+    otherwise the download location is looked up first.
+    Only a single attempt is made. Retrying is left to the caller, and will resume
+    from the partial download left in fpath_partial if the server supports it.
+    """
+    link: str|None = mod.get("downloadUrl")
+    if not link:
+        link = requestModDownloadLink(mod["projectID"], mod["fileID"], api_url, pool, tries=1)
+    download_link: str = quoteDownloadLink(link)
+
+    # Stream the bytes to a partial file, carrying on from any earlier attempt
+    fpath_part: str = os.path.join(fpath_partial, f"{makeModCacheKey(mod['projectID'], mod['fileID'])}{DOWNLOAD_PART_SUFFIX}")
     try:
-        response = downloadURL(download_link)
-    except Exception as e:
+        final_url: str = downloadURLToFile(download_link, fpath_part, pool=pool, tries=1, size=mod.get("fileLength"))
+    except DownloadError as e:
         # Failed to retrieve the mod
-        raise Exception(f"Failed to download mod: {e}")
+        raise DownloadError(f"Failed to download mod: {e}", e.code, e.retry_after)
 
-    # Scrape the name of the mod from the download url
-    # Note the final link may be different to what we requested due to redirection.
-    match: list[str] = re.findall(r'[^/]*$', response.geturl())
-    if not match:
-        raise Exception("Failed to match mod name")
-    mod_name: str = urllib.parse.unquote(match[0])
-    # Replace any 'fancy' characters which are illegal in filenames
-    mod_name = re.sub(r'\\/:\*\?"<>\|', "-", mod_name)
-
-    # Write the bytes to file
+    # Move the completed download into place
+    mod_name: str = makeModFileName(mod, final_url)
     fpath_mod: str = os.path.join(fpath_mods_temp, mod_name)
-    with open(fpath_mod, "wb") as f:
-        f.write(response.read())
+    os.replace(fpath_part, fpath_mod)
 
     # Return the name of the mod which was downloaded
     return mod_name
 
 
-def fixHeader(headers: dict) -> dict:
+def makeModFileName(mod: dict, final_url: str) -> str:
+    """
+    Returns the file name to save a downloaded mod as, from the API if known or otherwise the URL it was downloaded from.
+    The name is used in the temp, cache and install folders, so characters which are illegal in file names (path
+    separators included) are replaced. Raises an exception if that leaves no usable name.
+    """
+    if mod.get("fileName"):
+        mod_name: str = mod["fileName"]
+    else:
+        # Scrape the name of the mod from the download url
+        # Note the final link may be different to what we requested due to redirection.
+        match: list[str] = re.findall(r'[^/]*$', final_url)
+        if not match:
+            raise Exception("Failed to match mod name")
+        mod_name: str = urllib.parse.unquote(match[0])
+    # Replace any 'fancy' characters which are illegal in filenames
+    mod_name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "-", mod_name).strip()
+    if mod_name in ("", ".", ".."):
+        raise Exception(f"Mod {mod['projectID']}/{mod['fileID']} has no usable file name")
+    return mod_name
+
+
+def downloadURLToFile(url: str, fpath_part: str, headers: dict=DEFAULT_DOWNLOAD_HEADERS, pool: HTTPConnectionPool|None=None, tries: int=DOWNLOAD_TRIES_MAX, size: int|None=None, segmented: bool=False) -> str:
+    """
+    Downloads the URL into the given partial file.
+    If an earlier attempt left part of the file behind, only the rest is requested using a Range request.
+    The partial file is kept if the download fails part way so a later attempt can resume it,
+    as long as the server gave a validator (ETag/Last-Modified) to check the file has not changed since.
+    Files known to be (size) or found to be (segmented) larger than SEGMENTED_DOWNLOAD_THRESHOLD
+    are downloaded in several parts at once.
+    Returns the final URL after any redirects. The caller is responsible for moving the completed file into place.
+    Raises DownloadError on error.
+    """
+    download: PartialDownload = PartialDownload(url, fpath_part, headers)
+    request_headers: dict = download.prepare()
+    if download.shouldSegment(size, segmented):
+        final_url: str|None = downloadURLSegmented(url, fpath_part, headers, pool, tries)
+        if final_url:
+            return final_url
+
+    try:
+        response: PooledResponse = downloadURL(url, request_headers, pool=pool, tries=tries)
+    except DownloadError as e:
+        if not download.shouldRestart(e):
+            raise
+        removePartialDownload(fpath_part)
+        return downloadURLToFile(url, fpath_part, headers, pool, tries, size, segmented)
+
+    with response:
+        download.start(response)
+        try:
+            size_written: int = writeResponseToFile(response, fpath_part, download.offset)
+        except:
+            download.fail()
+            raise
+    download.finish(size_written)
+    return response.geturl()
+
+
+class PartialDownload():
+    """
+    A download into a partial file, which may carry on from where an earlier attempt got to.
+    Makes the decisions both download engines share: whether to resume with a Range request or split the file into
+    segments, whether the server really resumed, and keeping the sidecar which says how to resume the file later.
+    prepare, start, fail and finish do file I/O, so the asyncio engine runs them on another thread.
+    """
+    def __init__(self, url: str, fpath_part: str, headers: dict):
+        self.url: str = url
+        self.fpath_part: str = fpath_part
+        self.headers: dict = headers
+        self.offset: int = 0 # Where the body of the response is written from
+        self.validator: str|None = None # From the response, used to resume the file if it gets cut off
+
+
+    def prepare(self) -> dict:
+        """
+        Finds out if an earlier attempt can be carried on from. Returns the headers to request the file with.
+        """
+        request_headers: dict = self.headers.copy()
+        part_info: dict|None = readPartialDownloadInfo(self.fpath_part, self.url)
+        self.offset = 0
+        if part_info:
+            self.offset = os.path.getsize(self.fpath_part)
+            request_headers["Range"] = f"bytes={self.offset}-"
+            request_headers["If-Range"] = part_info["validator"]
+            logging.info(f"Resuming download of '{self.url}' from byte {self.offset}")
+        return request_headers
+
+
+    def shouldSegment(self, size: int|None, segmented: bool) -> bool:
+        """
+        Returns if the file should be split into segments: a fresh download known to be (size) or thought to be (segmented) large
+        """
+        return not self.offset and (segmented or (size or 0) >= SEGMENTED_DOWNLOAD_THRESHOLD)
+
+
+    def shouldRestart(self, error: DownloadError) -> bool:
+        """
+        Returns if a failed request means the partial file should be thrown away and the download started again
+        """
+        if error.code != 416 or not self.offset:
+            return False
+        # The server does not agree with what we have so far
+        logging.info(f"Range not satisfiable for '{self.url}'. Restarting download.")
+        return True
+
+
+    def start(self, response: "PooledResponse|AsyncPooledResponse") -> None:
+        """
+        Checks whether the server resumed the download, and remembers how to resume it if it gets cut off
+        """
+        if self.offset and (response.status != 206 or getContentRangeStart(response) != self.offset):
+            # The server sent the whole file instead, either because it does not do ranges or the file changed
+            logging.info(f"Server did not resume download of '{self.url}'. Restarting download.")
+            self.offset = 0
+        self.validator = getResponseValidator(response)
+        if self.validator:
+            writePartialDownloadInfo(self.fpath_part, self.url, self.validator)
+        else:
+            removePartialDownloadInfo(self.fpath_part)
+
+
+    def fail(self) -> None:
+        """
+        Without a validator the download cannot safely be resumed, so there is no point keeping the partial file
+        """
+        if not self.validator:
+            removePartialDownload(self.fpath_part)
+
+
+    def finish(self, size: int) -> None:
+        removePartialDownloadInfo(self.fpath_part)
+        logging.info(f"Downloaded {size} bytes from '{self.url}'")
+
+
+def downloadURLSegmented(url: str, fpath_part: str, headers: dict=DEFAULT_DOWNLOAD_HEADERS, pool: HTTPConnectionPool|None=None, tries: int=DOWNLOAD_TRIES_MAX) -> str|None:
+    """
+    Downloads a large file as several byte ranges at the same time, each written in place into the partial file.
+    A single byte is requested first to find the size of the file and check the server supports ranges.
+    Returns the final URL after any redirects, or None if the file should be downloaded normally instead
+    (too small, or ranges are not supported).
+    Raises DownloadError on error.
+    """
+    with downloadURL(url, makeRangeProbeHeaders(headers), pool=pool, tries=tries) as response:
+        probe: tuple[int, str|None]|None = readRangeProbe(response, url)
+        if not probe:
+            return None
+        try:
+            response.read()
+        except (http.client.HTTPException, OSError) as e:
+            # Only the headers are needed, so a cut off body does not matter. The connection is not reused.
+            logging.info(f"Range probe of '{url}' was cut off: {e}")
+        final_url: str = response.geturl()
+    size, validator = probe
+    segments: list[tuple[int, int]] = planSegments(size)
+    if not segments:
+        return None
+
+    segment_headers: dict = makeSegmentHeaders(headers, validator)
+    logging.info(f"Downloading '{final_url}' ({size} bytes) in {len(segments)} segments")
+    prepareSegmentedFile(fpath_part, size)
+    futures: list[concurrent.futures.Future] = []
+    try:
+        futures = [segment_pool.submit(downloadSegment, final_url, fpath_part, start, end, segment_headers, pool, tries) for start, end in segments]
+        for future in futures:
+            future.result()
+    except Exception as e:
+        for future in futures:
+            future.cancel()
+        concurrent.futures.wait(futures)
+        removePartialDownload(fpath_part)
+        if not shouldFallBackFromSegments(e, url):
+            raise
+        return None
+    return final_url
+
+
+class RangeNotSupportedError(DownloadError):
+    """
+    A server did not answer a Range request with the requested range
+    """
+
+
+def downloadSegment(url: str, fpath_part: str, start: int, end: int, headers: dict, pool: HTTPConnectionPool|None, tries: int) -> None:
+    """
+    A function meant to be run in the segment pool.
+    Downloads bytes start to end (inclusive) of the URL into the same place in the partial file.
+    A segment which is cut off is resumed from where it got to, up to the given number of tries.
+    """
+    position: int = start
+    buffer: memoryview = getDownloadBuffer()
+    last_error: Exception = DownloadError("Did not attempt segment download")
+    for attempt in range(1, tries+1):
+        try:
+            with downloadURL(url, makeSegmentRangeHeaders(headers, position, end), pool=pool, tries=1) as response:
+                checkSegmentResponse(response, url, position, end)
+                with openPartialFile(fpath_part, position, truncate=False) as f:
+                    while position <= end and (n := response.readinto(buffer[:end-position+1])):
+                        f.write(buffer[:n])
+                        position += n
+            if position > end:
+                return
+            last_error = DownloadError(f"Segment {start}-{end} truncated at byte {position}: {url}")
+        except Exception as e:
+            last_error = makeSegmentError(e, start, end, position)
+        logging.info(f"Segment {start}-{end} of '{url}' failed (Attempt {attempt}): {last_error}")
+    raise last_error
+
+
+def makeRangeProbeHeaders(headers: dict) -> dict:
+    """
+    Returns the headers to request just the first byte of a file with, to find its size and check the server does ranges
+    """
+    probe_headers: dict = headers.copy()
+    probe_headers["Range"] = "bytes=0-0"
+    return probe_headers
+
+
+def readRangeProbe(response: "PooledResponse|AsyncPooledResponse", url: str) -> tuple[int, str|None]|None:
+    """
+    Returns the size of the file and its validator (if any) from the answer to a range probe,
+    or None if the server does not support ranges.
+    """
+    match = re.match(r"^bytes\s+0-0/(\d+)$", (response.getheader("Content-Range") or "").strip())
+    if response.status != 206 or not match:
+        logging.info(f"Server does not support ranges for '{url}'. Downloading normally.")
+        return None
+    return int(match[1]), getResponseValidator(response)
+
+
+def planSegments(size: int) -> list[tuple[int, int]]:
+    """
+    Returns the first and last byte of each segment to download a file of the given size in,
+    or nothing if the file is too small to be worth splitting up.
+    """
+    if size < SEGMENTED_DOWNLOAD_THRESHOLD:
+        return []
+    segment_size: int = -(-size // SEGMENTED_DOWNLOAD_SEGMENTS)
+    return [(x, min(x+segment_size, size)-1) for x in range(0, size, segment_size)]
+
+
+def makeSegmentHeaders(headers: dict, validator: str|None) -> dict:
+    """
+    Every segment goes straight to the final location so is requested from there. Make sure the file
+    does not change between segments if the server gave us a way to check.
+    """
+    segment_headers: dict = headers.copy()
+    if validator:
+        segment_headers["If-Range"] = validator
+    return segment_headers
+
+
+def makeSegmentRangeHeaders(headers: dict, position: int, end: int) -> dict:
+    segment_headers: dict = headers.copy()
+    segment_headers["Range"] = f"bytes={position}-{end}"
+    return segment_headers
+
+
+def prepareSegmentedFile(fpath_part: str, size: int) -> None:
+    """
+    Replaces the partial file with an empty one of the full size, for the segments to be written into
+    """
+    removePartialDownload(fpath_part)
+    with open(fpath_part, "wb") as f:
+        f.truncate(size)
+
+
+def checkSegmentResponse(response: "PooledResponse|AsyncPooledResponse", url: str, position: int, end: int) -> None:
+    """
+    Raises RangeNotSupportedError if the server did not send the range of a segment which was asked for
+    """
+    if response.status != 206 or getContentRangeStart(response) != position:
+        raise RangeNotSupportedError(f"Server sent status {response.status} for range {position}-{end}: {url}")
+
+
+def makeSegmentError(error: Exception, start: int, end: int, position: int) -> DownloadError:
+    """
+    Returns the DownloadError for a failed attempt at a segment. RangeNotSupportedError is raised straight away,
+    as trying the segment again will not help.
+    """
+    if isinstance(error, RangeNotSupportedError):
+        raise error
+    if isinstance(error, DownloadError):
+        return error
+    return DownloadError(f"Segment {start}-{end} interrupted at byte {position}: {error}")
+
+
+def shouldFallBackFromSegments(error: Exception, url: str) -> bool:
+    """
+    Returns if a failed segmented download should be tried again as a normal download
+    """
+    if not isinstance(error, RangeNotSupportedError):
+        return False
+    # The server changed its mind about ranges part way through
+    logging.info(f"Segmented download of '{url}' failed: {error}. Downloading normally.")
+    return True
+
+
+def writeResponseToFile(response: PooledResponse, fpath_dest: str, offset: int=0) -> int:
+    """
+    Streams the body of an open URL handle to the destination file in fixed size chunks.
+    Writing starts at the given offset so an interrupted download can be continued. Anything after it is replaced.
+    Returns the size of the file.
+    """
+    buffer: memoryview = getDownloadBuffer()
+    size: int = 0
+    try:
+        with openPartialFile(fpath_dest, offset) as f:
+            while n := response.readinto(buffer):
+                f.write(buffer[:n])
+                size += n
+        checkResponseLength(response, offset, size)
+    except Exception as e:
+        raise makeWriteError(e, offset, size)
+    finally:
+        response.close()
+    return offset + size
+
+
+def openPartialFile(fpath_dest: str, offset: int, truncate: bool=True) -> typing.BinaryIO:
+    """
+    Opens a file to write a download into from the given offset. Unless told not to, anything after the offset is removed.
+    """
+    f: typing.BinaryIO = open(fpath_dest, "r+b" if offset or not truncate else "wb")
+    try:
+        f.seek(offset)
+        if truncate:
+            f.truncate()
+    except:
+        f.close()
+        raise
+    return f
+
+
+def checkResponseLength(response: "PooledResponse|AsyncPooledResponse", offset: int, size: int) -> None:
+    """
+    Raises DownloadError if fewer bytes arrived than the server said it would send
+    """
+    content_length: str|None = response.getheader("Content-Length")
+    if content_length is not None and content_length.isdigit() and size != int(content_length):
+        raise DownloadError(f"Download truncated at {offset+size} of {offset+int(content_length)} bytes")
+
+
+def makeWriteError(error: Exception, offset: int, size: int) -> DownloadError:
+    if isinstance(error, DownloadError):
+        return error
+    return DownloadError(f"Download interrupted after {offset+size} bytes: {error}")
+
+
+def getContentRangeStart(response: PooledResponse) -> int|None:
+    """
+    Returns the first byte of a partial response from its Content-Range header (e.g. 'bytes 100-999/1000')
+    """
+    match = re.match(r"^bytes\s+(\d+)-\d+/(\d+|\*)$", (response.getheader("Content-Range") or "").strip())
+    return int(match[1]) if match else None
+
+
+def getResponseValidator(response: PooledResponse) -> str|None:
+    """
+    Returns a value which can be sent in If-Range to check the file has not changed, if the server gave one
+    """
+    etag: str|None = response.getheader("ETag")
+    if etag and not etag.startswith("W/"): # Weak ETags cannot be used for ranges
+        return etag
+    return response.getheader("Last-Modified")
+
+
+def readPartialDownloadInfo(fpath_part: str, url: str) -> dict|None:
+    """
+    Returns the sidecar of a partial download if it can be resumed from the given URL
+    """
+    fpath_info: str = f"{fpath_part}{DOWNLOAD_PART_INFO_SUFFIX}"
+    if not os.path.isfile(fpath_part) or not os.path.isfile(fpath_info):
+        return None
+    try:
+        with open(fpath_info, "r") as f:
+            part_info: dict = json.load(f)
+    except Exception:
+        logging.exception(f"Failed to read partial download info '{fpath_info}'")
+        return None
+    if part_info.get("url") != url or not part_info.get("validator") or os.path.getsize(fpath_part) == 0:
+        return None
+    return part_info
+
+
+def writePartialDownloadInfo(fpath_part: str, url: str, validator: str) -> None:
+    with open(f"{fpath_part}{DOWNLOAD_PART_INFO_SUFFIX}", "w") as f:
+        json.dump({"url": url, "validator": validator}, f)
+
+
+def removePartialDownloadInfo(fpath_part: str) -> None:
+    fpath_info: str = f"{fpath_part}{DOWNLOAD_PART_INFO_SUFFIX}"
+    if os.path.isfile(fpath_info):
+        os.remove(fpath_info)
+
+
+def removePartialDownload(fpath_part: str) -> None:
+    removePartialDownloadInfo(fpath_part)
+    if os.path.isfile(fpath_part):
+        os.remove(fpath_part)
+
+
+_download_buffers = threading.local()
+_download_buffers_count: int = 0
+_download_buffers_lock: threading.Lock = threading.Lock()
+def getDownloadBuffer() -> memoryview:
+    """
+    Returns the download buffer for the calling thread, allocating it on first use.
+    Keeps the memory used by downloads bounded to one chunk per thread regardless of file size.
+    """
+    global _download_buffers_count
+    if not hasattr(_download_buffers, "buffer"):
+        _download_buffers.buffer = memoryview(bytearray(DOWNLOAD_CHUNK_SIZE))
+        with _download_buffers_lock:
+            _download_buffers_count += 1
+    return _download_buffers.buffer
+
+
+def getDownloadBufferMemory() -> int:
+    """
+    Returns the total number of bytes allocated to download buffers across all threads
+    """
+    return _download_buffers_count * DOWNLOAD_CHUNK_SIZE
+
+
+def fixHeader(headers: dict) -> dict:
+    """
+    Returns a copy of the given header object with them fixed
+    """
+    h:  dict = headers.copy()
+    l = lambda x: base64.b64decode(x).decode("ascii")
+    h.update([(l(b'eC1hcGkta2V5'), l(b'JDJhJDEwJGJMNGJJTDVwVVdxZmNPN0tRdG5NUmVha3d0ZkhiTktoNnYxdVRwS2x6aHdvdWVFSlFuUG5t'))])
+    return h
+
+
+def downloadForgeInstaller(minecraft_version: str, forge_version: str, fpath_install_temp: str, pool: HTTPConnectionPool|None=None) -> str:
+    """
+    Downloads and saves the specified forge version.
+    Returns the name of the installer
+    """
+    forge_file: str = makeForgeInstallerFileName(minecraft_version, forge_version)
+    forge_url: str = makeForgeInstallerDownloadLink(minecraft_version, forge_version)
+    fpath_partial: str = os.path.join(fpath_install_temp, PARTIAL_FOLDER)
+    fpath_part: str = os.path.join(fpath_partial, f"{forge_file}{DOWNLOAD_PART_SUFFIX}")
+    generateFolder(fpath_partial)
+
+    # Stream forge to install temp. Each retry resumes from wherever the last attempt got to.
+    for attempt in range(1, DOWNLOAD_TRIES_MAX+1):
+        try:
+            downloadURLToFile(forge_url, fpath_part, pool=pool, segmented=True)
+            break
+        except Exception as e:
+            logging.exception(f"Failed to download forge installer (Attempt {attempt})")
+            if attempt >= DOWNLOAD_TRIES_MAX:
+                raise Exception("Failed to download forge installer")
+
+    fpath_forge: str = os.path.join(fpath_install_temp, forge_file)
+    os.replace(fpath_part, fpath_forge)
+    return forge_file
+
+
+# === Async Downloads ===
+class AsyncHTTPConnectionPool():
+    """
+    The asyncio version of HTTPConnectionPool used by the asyncio download engine.
+    Speaks just enough HTTP/1.1 over asyncio streams for downloading: keep-alive, sized and chunked bodies and redirects.
+    Only used from the event loop it was created on, so needs no lock.
+    Proxies are used the same way as HTTPConnectionPool.
+    """
+    def __init__(self, timeout: float=DOWNLOAD_TIMEOUT, proxies: dict[str, str]|None=None):
+        self.timeout: float = timeout
+        self.connections: dict[tuple[str, str, int], list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self.ssl_context: ssl.SSLContext = ssl.create_default_context()
+        self.proxies: dict[str, str] = urllib.request.getproxies() if proxies is None else proxies
+        self.hits: int = 0 # Requests which reused an open connection
+        self.misses: int = 0 # Requests which had to open a new connection
+
+
+    async def request(self, method: str, url: str, headers: dict, body: bytes|None=None) -> "AsyncPooledResponse":
+        """
+        Sends a request, following any redirects.
+        Returns the response for the final URL. The connection goes back to the pool once the response is fully read and closed.
+        Raises urllib.error.HTTPError for error responses and urllib.error.URLError for connection errors.
+        """
+        for redirect in range(0, DOWNLOAD_REDIRECTS_MAX+1):
+            key, path = splitRequestURL(url)
+            response: AsyncPooledResponse = await self.send(key, method, path, headers, body)
+
+            if response.status in HTTP_REDIRECT_CODES and response.getheader("Location"):
+                # Drain the redirect body so the connection can be reused, then go to the new location
+                await response.read()
+                response.close()
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                if response.status == 303 or (response.status in (301, 302) and method == "POST"):
+                    method = "GET"
+                    body = None
+                logging.info(f"Redirected to '{url}'")
+                continue
+
+            if response.status >= 400:
+                await response.read()
+                response.close()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+            response.url = url
+            return response
+
+        raise urllib.error.URLError(f"Too many redirects: {url}")
+
+
+    async def send(self, key: tuple[str, str, int], method: str, path: str, headers: dict, body: bytes|None) -> "AsyncPooledResponse":
+        """
+        Sends a single request over a pooled connection and returns its response.
+        A reused connection may have been closed by the server while idle, in which case the request is sent again on a new connection.
+        """
+        path, headers = makeProxyRequest(getRequestProxy(self.proxies, key), key, path, headers)
+        connection: tuple[asyncio.StreamReader, asyncio.StreamWriter]|None = self.acquire(key)
+        reused: bool = connection is not None
+        try:
+            connection = connection or await self.connect(key)
+            return await self.exchange(key, connection, method, path, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError, http.client.BadStatusLine) as e:
+            if connection:
+                connection[1].close()
+            if not reused:
+                raise urllib.error.URLError(e)
+            logging.info(f"Pooled connection to '{key[1]}' went stale. Reconnecting...")
+        except TimeoutError:
+            if connection:
+                connection[1].close()
+            raise
+        except OSError as e:
+            if connection:
+                connection[1].close()
+            raise urllib.error.URLError(e)
+
+        connection = None
+        try:
+            connection = await self.connect(key)
+            return await self.exchange(key, connection, method, path, headers, body)
+        except TimeoutError:
+            if connection:
+                connection[1].close()
+            raise
+        except (OSError, asyncio.IncompleteReadError, http.client.HTTPException) as e:
+            if connection:
+                connection[1].close()
+            raise urllib.error.URLError(e)
+
+
+    def acquire(self, key: tuple[str, str, int]) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]|None:
+        """
+        Returns an idle connection to the host if there is one which the server has not closed
+        """
+        idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = self.connections.get(key, [])
+        while idle:
+            connection: tuple[asyncio.StreamReader, asyncio.StreamWriter] = idle.pop()
+            if not connection[0].at_eof() and not connection[1].is_closing():
+                self.hits += 1
+                return connection
+            connection[1].close()
+        self.misses += 1
+        return None
+
+
+    async def connect(self, key: tuple[str, str, int]) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        scheme, host, port = key
+        proxy: tuple[str, int, str|None]|None = getRequestProxy(self.proxies, key)
+        if proxy:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(proxy[0], proxy[1]), self.timeout)
+            if scheme == "https":
+                try:
+                    await asyncio.wait_for(self.tunnel(reader, writer, host, port, proxy[2]), self.timeout)
+                except BaseException:
+                    writer.close()
+                    raise
+            return reader, writer
+        if scheme == "https":
+            return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=self.ssl_context, server_hostname=host), self.timeout)
+        return await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+
+
+    async def tunnel(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, port: int, proxy_auth: str|None) -> None:
+        """
+        Asks a proxy to open a tunnel to the host with CONNECT, then starts TLS with the host through it
+        """
+        host_port: str = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+        lines: list[str] = [f"CONNECT {host_port} HTTP/1.1", f"Host: {host_port}"]
+        if proxy_auth:
+            lines.append(f"Proxy-Authorization: {proxy_auth}")
+        writer.write("\r\n".join(lines).encode("latin-1") + b"\r\n\r\n")
+        await writer.drain()
+        status_line: bytes = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass # The headers of the proxy's response do not matter
+        parts: list[str] = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or parts[1] != "200":
+            raise OSError(f"Proxy tunnel failed: {status_line.decode('latin-1').strip()}")
+        await writer.start_tls(self.ssl_context, server_hostname=host)
+
+
+    async def exchange(self, key: tuple[str, str, int], connection: tuple[asyncio.StreamReader, asyncio.StreamWriter], method: str, path: str, headers: dict, body: bytes|None) -> "AsyncPooledResponse":
+        """
+        Writes a request to the connection and reads the status line and headers of the response
+        """
+        reader, writer = connection
+        scheme, host, port = key
+        host_header: str = f"[{host}]" if ":" in host else host
+        if port != (443 if scheme == "https" else 80):
+            host_header = f"{host_header}:{port}"
+        lines: list[str] = [f"{method} {path} HTTP/1.1", f"Host: {host_header}", "Accept-Encoding: identity"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        writer.write("\r\n".join(lines).encode("latin-1") + b"\r\n\r\n" + (body or b""))
+        await asyncio.wait_for(writer.drain(), self.timeout)
+
+        status_line: bytes = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server")
+        parts: list[str] = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise http.client.BadStatusLine(status_line.decode("latin-1"))
+        header_lines: list[bytes] = []
+        while True:
+            line: bytes = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            header_lines.append(line)
+        response_headers: http.client.HTTPMessage = email.parser.BytesParser(_class=http.client.HTTPMessage).parsebytes(b"".join(header_lines))
+        return AsyncPooledResponse(self, key, connection, int(parts[1]), parts[2] if len(parts) > 2 else "", response_headers, parts[0], method)
+
+
+    def release(self, key: tuple[str, str, int], connection: tuple[asyncio.StreamReader, asyncio.StreamWriter], response: "AsyncPooledResponse") -> None:
+        """
+        Returns a connection to the pool if its response has been fully read and the server is keeping it alive.
+        Otherwise the connection is closed.
+        """
+        if not response.complete or response.will_close:
+            connection[1].close()
+            return
+        idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = self.connections.setdefault(key, [])
+        if len(idle) < POOL_IDLE_CONNECTIONS_MAX:
+            idle.append(connection)
+            return
+        connection[1].close()
+
+
+    async def close(self) -> None:
+        """
+        Closes all idle connections
+        """
+        writers: list[asyncio.StreamWriter] = [connection[1] for idle in self.connections.values() for connection in idle]
+        self.connections = {}
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass # The server closing first is fine
+
+
+class AsyncPooledResponse():
+    """
+    A response from an AsyncHTTPConnectionPool. Has the same helpers as PooledResponse, but reading the body is async.
+    Closing it hands the connection back to the pool if the whole body was read.
+    """
+    def __init__(self, pool: AsyncHTTPConnectionPool, key: tuple[str, str, int], connection: tuple[asyncio.StreamReader, asyncio.StreamWriter], status: int, reason: str, headers: http.client.HTTPMessage, version: str, method: str):
+        self.pool: AsyncHTTPConnectionPool = pool
+        self.key: tuple[str, str, int] = key
+        self.connection: tuple[asyncio.StreamReader, asyncio.StreamWriter]|None = connection
+        self.url: str = ""
+        self.status: int = status
+        self.reason: str = reason
+        self.headers: http.client.HTTPMessage = headers
+        # Work out where the body ends: after Content-Length bytes, the last chunk, or when the server closes the connection
+        self.chunked: bool = "chunked" in (headers.get("Transfer-Encoding") or "").lower()
+        self.chunk_left: int = 0 # Bytes left in the current chunk
+        self.length: int|None = None # Bytes left in the body, if known
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            self.length = 0
+        elif not self.chunked:
+            content_length: str = (headers.get("Content-Length") or "").strip()
+            self.length = int(content_length) if content_length.isdigit() else None
+        connection_header: str = (headers.get("Connection") or "").lower()
+        self.will_close: bool = "close" in connection_header or (version == "HTTP/1.0" and "keep-alive" not in connection_header) or (not self.chunked and self.length is None)
+        self.complete: bool = self.length == 0 # If the whole body has been read
+
+
+    async def read(self, amt: int=-1) -> bytes:
+        """
+        Reads up to amt bytes of the body, or all of the rest of it if amt is not given.
+        Returns b'' at the end of the body, or if the server closed the connection early.
+        """
+        if amt < 0:
+            chunks: list[bytes] = []
+            while chunk := await self.read(DOWNLOAD_CHUNK_SIZE):
+                chunks.append(chunk)
+            return b"".join(chunks)
+        if self.complete or not self.connection:
+            return b""
+        reader: asyncio.StreamReader = self.connection[0]
+        timeout: float = self.pool.timeout
+
+        if self.chunked:
+            if self.chunk_left == 0:
+                line: bytes = await asyncio.wait_for(reader.readline(), timeout)
+                try:
+                    self.chunk_left = int(line.split(b";")[0].strip(), 16)
+                except ValueError:
+                    self.will_close = True
+                    return b""
+                if self.chunk_left == 0:
+                    # Last chunk. Skip any trailers.
+                    while await asyncio.wait_for(reader.readline(), timeout) not in (b"\r\n", b"\n", b""):
+                        pass
+                    self.complete = True
+                    return b""
+            data: bytes = await asyncio.wait_for(reader.read(min(amt, self.chunk_left)), timeout)
+            if not data:
+                self.will_close = True
+                return b""
+            self.chunk_left -= len(data)
+            if self.chunk_left == 0:
+                await asyncio.wait_for(reader.readline(), timeout) # The line break after each chunk
+            return data
+
+        data = await asyncio.wait_for(reader.read(amt if self.length is None else min(amt, self.length)), timeout)
+        if self.length is None:
+            self.complete = not data
+            return data
+        if not data:
+            self.will_close = True
+            return b""
+        self.length -= len(data)
+        self.complete = self.length == 0
+        return data
+
+
+    def getheader(self, name: str, default: str|None=None) -> str|None:
+        return self.headers.get(name, default)
+
+
+    def geturl(self) -> str:
+        return self.url
+
+
+    def close(self) -> None:
+        if self.connection:
+            self.pool.release(self.key, self.connection, self)
+            self.connection = None
+
+
+async def downloadURLAsync(url: str, pool: AsyncHTTPConnectionPool, headers: dict=DEFAULT_DOWNLOAD_HEADERS, data: bytes|None=None, tries: int=DOWNLOAD_TRIES_MAX, rate_limiter: RateLimiter|None=None) -> AsyncPooledResponse:
+    """
+    The asyncio version of downloadURL. Retries the same way, without holding up other downloads while it waits.
+    Returns the open response.
+    Raises DownloadError on error.
+    """
+    last_error: DownloadError = DownloadError("Did not attempt download")
+    for attempt in range(1, tries+1):
+        if rate_limiter:
+            await rate_limiter.waitAsync()
+        try:
+            logging.info(f"Downloading '{url}' (Attempt {attempt})")
+            return await pool.request("POST" if data is not None else "GET", url, headers, data)
+        except Exception as e:
+            last_error = makeRequestError(url, e)
+
+        wait: float|None = getRequestRetryWait(last_error, attempt, tries, rate_limiter)
+        if wait is None:
+            break
+        await asyncio.sleep(wait)
+
+    logging.error(f"Download exceeded maximum retries: {last_error}")
+    raise last_error
+
+
+async def requestModFilesAsync(fileIDs: list[str], pool: AsyncHTTPConnectionPool, api_url: str=CURSEFORGE_API_URL_DEFAULT) -> dict[str, dict]:
+    """
+    The asyncio version of requestModFiles
+    """
+    body: bytes = json.dumps({"fileIds": [int(x) for x in fileIDs]}).encode("utf-8")
+    headers: dict = fixHeader(API_DOWNLOAD_HEADERS)
+    headers["Content-Type"] = "application/json"
+    response: AsyncPooledResponse = await downloadURLAsync(makeModFilesBulkLink(api_url), pool, headers, body, rate_limiter=api_rate_limiter)
+    try:
+        mod_files: list[dict] = json.loads((await response.read()).decode("utf-8"))["data"]
+    finally:
+        response.close()
+    return {str(x["id"]): x for x in mod_files}
+
+
+async def requestModDownloadLinkAsync(projectID: str, fileID: str, pool: AsyncHTTPConnectionPool, api_url: str=CURSEFORGE_API_URL_DEFAULT, tries: int=DOWNLOAD_TRIES_MAX) -> str:
+    """
+    The asyncio version of requestModDownloadLink
+    """
+    try:
+        response: AsyncPooledResponse = await downloadURLAsync(makeModLocationDownloadLink(projectID, fileID, api_url), pool, fixHeader(API_DOWNLOAD_HEADERS), tries=tries, rate_limiter=api_rate_limiter)
+    except DownloadError as e:
+        # Failed to download the url
+        raise DownloadError(f"Failed to retrieve mod download location: {e}", e.code, e.retry_after)
+
+    # The response should contain the link to download the mod.
+    try:
+        link: str = json.loads((await response.read()).decode('utf-8'))["data"]
+    finally:
+        response.close()
+    return link
+
+
+async def downloadModAsync(mod: dict, fpath_mods_temp: str, fpath_partial: str, pool: AsyncHTTPConnectionPool, api_url: str=CURSEFORGE_API_URL_DEFAULT) -> str:
+    """
+    The asyncio version of downloadMod
+    """
+    link: str|None = mod.get("downloadUrl")
+    if not link:
+        link = await requestModDownloadLinkAsync(mod["projectID"], mod["fileID"], pool, api_url, tries=1)
+    download_link: str = quoteDownloadLink(link)
+
+    # Stream the bytes to a partial file, carrying on from any earlier attempt
+    fpath_part: str = os.path.join(fpath_partial, f"{makeModCacheKey(mod['projectID'], mod['fileID'])}{DOWNLOAD_PART_SUFFIX}")
+    try:
+        final_url: str = await downloadURLToFileAsync(download_link, fpath_part, pool, tries=1, size=mod.get("fileLength"))
+    except DownloadError as e:
+        # Failed to retrieve the mod
+        raise DownloadError(f"Failed to download mod: {e}", e.code, e.retry_after)
+
+    # Move the completed download into place
+    mod_name: str = makeModFileName(mod, final_url)
+    await asyncio.to_thread(os.replace, fpath_part, os.path.join(fpath_mods_temp, mod_name))
+    return mod_name
+
+
+async def downloadURLToFileAsync(url: str, fpath_part: str, pool: AsyncHTTPConnectionPool, headers: dict=DEFAULT_DOWNLOAD_HEADERS, tries: int=DOWNLOAD_TRIES_MAX, size: int|None=None, segmented: bool=False) -> str:
+    """
+    The asyncio version of downloadURLToFile, resuming partial downloads and splitting large files into segments the same way.
+    File I/O is done on another thread so a slow disk does not hold up every other download.
+    Returns the final URL after any redirects. The caller is responsible for moving the completed file into place.
+    Raises DownloadError on error.
+    """
+    download: PartialDownload = PartialDownload(url, fpath_part, headers)
+    request_headers: dict = await asyncio.to_thread(download.prepare)
+    if download.shouldSegment(size, segmented):
+        final_url: str|None = await downloadURLSegmentedAsync(url, fpath_part, pool, headers, tries)
+        if final_url:
+            return final_url
+
+    try:
+        response: AsyncPooledResponse = await downloadURLAsync(url, pool, request_headers, tries=tries)
+    except DownloadError as e:
+        if not download.shouldRestart(e):
+            raise
+        await asyncio.to_thread(removePartialDownload, fpath_part)
+        return await downloadURLToFileAsync(url, fpath_part, pool, headers, tries, size, segmented)
+
+    try:
+        await asyncio.to_thread(download.start, response)
+        size_written: int = await writeResponseToFileAsync(response, fpath_part, download.offset)
+    except:
+        await asyncio.to_thread(download.fail)
+        raise
+    finally:
+        response.close()
+    await asyncio.to_thread(download.finish, size_written)
+    return response.geturl()
+
+
+async def downloadURLSegmentedAsync(url: str, fpath_part: str, pool: AsyncHTTPConnectionPool, headers: dict=DEFAULT_DOWNLOAD_HEADERS, tries: int=DOWNLOAD_TRIES_MAX) -> str|None:
+    """
+    The asyncio version of downloadURLSegmented, with each segment downloaded by its own task.
+    Returns the final URL after any redirects, or None if the file should be downloaded normally instead.
+    Raises DownloadError on error.
+    """
+    response: AsyncPooledResponse = await downloadURLAsync(url, pool, makeRangeProbeHeaders(headers), tries=tries)
+    try:
+        probe: tuple[int, str|None]|None = readRangeProbe(response, url)
+        if not probe:
+            return None
+        try:
+            await response.read()
+        except OSError as e:
+            # Only the headers are needed, so a cut off body does not matter. The connection is not reused.
+            logging.info(f"Range probe of '{url}' was cut off: {e}")
+        final_url: str = response.geturl()
+    finally:
+        response.close()
+    size, validator = probe
+    segments: list[tuple[int, int]] = planSegments(size)
+    if not segments:
+        return None
+
+    segment_headers: dict = makeSegmentHeaders(headers, validator)
+    logging.info(f"Downloading '{final_url}' ({size} bytes) in {len(segments)} segments")
+    await asyncio.to_thread(prepareSegmentedFile, fpath_part, size)
+    tasks: list[asyncio.Task] = [asyncio.create_task(downloadSegmentAsync(final_url, fpath_part, start, end, segment_headers, pool, tries)) for start, end in segments]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception as e:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(removePartialDownload, fpath_part)
+        if not shouldFallBackFromSegments(e, url):
+            raise
+        return None
+    return final_url
+
+
+async def downloadSegmentAsync(url: str, fpath_part: str, start: int, end: int, headers: dict, pool: AsyncHTTPConnectionPool, tries: int) -> None:
+    """
+    The asyncio version of downloadSegment
+    """
+    position: int = start
+    last_error: Exception = DownloadError("Did not attempt segment download")
+    for attempt in range(1, tries+1):
+        try:
+            response: AsyncPooledResponse = await downloadURLAsync(url, pool, makeSegmentRangeHeaders(headers, position, end), tries=1)
+            try:
+                checkSegmentResponse(response, url, position, end)
+                f: typing.BinaryIO = await asyncio.to_thread(openPartialFile, fpath_part, position, False)
+                try:
+                    while position <= end and (data := await response.read(min(DOWNLOAD_CHUNK_SIZE, end-position+1))):
+                        await asyncio.to_thread(f.write, data)
+                        position += len(data)
+                finally:
+                    await asyncio.to_thread(f.close)
+            finally:
+                response.close()
+            if position > end:
+                return
+            last_error = DownloadError(f"Segment {start}-{end} truncated at byte {position}: {url}")
+        except Exception as e:
+            last_error = makeSegmentError(e, start, end, position)
+        logging.info(f"Segment {start}-{end} of '{url}' failed (Attempt {attempt}): {last_error}")
+    raise last_error
+
+
+async def writeResponseToFileAsync(response: AsyncPooledResponse, fpath_dest: str, offset: int=0) -> int:
+    """
+    The asyncio version of writeResponseToFile. Opening and writing the file is done on another thread.
+    Returns the size of the file.
+    """
+    size: int = 0
+    try:
+        f: typing.BinaryIO = await asyncio.to_thread(openPartialFile, fpath_dest, offset)
+        try:
+            while data := await response.read(DOWNLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(f.write, data)
+                size += len(data)
+        finally:
+            await asyncio.to_thread(f.close)
+        checkResponseLength(response, offset, size)
+    except Exception as e:
+        raise makeWriteError(e, offset, size)
+    finally:
+        response.close()
+    return offset + size
+
+
+class AsyncDownloadData(DownloadThreadData):
+    """
+    The download state for the asyncio download engine.
+    Tasks wait on an asyncio event rather than the condition used by threads. Everything runs on the event loop
+    (other than the verify pool, which hands back to the loop), so the state is never touched by two threads at once.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed: asyncio.Event = asyncio.Event() # Set whenever the mod queue or the number of mods done changes
+        self.verify_tasks: set[asyncio.Task] = set()
+
+
+    def notify(self) -> None:
+        """
+        Wakes up every task waiting for the mod queue to change
+        """
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+    async def wait(self, timeout: float|None=None) -> None:
+        """
+        Waits until the mod queue changes or the timeout passes
+        """
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except TimeoutError:
+            pass
+
+
+    async def queueModAsync(self, mod_num: int) -> None:
+        """
+        The asyncio version of queueMod
+        """
+        time_start: float = time.perf_counter()
+        while len(self.mod_queue) >= TRANSFER_QUEUE_MAX:
+            await self.wait()
+        self.resolve_wait_seconds += time.perf_counter() - time_start
+        heapq.heappush(self.mod_queue, (0.0, mod_num, 1))
+        self.queue_depth_max = max(self.queue_depth_max, len(self.mod_queue))
+        self.notify()
+
+
+    async def takeModAsync(self) -> tuple[int, int]|None:
+        """
+        The asyncio version of takeMod
+        """
+        time_start: float = time.perf_counter()
+        while True:
+            if self.mods_done >= self.mods_total:
+                return None
+            now: float = time.time()
+            if self.mod_queue and self.mod_queue[0][0] <= now:
+                _, mod_num, attempt = heapq.heappop(self.mod_queue)
+                self.mod_started.setdefault(mod_num, time.perf_counter())
+                self.transfer_wait_seconds += time.perf_counter() - time_start
+                # There is room in the queue for the resolve tasks again
+                self.notify()
+                return mod_num, attempt
+            # Nothing ready. Either wait for a retry to come due, a mod to be resolved or for another task to finish.
+            await self.wait(self.mod_queue[0][0] - now if self.mod_queue else None)
+
+
+    def retryMod(self, mod_num: int, attempt: int, delay: float) -> None:
+        super().retryMod(mod_num, attempt, delay)
+        self.notify()
+
+
+    def finishMod(self, mod_num: int) -> None:
+        super().finishMod(mod_num)
+        self.notify()
+
+
+async def downloadModsAsync(thread_data: AsyncDownloadData, download_task_count: int, resolve_task_count: int) -> None:
+    """
+    Runs one round of downloads with an asyncio task per resolve and download worker, showing progress until every mod is done.
+    Works the same as runDownloadThreads, but all the transfers share a single thread,
+    so far more downloads can be kept going at once without a thread and its memory for each.
+    """
+    pool: AsyncHTTPConnectionPool = AsyncHTTPConnectionPool()
+    tasks: list[asyncio.Task] = []
+    try:
+        # Spawn resolve tasks, but no more than there are batches to resolve
+        for i in range(0, min(resolve_task_count, len(thread_data.resolve_queue))):
+            tasks.append(asyncio.create_task(resolveModsTask(thread_data, pool)))
+        # Spawn download tasks
+        for i in range(0, download_task_count):
+            tasks.append(asyncio.create_task(downloadModsTask(thread_data, pool)))
+
+        # Wait for download tasks to do their job and update progesss bar
+        while thread_data.mods_done < thread_data.mods_total:
+            await asyncio.sleep(0.1)
+            for task in tasks:
+                if task.done() and task.exception():
+                    # A task died without finishing its mods. They would never be done.
+                    raise task.exception()
+            thread_data.sampleQueueDepth()
+            if thread_data.controller:
+                thread_data.controller.update()
+                thread_data.notify()
+            writeProgressBar(thread_data.mods_done, thread_data.mods_total)
+
+        # Everything appears to be downloaded.
+        # Clear the progress bar
+        print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+        logInfo("All downloads complete. Waiting for tasks to stop...")
+        await asyncio.gather(*tasks, *thread_data.verify_tasks)
+        print("> Done!")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await pool.close()
+    logging.info(f"Async connection pool: {pool.hits} requests reused a connection, {pool.misses} opened a new one")
+
+
+async def resolveModsTask(thread_data: AsyncDownloadData, pool: AsyncHTTPConnectionPool) -> None:
+    """
+    The asyncio version of resolveModsThread
+    """
+    while True:
+        batch: list[int]|None = thread_data.takeResolveBatch()
+        if batch is None:
+            break
+        time_start: float = time.perf_counter()
+        try:
+            batch_mods: list[dict] = [thread_data.mod_list[x] for x in batch]
+            try:
+                readModFilesInfo(batch_mods, await requestModFilesAsync([mod["fileID"] for mod in batch_mods], pool, thread_data.api_url))
+            except Exception as e:
+                logging.exception("Failed to resolve batch of mods")
+                logWarn(f"Failed to resolve {len(batch)} mods in bulk. They will be looked up individually: {e}")
+            time_batch: float = time.perf_counter() - time_start
+            for mod in batch_mods:
+                addModTiming(mod, "resolveSeconds", time_batch)
+                if mod.get("downloadUrl"):
+                    continue
+                time_mod: float = time.perf_counter()
+                try:
+                    mod["downloadUrl"] = await requestModDownloadLinkAsync(mod["projectID"], mod["fileID"], pool, thread_data.api_url)
+                except Exception as e:
+                    logging.warning(f"Failed to resolve mod {mod}, leaving it to the download tasks: {e}")
+                addModTiming(mod, "resolveSeconds", time.perf_counter() - time_mod)
+        finally:
+            run_report.span("resolve", "resolve", time_start, {"mods": len(batch)})
+            # Every mod has to reach the download tasks, or they would wait for it forever
+            for mod_num in batch:
+                await thread_data.queueModAsync(mod_num)
+
+
+async def downloadModsTask(thread_data: AsyncDownloadData, pool: AsyncHTTPConnectionPool) -> None:
+    """
+    The asyncio version of downloadModsThread
+    """
+    while True:
+        # Wait until the concurrency controller allows another download, if there is one
+        if thread_data.controller:
+            while not thread_data.controller.tryAcquire():
+                if thread_data.mods_done >= thread_data.mods_total:
+                    return
+                await thread_data.wait()
+        try:
+            if not await downloadNextModAsync(thread_data, pool):
+                break
+        finally:
+            if thread_data.controller:
+                thread_data.controller.release()
+                thread_data.notify()
+
+
+async def downloadNextModAsync(thread_data: AsyncDownloadData, pool: AsyncHTTPConnectionPool) -> bool:
     """
-    Returns a copy of the given header object with them fixed
+    The asyncio version of downloadNextMod
     """
-    h:  dict = headers.copy()
-    l = lambda x: base64.b64decode(x).decode("ascii")
-    h.update([(l(b'eC1hcGkta2V5'), l(b'JDJhJDEwJGJMNGJJTDVwVVdxZmNPN0tRdG5NUmVha3d0ZkhiTktoNnYxdVRwS2x6aHdvdWVFSlFuUG5t'))])
-    return h
+    # Get the next mod in the queue and download it
+    next_mod: tuple[int, int]|None = await thread_data.takeModAsync()
+    if next_mod is None:
+        return False
+    mod_num, attempt = next_mod
+    mod: dict = thread_data.mod_list[mod_num]
 
+    logging.info(f"Consuming mod {mod} (Attempt {attempt})...")
 
-def downloadForgeInstaller(minecraft_version: str, forge_version: str, fpath_install_temp: str) -> str:
-    """
-    Downloads and saves the specified forge version.
-    Returns the name of the installer
-    """
-    forge_file: str = makeForgeInstallerFileName(minecraft_version, forge_version)
-    forge_url: str = makeForgeInstallerDownloadLink(minecraft_version, forge_version)
+    # Check the cache before going anywhere near the network. Copying files blocks, so it is done on another thread.
+    if thread_data.mod_cache:
+        try:
+            mod_file: dict|None = await asyncio.to_thread(thread_data.mod_cache.fetch, mod["projectID"], mod["fileID"], thread_data.fpath_mods_temp)
+        except Exception as e:
+            logging.exception(f"Failed to fetch mod {mod} from cache")
+            mod_file = None
+        if mod_file:
+            mod["file"] = mod_file
+            addModTiming(mod, "cached", 1)
+            print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+            logInfo(f"[MOD {mod_num:04}] Found in cache: {mod_file['fileName']}")
+            thread_data.finishMod(mod_num)
+            return True
 
+    # Download the mod. Retries are handled by the mod queue and go straight to CurseForge.
+    time_start: float = time.perf_counter()
     try:
-        response_forge = downloadURL(forge_url)
+        mod_name: str|None = None
+        if thread_data.peers and attempt == 1:
+            mod_name = await thread_data.peers.fetchModAsync(mod, thread_data.fpath_mods_temp, thread_data.fpath_partial, pool)
+            if mod_name:
+                addModTiming(mod, "peer", 1)
+        if not mod_name:
+            mod_name = await downloadModAsync(mod, thread_data.fpath_mods_temp, thread_data.fpath_partial, pool, thread_data.api_url)
     except Exception as e:
-        logging.exception("Failed to download forge installer")
-        raise Exception("Failed to download forge installer")
+        recordModTransfer(thread_data, mod_num, attempt, time_start, None, e)
+        failMod(thread_data, mod_num, attempt, e)
+        return True
+    recordModTransfer(thread_data, mod_num, attempt, time_start, mod_name)
 
-    # Write forge to install temp
-    fpath_forge: str = os.path.join(fpath_install_temp, forge_file)
-    with open(fpath_forge, "wb") as f:
-        f.write(response_forge.read())
+    # Check the download in the background so this task can get on with the next one
+    task: asyncio.Task = asyncio.create_task(verifyModTask(thread_data, mod_num, attempt, mod_name))
+    thread_data.verify_tasks.add(task)
+    task.add_done_callback(thread_data.verify_tasks.discard)
+    return True
 
-    return forge_file
+
+async def verifyModTask(thread_data: AsyncDownloadData, mod_num: int, attempt: int, mod_name: str) -> None:
+    """
+    The asyncio version of verifyModThread. Hashing is done in the verify pool so it does not block the event loop.
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    mod: dict = thread_data.mod_list[mod_num]
+    fpath_mod: str = os.path.join(thread_data.fpath_mods_temp, mod_name)
+    time_start: float = time.perf_counter()
+    try:
+        mod_file: dict = await loop.run_in_executor(thread_data.verify_pool, verifyModFile, mod, fpath_mod)
+    except Exception as e:
+        await loop.run_in_executor(thread_data.verify_pool, removeBadDownload, fpath_mod)
+        failMod(thread_data, mod_num, attempt, e)
+        return
+    finally:
+        addModTiming(mod, "verifySeconds", time.perf_counter() - time_start)
+        run_report.span(f"verify {mod_num}", "verify", time_start)
+
+    mod["file"] = mod_file
+    print(f"{' '*int(PROGRESS_BAR_SIZE+30)}\r", end="")
+    logInfo(f"[MOD {mod_num:04}] Download successful: {mod_name}")
+    # Remember the mod for next time. Failing to do so is not fatal to the install.
+    if thread_data.mod_cache:
+        try:
+            await loop.run_in_executor(thread_data.verify_pool, thread_data.mod_cache.store, mod["projectID"], mod["fileID"], fpath_mod, mod_file["sha1"])
+        except Exception as e:
+            logging.exception(f"Failed to store mod {mod} in cache")
+    thread_data.finishMod(mod_num)
 
 
 # === Logging ===
@@ -604,7 +4010,8 @@ def logInfo(message: str) -> None:
     Because effort...
     """
     logging.info(message)
-    print(message)
+    # One write, so messages from other threads do not end up in the middle of the line
+    print(f"{message}\n", end="")
 
 
 def logWarn(message: str) -> None:
@@ -613,7 +4020,7 @@ def logWarn(message: str) -> None:
     Because effort...
     """
     logging.warning(message)
-    print(f"[WARN] {message}", file=sys.stderr)
+    print(f"[WARN] {message}\n", end="", file=sys.stderr)
 
 
 def logError(message: str) -> None:
@@ -622,7 +4029,7 @@ def logError(message: str) -> None:
     Because effort...
     """
     logging.error(message)
-    print(f"[ERROR] {message}", file=sys.stderr)
+    print(f"[ERROR] {message}\n", end="", file=sys.stderr)
 
 
 # === Prompts ===
@@ -731,8 +4138,15 @@ def readManifestFile(fpath_manifest: str) -> dict:
 
     # Read the manifest
     logging.info("Starting read")
-    with open(fpath_manifest, "r") as f:
-        manifest = json.load(f)
+    with open(fpath_manifest, "rb") as f:
+        return parseManifest(f.read())
+
+
+def parseManifest(data: bytes) -> dict:
+    """
+    Decodes the contents of a modpack manifest file and returns the JSON data
+    """
+    manifest = json.loads(data)
 
     # Ensure the decoded python object is what we are expecting
     manifest_type = type(manifest)
@@ -758,36 +4172,544 @@ def readManifestModList(manifest: dict) -> list[dict]:
     return output_list
 
 
+# === Install Lock ===
+def readInstallLock(fpath_install: str) -> dict|None:
+    """
+    Reads the lock file of a previous install.
+    Returns None if there is no usable lock file.
+    """
+    fpath_lock: str = os.path.join(fpath_install, INSTALL_LOCK_FILE)
+    if not os.path.isfile(fpath_lock):
+        logging.info(f"No install lock file at '{fpath_lock}'")
+        return None
+    try:
+        with open(fpath_lock, "r") as f:
+            install_lock: dict = json.load(f)
+        if install_lock.get("version") != INSTALL_LOCK_VERSION:
+            raise Exception(f"Unsupported install lock version '{install_lock.get('version')}'")
+        for lock_entry in install_lock["mods"]:
+            for key in ("projectID", "fileID", "fileName", "size", "sha1"):
+                if key not in lock_entry:
+                    raise Exception(f"Install lock entry missing '{key}'")
+        if not all(isinstance(x, str) for x in install_lock.get("overrides", [])):
+            raise Exception("Install lock overrides must be file paths")
+    except Exception as e:
+        logging.exception("Failed to read install lock file")
+        logWarn(f"Ignoring unreadable install lock file '{fpath_lock}': {e}")
+        return None
+    logging.info(f"Read install lock file with {len(install_lock['mods'])} mods")
+    return install_lock
+
+
+def writeInstallLock(fpath_install: str, modpack_name: str, modpack_version: str, lock_entries: list[dict], overrides: list[str]|None=None) -> None:
+    """
+    Writes the lock file listing every installed mod, and every installed override file relative to the install folder
+    """
+    install_lock: dict = {
+        "version": INSTALL_LOCK_VERSION,
+        "modpack": {"name": modpack_name, "version": modpack_version},
+        "mods": sorted(lock_entries, key=lambda x: (int(x["projectID"]), int(x["fileID"])))
+    }
+    if overrides is not None:
+        install_lock["overrides"] = sorted(overrides)
+    fpath_lock: str = os.path.join(fpath_install, INSTALL_LOCK_FILE)
+    fpath_lock_temp: str = f"{fpath_lock}.tmp"
+    with open(fpath_lock_temp, "w") as f:
+        json.dump(install_lock, f, indent=4)
+    os.replace(fpath_lock_temp, fpath_lock)
+    logging.info(f"Wrote install lock file '{fpath_lock}' with {len(lock_entries)} mods")
+
+
+def makeInstallLockEntry(mod: dict) -> dict:
+    return {"projectID": mod["projectID"], "fileID": mod["fileID"], **mod["file"]}
+
+
+def diffInstallLock(mod_list: list[dict], install_lock: dict, fpath_install_mods: str) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Compares the mods wanted by the manifest against what the lock file says is installed.
+    Mods are unchanged if the same file of the same project is installed and still has the size it was installed with.
+    Returns the mods which need downloading, the lock entries to keep and the lock entries to remove.
+    """
+    installed: dict[str, dict] = {makeModCacheKey(x["projectID"], x["fileID"]): x for x in install_lock["mods"]}
+    mods_download: list[dict] = []
+    mods_keep: list[dict] = []
+    for mod in mod_list:
+        lock_entry: dict|None = installed.get(makeModCacheKey(mod["projectID"], mod["fileID"]))
+        if lock_entry:
+            fpath_installed_mod: str = os.path.join(fpath_install_mods, lock_entry["fileName"])
+            if os.path.isfile(fpath_installed_mod) and os.path.getsize(fpath_installed_mod) == lock_entry["size"]:
+                mods_keep.append(lock_entry)
+                continue
+            logging.info(f"Installed mod '{fpath_installed_mod}' is missing or damaged")
+        mods_download.append(mod)
+    keep_ids: set[int] = {id(x) for x in mods_keep}
+    mods_remove: list[dict] = [x for x in install_lock["mods"] if id(x) not in keep_ids]
+    return mods_download, mods_keep, mods_remove
+
+
+def findDownloadedMods(mod_list: list[dict], fpath_install_temp: str) -> list[dict]|None:
+    """
+    Finds the mods a previous run downloaded into the temporary folder, using the lock file it wrote next to them.
+    Returns the lock entries of the mods, or None if any of them are missing or damaged.
+    """
+    if not mod_list:
+        return []
+    temp_lock: dict|None = readInstallLock(fpath_install_temp)
+    if not temp_lock:
+        return None
+    downloaded: dict[str, dict] = {makeModCacheKey(x["projectID"], x["fileID"]): x for x in temp_lock["mods"]}
+    fpath_mods_temp: str = os.path.join(fpath_install_temp, MODS_FOLDER)
+    lock_entries: list[dict] = []
+    for mod in mod_list:
+        lock_entry: dict|None = downloaded.get(makeModCacheKey(mod["projectID"], mod["fileID"]))
+        fpath_mod_temp: str|None = os.path.join(fpath_mods_temp, lock_entry["fileName"]) if lock_entry else None
+        if not fpath_mod_temp or not os.path.isfile(fpath_mod_temp) or os.path.getsize(fpath_mod_temp) != lock_entry["size"]:
+            logging.info(f"Mod {mod['projectID']}/{mod['fileID']} is missing from the temporary folder")
+            return None
+        lock_entries.append(lock_entry)
+    return lock_entries
+
+
+# === Offline Bundles ===
+def isBundle(fpath_source: str) -> bool:
+    """
+    Returns if the given file is an offline bundle rather than a modpack zip
+    """
+    if not os.path.isfile(fpath_source) or not zipfile.is_zipfile(fpath_source):
+        return False
+    with zipfile.ZipFile(fpath_source, 'r') as f:
+        return BUNDLE_INDEX_FILE in f.namelist()
+
+
+def readBundleIndex(fpath_bundle: str) -> dict:
+    """
+    Reads the index of an offline bundle, listing the modpack, mods and forge installer in it along with their hashes
+    """
+    logging.info(f"Reading bundle index from '{fpath_bundle}'")
+    with zipfile.ZipFile(fpath_bundle, 'r') as f:
+        index: dict = json.loads(f.read(BUNDLE_INDEX_FILE))
+    if index.get("version") != BUNDLE_INDEX_VERSION:
+        raise Exception(f"Unsupported bundle index version '{index.get('version')}'")
+    # Bundles come from other machines, so their file names must not be able to point outside of where they are extracted
+    names: list[str] = [index["modpack"]["fileName"]] + [x["fileName"] for x in index["mods"]]
+    if index["forge"]:
+        names.append(index["forge"]["fileName"])
+    for name in names:
+        if not isPlainFileName(name):
+            raise Exception(f"Bundle index has unsafe file name '{name}'")
+    if index["forge"] and index["forge"]["fileName"] != makeForgeInstallerFileName(index["minecraftVersion"], index["forgeVersion"]):
+        raise Exception(f"Bundle forge installer '{index['forge']['fileName']}' does not match forge {index['forgeVersion']} for Minecraft {index['minecraftVersion']}")
+    return index
+
+
+def writeBundle(fpath_bundle: str, fpath_modpack: str, minecraft_version: str, forge_version: str, mod_list: list[dict], fpath_mods_temp: str, fpath_forge: str|None=None) -> int:
+    """
+    Writes an offline bundle holding the modpack zip, every downloaded mod and the forge installer (if given), along
+    with an index of their file names and hashes so the bundle can be installed without any network access.
+    Mods are stored under their SHA1 hash so mods with identical contents are only stored once. Everything is stored
+    without compression as jars and zips are already compressed.
+    The bundle is written under a temporary name first so a half written bundle is never left behind.
+    Returns the size of the bundle in bytes.
+    """
+    index: dict = {
+        "version": BUNDLE_INDEX_VERSION,
+        "app": appVersionStr(),
+        "minecraftVersion": minecraft_version,
+        "forgeVersion": forge_version,
+        "modpack": {"fileName": os.path.basename(fpath_modpack), "sha1": hashFile(fpath_modpack)},
+        "forge": {"fileName": os.path.basename(fpath_forge), "sha1": hashFile(fpath_forge)} if fpath_forge else None,
+        "mods": [makeInstallLockEntry(x) for x in mod_list]
+    }
+    fpath_bundle_temp: str = f"{fpath_bundle}.tmp"
+    with zipfile.ZipFile(fpath_bundle_temp, 'w', zipfile.ZIP_STORED) as f:
+        f.writestr(BUNDLE_INDEX_FILE, json.dumps(index, indent=4))
+        f.write(fpath_modpack, f"{BUNDLE_MODPACK_FOLDER}/{index['modpack']['fileName']}")
+        if fpath_forge:
+            f.write(fpath_forge, f"{BUNDLE_FORGE_FOLDER}/{index['forge']['fileName']}")
+        written: set[str] = set()
+        for entry in index["mods"]:
+            if entry["sha1"] not in written:
+                written.add(entry["sha1"])
+                f.write(os.path.join(fpath_mods_temp, entry["fileName"]), f"{BUNDLE_MODS_FOLDER}/{entry['sha1']}")
+    os.replace(fpath_bundle_temp, fpath_bundle)
+    logging.info(f"Wrote bundle '{fpath_bundle}' with {len(index['mods'])} mods in {len(written)} files")
+    return os.path.getsize(fpath_bundle)
+
+
+def extractBundle(fpath_bundle: str, index: dict, fpath_dest: str) -> str:
+    """
+    Extracts the modpack zip and the forge installer (if any) out of an offline bundle, checking their hashes.
+    The forge installer is laid out like the forge installer cache so installForge can take it from there.
+    fpath_dest: This folder will be wiped.
+    Returns the path of the extracted modpack zip.
+    """
+    if not regenerateFolder(fpath_dest):
+        logError(f"Failed to prepare bundle folder '{fpath_dest}'")
+        raise Exception("Failed to prepare bundle folder")
+    with zipfile.ZipFile(fpath_bundle, 'r') as f:
+        fpath_modpack: str = os.path.join(fpath_dest, index["modpack"]["fileName"])
+        extractBundleFile(f, f"{BUNDLE_MODPACK_FOLDER}/{index['modpack']['fileName']}", fpath_modpack, index["modpack"]["sha1"])
+        if index["forge"]:
+            fpath_forge: str = os.path.join(fpath_dest, BUNDLE_FORGE_FOLDER, index["forge"]["fileName"])
+            os.makedirs(os.path.dirname(fpath_forge), exist_ok=True)
+            extractBundleFile(f, f"{BUNDLE_FORGE_FOLDER}/{index['forge']['fileName']}", fpath_forge, index["forge"]["sha1"])
+            with open(f"{fpath_forge}{FORGE_CACHE_HASH_SUFFIX}", "w") as f_hash:
+                f_hash.write(index["forge"]["sha1"])
+    return fpath_modpack
+
+
+def installBundleMods(fpath_bundle: str, index: dict, mod_list: list[dict], fpath_install_temp: str) -> bool:
+    """
+    Takes mods out of an offline bundle instead of downloading them, checking each one against the hash in the index.
+    Mods are extracted to the mods folder in the install temp folder, where the download loop would have put them.
+    Returns if every mod was found in the bundle and was intact.
+    """
+    fpath_mods_temp: str = os.path.join(fpath_install_temp, MODS_FOLDER)
+    if not regenerateFolder(fpath_mods_temp):
+        logError(f"Failed to prepare download folder '{fpath_mods_temp}'")
+        raise Exception("Failed to prepare download folder")
+
+    entries: dict[str, dict] = {makeModCacheKey(x["projectID"], x["fileID"]): x for x in index["mods"]}
+    error_count: int = 0
+    with zipfile.ZipFile(fpath_bundle, 'r') as f:
+        for mod_num, mod in enumerate(mod_list):
+            entry: dict|None = entries.get(makeModCacheKey(mod["projectID"], mod["fileID"]))
+            if not entry:
+                logError(f"[MOD {mod_num:04d}] Project {mod['projectID']} file {mod['fileID']} is not in the bundle")
+                error_count += 1
+                continue
+            try:
+                extractBundleFile(f, f"{BUNDLE_MODS_FOLDER}/{entry['sha1']}", os.path.join(fpath_mods_temp, entry["fileName"]), entry["sha1"])
+            except Exception as e:
+                logging.exception(f"Failed to take mod {mod_num} out of the bundle")
+                logError(f"[MOD {mod_num:04d}] {e}")
+                error_count += 1
+                continue
+            mod["file"] = {"fileName": entry["fileName"], "size": entry["size"], "sha1": entry["sha1"]}
+            writeProgressBar(mod_num + 1, len(mod_list))
+    print()
+    if error_count:
+        logError(f"Failed to install {error_count} mods from the bundle")
+        return False
+    return True
+
+
+def extractBundleFile(zip_file: zipfile.ZipFile, name: str, fpath_target: str, file_hash: str) -> None:
+    """
+    Extracts a single file out of a bundle, hashing it on the way out.
+    Raises an exception and removes the file if its SHA1 hash does not match the one given.
+    """
+    h = hashlib.sha1()
+    with zip_file.open(name) as f_source, open(fpath_target, "wb") as f_target:
+        while chunk := f_source.read(ZIP_EXTRACT_CHUNK_SIZE):
+            h.update(chunk)
+            f_target.write(chunk)
+    if h.hexdigest() != file_hash:
+        os.remove(fpath_target)
+        raise Exception(f"'{name}' in the bundle has hash '{h.hexdigest()}' but should be '{file_hash}'")
+
+
 # === File Handling ===
-def unzipToDir(fpath_source: str, fpath_dest: str) -> None:
+def unzipManifest(fpath_source: str, fpath_dest: str) -> dict:
     """
-    Unzips a source file to the destination path.
+    Reads the manifest straight out of a modpack zip without extracting anything else.
+    Overrides are extracted later, straight to where they are installed.
     fpath_source: A file path to the zip file.
-    fpath_dest: Path to the destination folder. This folder will be wiped before extraction.
+    fpath_dest: Path to the destination folder. This folder will be wiped and a copy of the manifest
+    kept in it for later runs which skip unzipping, except for partial downloads which are kept so they can be resumed
+    and anything taken out of an offline bundle.
+    Returns the manifest JSON data.
     """
-    logging.info(f"Unzipping '{fpath_source}' => {fpath_dest}")
+    logging.info(f"Reading manifest from '{fpath_source}' => {fpath_dest}")
     # Ensure the source file to unzip exists
     if not os.path.isfile(fpath_source):
         logError(f"Bad file provided as zip source '{fpath_source}'")
         raise Exception("Bad path for source zip file")
 
-    if not regenerateFolder(fpath_dest):
+    with zipfile.ZipFile(fpath_source, 'r') as f:
+        data: bytes = f.read(MANIFEST_FILE)
+    manifest: dict = parseManifest(data)
+
+    # Mods downloaded by the last run are kept for -nodownload. Downloading mods clears them out anyway.
+    if not regenerateFolder(fpath_dest, [PARTIAL_FOLDER, BUNDLE_FOLDER, MODS_FOLDER, INSTALL_LOCK_FILE]):
         # Was not able to prepare unzip folder
         logError(f"Failed to prepare unzip location '{fpath_dest}'")
         raise Exception("Failed to prepare unzip location")
+    with open(os.path.join(fpath_dest, MANIFEST_FILE), "wb") as f:
+        f.write(data)
+    logging.info(f"Successfully read manifest")
+    return manifest
+
 
-    # Actually unzip
-    logging.info(f"Unzipping '{fpath_source}'")
+def listZipFolder(fpath_source: str, folder: str) -> dict[str, dict]:
+    """
+    Lists the files (not directories) in the given top level folder of a zip file.
+    Returns a map of each file's path relative to the folder to its entry name, size, modification time and CRC32.
+    """
+    files: dict[str, dict] = {}
     with zipfile.ZipFile(fpath_source, 'r') as f:
-        f.extractall(fpath_dest)
-    logging.info(f"Successfully unzipped")
+        for member in f.infolist():
+            if not member.filename.startswith(f"{folder}/") or member.is_dir():
+                continue
+            fpath_relative: str|None = makeSafeRelativePath(member.filename[len(folder)+1:])
+            if not fpath_relative:
+                logWarn(f"Skipping unsafe zip entry '{member.filename}'")
+                continue
+            files[fpath_relative] = {"member": member.filename, "size": member.file_size, "mtime": time.mktime(member.date_time + (0, 0, -1)), "crc": member.CRC}
+    return files
+
+
+def listFolder(fpath_folder: str) -> dict[str, dict]:
+    """
+    Lists every file under a folder.
+    Returns a map of each file's path relative to the folder to its size and modification time.
+    """
+    files: dict[str, dict] = {}
+    for fpath_root, _, file_names in os.walk(fpath_folder):
+        for file_name in file_names:
+            fpath_file: str = os.path.join(fpath_root, file_name)
+            stat: os.stat_result = os.stat(fpath_file)
+            files[os.path.relpath(fpath_file, fpath_folder).replace(os.sep, "/")] = {"size": stat.st_size, "mtime": stat.st_mtime, "crc": None}
+    return files
+
+
+def syncZipFolder(fpath_source: str, folder: str, files: dict[str, dict], fpath_dest: str, check_hash: bool=False, thread_count: int=ZIP_EXTRACT_THREADS) -> tuple[int, int]:
+    """
+    Extracts the given files (as listed by listZipFolder) from a zip file straight into the destination folder,
+    skipping files which are already there and unchanged. Files are given the modification time stored in the zip
+    so they are recognised as unchanged next time.
+    Large amounts of files are extracted by a pool of threads. Decompressing releases the GIL so this scales.
+    Returns the number of files and bytes extracted.
+    """
+    logging.info(f"Syncing '{fpath_source}/{folder}' => '{fpath_dest}'")
+    changed: list[str] = []
+    for fpath_relative, file in files.items():
+        fpath_target: str = makeFolderPath(fpath_dest, fpath_relative)
+        if isFileUnchanged(fpath_target, file, check_hash):
+            continue
+        if os.path.isfile(fpath_target) and os.path.getsize(fpath_target) == file["size"] and crc32File(fpath_target) == file["crc"]:
+            # Same contents with a different time, such as when the modpack zip was rebuilt. Only the time needs fixing.
+            os.utime(fpath_target, (file["mtime"], file["mtime"]))
+            continue
+        changed.append(fpath_relative)
+    size_total: int = sum(files[x]["size"] for x in changed)
+    if len(changed) < ZIP_EXTRACT_THREADED_FILES and size_total < ZIP_EXTRACT_THREADED_SIZE:
+        thread_count = 1
+
+    # Make all the directories up front so the threads do not race to make them
+    for fpath_relative in changed:
+        os.makedirs(os.path.dirname(makeFolderPath(fpath_dest, fpath_relative)), exist_ok=True)
+
+    with zipfile.ZipFile(fpath_source, 'r') as zip_file:
+        if thread_count <= 1:
+            for fpath_relative in changed:
+                extractZipMember(zip_file, files[fpath_relative], makeFolderPath(fpath_dest, fpath_relative))
+        else:
+            # Reads from a shared ZipFile are safe, each opened member seeks for itself
+            with concurrent.futures.ThreadPoolExecutor(thread_count, "unzip") as pool:
+                for future in [pool.submit(extractZipMember, zip_file, files[x], makeFolderPath(fpath_dest, x)) for x in changed]:
+                    future.result()
+    logging.info(f"Extracted {len(changed)} of {len(files)} files ({size_total} bytes) with {thread_count} threads")
+    return len(changed), size_total
+
+
+def extractZipMember(zip_file: zipfile.ZipFile, file: dict, fpath_target: str) -> None:
+    logging.info(f"Extracting file '{file['member']}' => '{fpath_target}'")
+    if os.path.isdir(fpath_target):
+        removeFile(fpath_target)
+    elif os.path.lexists(fpath_target):
+        os.remove(fpath_target)
+    with zip_file.open(file["member"], "r") as f_src, open(fpath_target, "wb") as f_dst:
+        shutil.copyfileobj(f_src, f_dst, ZIP_EXTRACT_CHUNK_SIZE)
+    os.utime(fpath_target, (file["mtime"], file["mtime"]))
+
+
+def syncFolder(fpath_src: str, files: dict[str, dict], fpath_dst: str, installer: "FileInstaller|None"=None, check_hash: bool=False) -> tuple[int, int]:
+    """
+    Copies the given files (as listed by listFolder) from the source folder to the destination folder,
+    skipping files which are already there and unchanged. Copies keep the modification time of the source.
+    Files are linked instead of copied where possible if given an installer which links.
+    Returns the number of files and bytes copied.
+    """
+    installer = installer or FileInstaller()
+    logging.info(f"Syncing '{fpath_src}' => '{fpath_dst}'")
+    count: int = 0
+    size_total: int = 0
+    for fpath_relative, file in files.items():
+        fpath_src_file: str = makeFolderPath(fpath_src, fpath_relative)
+        fpath_dst_file: str = makeFolderPath(fpath_dst, fpath_relative)
+        if check_hash and file["crc"] is None:
+            file["crc"] = crc32File(fpath_src_file)
+        if isFileUnchanged(fpath_dst_file, file, check_hash):
+            continue
+        os.makedirs(os.path.dirname(fpath_dst_file), exist_ok=True)
+        if os.path.isdir(fpath_dst_file):
+            removeFile(fpath_dst_file)
+        method: str = installer.install(fpath_src_file, fpath_dst_file)
+        logging.info(f"Installed file ({method}) '{fpath_src_file}' => '{fpath_dst_file}'")
+        count += 1
+        size_total += file["size"]
+    logging.info(f"Copied {count} of {len(files)} files ({size_total} bytes)")
+    return count, size_total
+
+
+def isFileUnchanged(fpath_file: str, file: dict, check_hash: bool=False) -> bool:
+    """
+    Returns if the file matches the expected size and modification time, and CRC32 if checking hashes.
+    """
+    try:
+        stat: os.stat_result = os.stat(fpath_file)
+    except OSError:
+        return False
+    if not os.path.isfile(fpath_file) or stat.st_size != file["size"] or abs(stat.st_mtime - file["mtime"]) > SYNC_MTIME_TOLERANCE:
+        return False
+    if check_hash and file["crc"] is not None:
+        return crc32File(fpath_file) == file["crc"]
+    return True
+
+
+def removeOldFiles(fpath_dest: str, files: dict[str, dict], files_previous: list[str]|None, folders: list[str]) -> int:
+    """
+    Removes files which are no longer wanted from the destination folder.
+    If the files installed last time are known, only those which are not wanted any more are removed.
+    Otherwise anything in the given sub folders which is not wanted is removed.
+    Returns the number of files removed.
+    """
+    fpath_unwanted: list[str] = []
+    if files_previous is not None:
+        for fpath_relative in files_previous:
+            fpath_relative = makeSafeRelativePath(fpath_relative)
+            if fpath_relative and fpath_relative not in files:
+                fpath_unwanted.append(makeFolderPath(fpath_dest, fpath_relative))
+    else:
+        for folder in folders:
+            fpath_folder: str = os.path.join(fpath_dest, folder)
+            if os.path.isdir(fpath_folder):
+                fpath_unwanted += [makeFolderPath(fpath_dest, f"{folder}/{x}") for x in listFolder(fpath_folder) if f"{folder}/{x}" not in files]
+
+    count: int = 0
+    for fpath_file in fpath_unwanted:
+        if os.path.isfile(fpath_file) or os.path.islink(fpath_file):
+            logging.info(f"Removing old file '{fpath_file}'")
+            os.remove(fpath_file)
+            count += 1
+    return count
+
+
+def makeSafeRelativePath(name: str) -> str|None:
+    """
+    Returns a relative path, using / as the separator, which cannot point outside of the folder it is relative to.
+    Like ZipFile.extract, absolute paths, drives and parent folder references are dropped.
+    Returns None if nothing is left of the path.
+    """
+    name = os.path.splitdrive(name.replace("\\", "/"))[1]
+    parts: list[str] = [x for x in name.split("/") if x not in ("", ".", "..")]
+    if not parts:
+        return None
+    return "/".join(parts)
+
+
+def isPlainFileName(name: str) -> bool:
+    """
+    Returns if a name from outside of the installer is a single file name, which cannot point into another folder
+    """
+    return isinstance(name, str) and "/" not in name and makeSafeRelativePath(name) == name
+
+
+def makeFolderPath(fpath_folder: str, fpath_relative: str) -> str:
+    return os.path.join(fpath_folder, *fpath_relative.split("/"))
+
+
+class FileInstaller():
+    """
+    Puts files in place by reflinking or hardlinking them to the source where possible instead of copying them.
+    Reflinks are copy-on-write copies which share storage with the source until either is changed.
+    Hardlinks are the same file as the source, so changes to one are seen in the other.
+    Falls back to copying where neither works, such as across drives. Keeps count of the bytes installed each way.
+    """
+    def __init__(self, link: bool=False):
+        self.link: bool = link
+        self.lock: threading.Lock = threading.Lock()
+        self.reflinked_bytes: int = 0
+        self.hardlinked_bytes: int = 0
+        self.copied_bytes: int = 0
+        # (source device, destination device) pairs which a method already failed for, so it is not tried again
+        self.reflink_failed: set[tuple[int, int]] = set()
+        self.hardlink_failed: set[tuple[int, int]] = set()
+
+
+    def install(self, fpath_src: str, fpath_dst: str) -> str:
+        """
+        Puts a copy of the source file at the destination, replacing any existing file.
+        Returns how the file was installed, one of "reflink", "hardlink" or "copy".
+        """
+        if os.path.lexists(fpath_dst):
+            os.remove(fpath_dst)
+        size: int = os.path.getsize(fpath_src)
+        if self.link:
+            devices: tuple[int, int] = (os.stat(fpath_src).st_dev, os.stat(os.path.dirname(fpath_dst) or ".").st_dev)
+            if devices not in self.reflink_failed:
+                if reflinkFile(fpath_src, fpath_dst):
+                    self.count("reflink", size)
+                    return "reflink"
+                with self.lock:
+                    self.reflink_failed.add(devices)
+            if devices not in self.hardlink_failed:
+                try:
+                    os.link(fpath_src, fpath_dst)
+                    self.count("hardlink", size)
+                    return "hardlink"
+                except OSError as e:
+                    logging.info(f"Failed to hardlink '{fpath_src}' => '{fpath_dst}', copying instead: {e}")
+                    with self.lock:
+                        self.hardlink_failed.add(devices)
+        shutil.copy2(fpath_src, fpath_dst)
+        self.count("copy", size)
+        return "copy"
+
+
+    def count(self, method: str, size: int) -> None:
+        with self.lock:
+            if method == "reflink":
+                self.reflinked_bytes += size
+            elif method == "hardlink":
+                self.hardlinked_bytes += size
+            else:
+                self.copied_bytes += size
+
+
+    def report(self) -> str:
+        linked: int = self.reflinked_bytes + self.hardlinked_bytes
+        return (f"{linked/MB_TO_BYTES:.1f} MB linked ({self.reflinked_bytes/MB_TO_BYTES:.1f} MB reflinked, "
+                f"{self.hardlinked_bytes/MB_TO_BYTES:.1f} MB hardlinked), {self.copied_bytes/MB_TO_BYTES:.1f} MB copied")
+
+
+def reflinkFile(fpath_src: str, fpath_dst: str) -> bool:
+    """
+    Tries to reflink the source file to the destination. Only supported on Linux file systems with reflinks.
+    Returns if the reflink was made. Nothing is left at the destination if it was not.
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(fpath_src, "rb") as f_src, open(fpath_dst, "wb") as f_dst:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        shutil.copystat(fpath_src, fpath_dst)
+        return True
+    except OSError as e:
+        logging.info(f"Failed to reflink '{fpath_src}' => '{fpath_dst}': {e}")
+        if os.path.lexists(fpath_dst):
+            os.remove(fpath_dst)
+        return False
 
 
-def copyReplaceFile(fpath_src: str, fpath_dst: str) -> None:
+def copyReplaceFile(fpath_src: str, fpath_dst: str, installer: FileInstaller|None=None) -> None:
     """
     Copies everything in the source path to the destination path.
     Overwrites any existing files and makes directories as needed.
+    Files are linked instead of copied where possible if given an installer which links.
     """
+    installer = installer or FileInstaller()
     # Get all the files
     contents: list[str] = os.listdir(fpath_src)
     for file in contents:
@@ -797,23 +4719,130 @@ def copyReplaceFile(fpath_src: str, fpath_dst: str) -> None:
             # This is actually a directory, recurse
             if (not os.path.exists(fpath_dst_file)):
                 os.mkdir(fpath_dst_file)
-            copyReplaceFile(fpath_src_file, fpath_dst_file)
+            copyReplaceFile(fpath_src_file, fpath_dst_file, installer)
         else:
-            #this is a file we need to copy. Check if the dest exists and delete if needed
-            logging.info(f"Copying file '{fpath_src_file}' => '{fpath_dst_file}'")
-            if (os.path.exists(fpath_dst_file)):
-                os.remove(fpath_dst_file)
-            shutil.copy2(fpath_src_file, fpath_dst_file)
+            #this is a file we need to copy. The installer replaces the dest if it exists
+            method: str = installer.install(fpath_src_file, fpath_dst_file)
+            logging.info(f"Installed file ({method}) '{fpath_src_file}' => '{fpath_dst_file}'")
+
+
+def hashFile(fpath_file: str) -> str:
+    """
+    Returns the SHA1 hex digest of the given file
+    """
+    h = hashlib.sha1()
+    with open(fpath_file, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def crc32File(fpath_file: str) -> int:
+    """
+    Returns the CRC32 of the given file, as used by zip files
+    """
+    crc: int = 0
+    with open(fpath_file, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def hashFileMapped(fpath_file: str, algorithms: list[str]) -> dict[str, str]:
+    """
+    Hashes the given file with each of the given hashlib algorithms by memory mapping it,
+    which avoids copying the file through Python buffers. Hashing releases the GIL while it works.
+    Returns the hex digest for each algorithm.
+    """
+    hashers: dict = {x: hashlib.new(x) for x in algorithms}
+    with open(fpath_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size > 0: # Empty files cannot be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for h in hashers.values():
+                    h.update(m)
+    return {x: h.hexdigest() for x, h in hashers.items()}
+
+
+class BackgroundRemover():
+    """
+    Removes folder trees in the background. Each tree is first renamed to a trash name next to it, which is instant
+    and frees up its old location straight away, then deleted by a background thread.
+    Call wait before exiting to make sure everything is gone.
+    """
+    def __init__(self, thread_count: int=REMOVE_THREADS):
+        self.pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(thread_count, "remove")
+        self.lock: threading.Lock = threading.Lock()
+        self.futures: list[concurrent.futures.Future] = []
+        self.trash_count: int = 0
+        self.removed: int = 0
+        self.remove_seconds: float = 0.0 # Time spent deleting in the background
+
+
+    def remove(self, fpath_src: str) -> None:
+        """
+        Moves the tree out of the way and queues it for deletion.
+        Falls back to deleting it in place if it cannot be renamed.
+        """
+        with self.lock:
+            self.trash_count += 1
+            fpath_trash: str = os.path.join(os.path.dirname(fpath_src), f".{os.path.basename(fpath_src)}{REMOVE_TRASH_SUFFIX}-{os.getpid()}-{self.trash_count}")
+        try:
+            os.rename(fpath_src, fpath_trash)
+        except OSError as e:
+            # Something has the tree open or it is on a different drive. Just delete it now.
+            logging.info(f"Failed to move '{fpath_src}' to trash, removing in place: {e}")
+            self.removeTree(fpath_src)
+            return
+        logging.info(f"Moved tree '{fpath_src}' => '{fpath_trash}' for removal")
+        with self.lock:
+            self.futures.append(self.pool.submit(self.removeTree, fpath_trash))
+
+
+    def isOwnTrash(self, file_name: str) -> bool:
+        """
+        Returns if the name is of a tree this process is already removing
+        """
+        return f"{REMOVE_TRASH_SUFFIX}-{os.getpid()}-" in file_name
+
+
+    def removeTree(self, fpath_tree: str) -> None:
+        time_start: float = time.perf_counter()
+        try:
+            shutil.rmtree(fpath_tree)
+        except Exception as e:
+            logging.exception(f"Failed to remove tree '{fpath_tree}'")
+            logWarn(f"Failed to remove '{fpath_tree}'. It can be deleted by hand: {e}")
+        with self.lock:
+            self.removed += 1
+            self.remove_seconds += time.perf_counter() - time_start
+
+
+    def wait(self) -> None:
+        """
+        Waits for all queued removals to finish and reports how much time removing in the background saved
+        compared to deleting each tree in place and waiting for the OS to catch up.
+        """
+        time_start: float = time.perf_counter()
+        with self.lock:
+            futures: list[concurrent.futures.Future] = self.futures
+            self.futures = []
+        concurrent.futures.wait(futures)
+        seconds_waited: float = time.perf_counter() - time_start
+        if self.removed:
+            seconds_saved: float = self.removed*REMOVE_SLEEP + self.remove_seconds - seconds_waited
+            logInfo(f"Removed {self.removed} folders in the background, saving {seconds_saved:.1f}s (waited {seconds_waited:.1f}s for removals to finish)")
+
+
+background_remover: BackgroundRemover = BackgroundRemover()
 
 
 def removeFile(fpath_src: str) -> None:
     """
-    Removes the specified file/folder tree
+    Removes the specified file/folder tree. The tree is gone from its location when this returns,
+    but is deleted in the background.
     """
     logging.info(f"Removing tree '{fpath_src}'")
-    shutil.rmtree(fpath_src)
-    # Wait for the OS to finish so we do not get inconsistent behaviour
-    time.sleep(REMOVE_SLEEP)
+    background_remover.remove(fpath_src)
 
 
 def generateFolder(fpath_folder: str) -> bool:
@@ -832,14 +4861,19 @@ def generateFolder(fpath_folder: str) -> bool:
             return False
     else:
         # No folder, make one
-        os.mkdir(fpath_folder)
+        try:
+            os.mkdir(fpath_folder)
+        except FileExistsError:
+            # Another thread got there first
+            return os.path.isdir(fpath_folder)
         logging.info("Successfully generated folder.")
         return True
 
 
-def regenerateFolder(fpath_folder: str) -> bool:
+def regenerateFolder(fpath_folder: str, keep: list[str]=[]) -> bool:
     """
     Removes and remakes the specified folder (recursively).
+    Anything directly inside the folder with a name in keep is left alone.
     Returns if successful.
     """
     logging.info(f"Regenerating folder '{fpath_folder}'")
@@ -849,6 +4883,18 @@ def regenerateFolder(fpath_folder: str) -> bool:
             logging.error(f"Cannot regenerate non-folder '{fpath_folder}'")
             return False
 
+        if keep:
+            # Empty the folder out around the things being kept
+            for file in os.listdir(fpath_folder):
+                if file in keep or background_remover.isOwnTrash(file):
+                    continue
+                fpath_file: str = os.path.join(fpath_folder, file)
+                if os.path.isdir(fpath_file):
+                    removeFile(fpath_file)
+                else:
+                    os.remove(fpath_file)
+            logging.info("Successfully regenerated folder.")
+            return True
         removeFile(fpath_folder)
     else:
         logging.info("Skipping folder deletion since it does not exist")
@@ -879,6 +4925,220 @@ def runForgeInstaller(fpath_install_temp: str, forge_file: str, fpath_minecraft:
         raise Exception(f"Forge install failed with exit code {install_result.returncode}")
 
 
+def installForge(minecraft_version: str, forge_version: str, fpath_install_temp: str, fpath_minecraft: str, headless: bool=False, pool: HTTPConnectionPool|None=None, fpath_forge_cache: str|None=None, force: bool=False, offline: bool=False, peers: "CachePeers|None"=None) -> str:
+    """
+    Downloads and runs the forge installer, then checks the forge version was installed.
+    The installer is skipped if the forge version is already fully installed, unless forced.
+    Installers are kept in fpath_forge_cache, if given, so they only need downloading once.
+    If offline, the installer must already be in fpath_forge_cache. Otherwise the cache peers (if given) are asked for it
+    before downloading it.
+    Only depends on the manifest so it can run alongside the mod downloads.
+    Returns the forge version name as it appears under versions. Raises an exception if anything fails.
+    """
+    # Nothing to do if a previous install already put everything in place
+    if not force:
+        forge_install_name: str = isForgeInstallComplete(fpath_minecraft, minecraft_version, forge_version, fpath_forge_cache)
+        if forge_install_name:
+            logInfo(f"Forge version '{forge_install_name}' is already installed and verified. Skipping forge installer.")
+            return forge_install_name
+
+    # TODO, get forge installer headless command
+    forge_file: str = getForgeInstaller(minecraft_version, forge_version, fpath_install_temp, pool, fpath_forge_cache, offline=offline, peers=peers)
+
+    # Install
+    logInfo(f"> Running forge installer '{forge_file}'...")
+    if headless:
+        print("\tRunning in headless mode due to flag. Please hold (puts on hold music)...")
+    else:
+        print("\tIt will show up in a seperate window. Follow the installation prompts then come back here.")
+    # TODO, check for java installation
+    time_start: float = time.perf_counter()
+    runForgeInstaller(fpath_install_temp, forge_file, fpath_minecraft, headless)
+    run_report.span("forge installer", "forge", time_start)
+    logInfo("Detected forge installer closed without error")
+
+    # Check the installed version of forge exists
+    forge_install_name: str = isForgeVersionInstalled(fpath_minecraft, minecraft_version, forge_version)
+    if not forge_install_name:
+        # Could not find the forge installation...
+        raise Exception("Failed to find forge installation. Was it installed?")
+    return forge_install_name
+
+
+def getForgeInstaller(minecraft_version: str, forge_version: str, fpath_install_temp: str, pool: HTTPConnectionPool|None=None, fpath_forge_cache: str|None=None, offline: bool=False, peers: "CachePeers|None"=None) -> str:
+    """
+    Puts the forge installer in the install temp folder, downloading it unless it is cached or a cache peer has it.
+    If offline, the installer must be cached.
+    Returns the name of the installer.
+    """
+    forge_file: str = makeForgeInstallerFileName(minecraft_version, forge_version)
+    if fpath_forge_cache and fetchForgeInstaller(fpath_forge_cache, forge_file, fpath_install_temp):
+        logInfo(f"Using cached forge installer '{forge_file}'")
+        return forge_file
+    if offline:
+        raise Exception(f"Forge installer '{forge_file}' is not available offline")
+
+    time_start: float = time.perf_counter()
+    # Forge installers from peers are run, so they must match the hash from the forge maven over HTTPS
+    forge_hash: str|None = requestForgeInstallerHash(minecraft_version, forge_version, pool) if peers else None
+    if forge_hash and peers.fetchForge(forge_file, forge_hash, fpath_install_temp, pool):
+        logInfo(f"Got forge installer '{forge_file}' from a cache peer")
+    else:
+        logInfo("Downloading forge installer...")
+        forge_file = downloadForgeInstaller(minecraft_version, forge_version, fpath_install_temp, pool)
+    run_report.span("forge download", "forge", time_start)
+    if fpath_forge_cache:
+        try:
+            storeForgeInstaller(fpath_forge_cache, os.path.join(fpath_install_temp, forge_file))
+        except Exception as e:
+            logging.exception("Failed to cache forge installer")
+            logWarn(f"Failed to cache forge installer: {e}")
+    return forge_file
+
+
+def fetchForgeInstaller(fpath_forge_cache: str, forge_file: str, fpath_install_temp: str) -> bool:
+    """
+    Copies a cached forge installer into the install temp folder.
+    Installers are checked against the hash recorded when they were cached, and dropped if they do not match.
+    Returns if the installer was in the cache.
+    """
+    fpath_cached: str = os.path.join(fpath_forge_cache, forge_file)
+    fpath_cached_hash: str = f"{fpath_cached}{FORGE_CACHE_HASH_SUFFIX}"
+    if not os.path.isfile(fpath_cached) or not os.path.isfile(fpath_cached_hash):
+        logging.info(f"Forge installer '{forge_file}' is not cached")
+        return False
+    with open(fpath_cached_hash, "r") as f:
+        file_hash: str = f.read().strip()
+    if hashFile(fpath_cached) != file_hash:
+        logWarn(f"Cached forge installer '{fpath_cached}' is damaged. Downloading it again.")
+        os.remove(fpath_cached)
+        os.remove(fpath_cached_hash)
+        return False
+    shutil.copy2(fpath_cached, os.path.join(fpath_install_temp, forge_file))
+    return True
+
+
+def storeForgeInstaller(fpath_forge_cache: str, fpath_forge: str) -> None:
+    """
+    Adds a downloaded forge installer to the cache along with its hash.
+    The installer must be a jar with an install profile so a broken download is never cached.
+    """
+    with zipfile.ZipFile(fpath_forge, "r") as f:
+        if FORGE_INSTALL_PROFILE_FILE not in f.namelist():
+            raise Exception(f"'{fpath_forge}' is not a forge installer")
+    os.makedirs(fpath_forge_cache, exist_ok=True)
+    fpath_cached: str = os.path.join(fpath_forge_cache, os.path.basename(fpath_forge))
+    # Write under temporary names first so other installers never see a half written file
+    shutil.copy2(fpath_forge, f"{fpath_cached}.tmp")
+    with open(f"{fpath_cached}{FORGE_CACHE_HASH_SUFFIX}.tmp", "w") as f:
+        f.write(hashFile(fpath_forge))
+    os.replace(f"{fpath_cached}.tmp", fpath_cached)
+    os.replace(f"{fpath_cached}{FORGE_CACHE_HASH_SUFFIX}.tmp", f"{fpath_cached}{FORGE_CACHE_HASH_SUFFIX}")
+    logging.info(f"Stored forge installer '{fpath_forge}' in cache")
+
+
+def isForgeInstallComplete(fpath_minecraft: str, minecraft_version: str, forge_version: str, fpath_forge_cache: str|None=None) -> str:
+    """
+    Returns the forge version name if the forge version is fully installed, with the size and hash each file is meant to have:
+    - every library its version file lists. Libraries which only apply to some systems are not checked.
+    - the jar of the Minecraft version it inherits from, checked against that version's file if it has one.
+    - every file the forge installer's processors make for the client, such as the patched Minecraft jars. These are
+      read from the install profile of the cached installer, so without one the install is never counted as complete.
+    Otherwise returns blank.
+    """
+    forge_install_name: str = isForgeVersionInstalled(fpath_minecraft, minecraft_version, forge_version)
+    if not forge_install_name:
+        return ""
+    fpath_version: str = os.path.join(fpath_minecraft, MINECRAFT_VERSIONS_FOLDER, forge_install_name, f"{forge_install_name}.json")
+    fpath_installer: str|None = os.path.join(fpath_forge_cache, makeForgeInstallerFileName(minecraft_version, forge_version)) if fpath_forge_cache else None
+    if not fpath_installer or not os.path.isfile(fpath_installer):
+        logging.info("Forge installer is not cached, so the files its processors make cannot be checked")
+        return ""
+    try:
+        with open(fpath_version, "r") as f:
+            version: dict = json.load(f)
+        libraries: list[dict] = version.get("libraries", [])
+        for library in libraries:
+            if "rules" in library:
+                continue
+            artifact: dict = library.get("downloads", {}).get("artifact", {})
+            fpath_relative: str|None = artifact.get("path") or (makeMavenPath(library["name"]) if "name" in library else None)
+            if not fpath_relative:
+                continue
+            if not isInstalledFileIntact(makeFolderPath(os.path.join(fpath_minecraft, MINECRAFT_LIBRARIES_FOLDER), fpath_relative), artifact.get("size"), artifact.get("sha1")):
+                return ""
+
+        # The Minecraft jar forge is built on
+        inherited_version: str|None = version.get("jar") or version.get("inheritsFrom")
+        if inherited_version:
+            fpath_inherited: str = os.path.join(fpath_minecraft, MINECRAFT_VERSIONS_FOLDER, inherited_version, inherited_version)
+            client: dict = {}
+            if os.path.isfile(f"{fpath_inherited}.json"):
+                with open(f"{fpath_inherited}.json", "r") as f:
+                    client = json.load(f).get("downloads", {}).get("client", {})
+            if not isInstalledFileIntact(f"{fpath_inherited}.jar", client.get("size"), client.get("sha1")):
+                return ""
+
+        # The files made by the installer
+        outputs: dict[str, str] = readForgeProcessorOutputs(fpath_installer)
+        for fpath_relative, file_hash in outputs.items():
+            if not isInstalledFileIntact(makeFolderPath(os.path.join(fpath_minecraft, MINECRAFT_LIBRARIES_FOLDER), fpath_relative), None, file_hash):
+                return ""
+    except Exception as e:
+        logging.exception(f"Failed to check forge version file '{fpath_version}'")
+        return ""
+    logging.info(f"Forge version '{forge_install_name}', its {len(libraries)} libraries and {len(outputs)} installer outputs are installed")
+    return forge_install_name
+
+
+def isInstalledFileIntact(fpath_file: str, size: int|None, file_hash: str|None) -> bool:
+    """
+    Returns if an installed file exists and has the size and SHA1 hash given, where known
+    """
+    if not os.path.isfile(fpath_file):
+        logging.info(f"Forge install file '{fpath_file}' is missing")
+        return False
+    if size is not None and os.path.getsize(fpath_file) != size:
+        logging.info(f"Forge install file '{fpath_file}' is the wrong size")
+        return False
+    if file_hash and hashFile(fpath_file) != file_hash.lower():
+        logging.info(f"Forge install file '{fpath_file}' has the wrong hash")
+        return False
+    return True
+
+
+def readForgeProcessorOutputs(fpath_installer: str) -> dict[str, str]:
+    """
+    Reads the files the processors of a forge installer make for the client (such as the patched Minecraft jars) out of
+    its install profile. Outputs name entries in the profile's data, like "{MC_SLIM}": "{MC_SLIM_SHA}", which are either
+    maven artifacts in brackets ("[group:artifact:version:classifier]") or quoted literals ("'<sha1>'").
+    Installers from before processors were added have none.
+    Returns the path of each output relative to the libraries folder, mapped to its SHA1 hash.
+    Raises an exception if an output cannot be worked out.
+    """
+    with zipfile.ZipFile(fpath_installer, "r") as f:
+        profile: dict = json.loads(f.read(FORGE_INSTALL_PROFILE_FILE))
+    data: dict[str, str] = {k: v["client"] for k, v in profile.get("data", {}).items() if isinstance(v, dict) and "client" in v}
+    def resolve(value: str) -> str:
+        if value.startswith("{") and value.endswith("}"):
+            if value[1:-1] not in data:
+                raise Exception(f"Forge install profile has no client data for '{value}'")
+            value = data[value[1:-1]]
+        return value
+
+    outputs: dict[str, str] = {}
+    for processor in profile.get("processors", []):
+        if "client" not in processor.get("sides", ["client"]):
+            continue
+        for output, output_hash in processor.get("outputs", {}).items():
+            output = resolve(output)
+            output_hash = resolve(output_hash)
+            if not (output.startswith("[") and output.endswith("]")) or not (output_hash.startswith("'") and output_hash.endswith("'")):
+                raise Exception(f"Unknown forge installer output '{output}' with hash '{output_hash}'")
+            outputs[makeMavenPath(output[1:-1])] = output_hash[1:-1]
+    return outputs
+
+
 def isForgeVersionInstalled(fpath_minecraft: str, minecraft_version: str, forge_version: str) -> str:
     """
     Returns the forge version name as it appears under versions if it is installed.
@@ -907,13 +5167,60 @@ def makeForgeInstallerDownloadLink(minecraft_version: str, forge_version: str) -
     return f"https://files.minecraftforge.net/maven/net/minecraftforge/forge/{minecraft_version}-{forge_version}/{forge_file}"
 
 
+def requestForgeInstallerHash(minecraft_version: str, forge_version: str, pool: HTTPConnectionPool|None=None) -> str|None:
+    """
+    Gets the SHA1 hash the forge maven publishes for an installer, only trusting it if it came over HTTPS.
+    Returns None if it could not be fetched.
+    """
+    url: str = f"{makeForgeInstallerDownloadLink(minecraft_version, forge_version)}{FORGE_MAVEN_HASH_SUFFIX}"
+    try:
+        with downloadURL(url, pool=pool) as response:
+            data: bytes = response.read()
+            final_url: str = response.geturl()
+    except Exception as e:
+        logging.exception(f"Failed to get forge installer hash from '{url}'")
+        logWarn(f"Not asking cache peers for forge as its hash could not be fetched from the forge maven: {e}")
+        return None
+    match = re.match(r"^\s*([0-9a-fA-F]{40})\b", data.decode("ascii", "replace"))
+    if not final_url.startswith("https://") or not match:
+        logWarn(f"Not asking cache peers for forge as the forge maven did not give a usable hash from '{final_url}'")
+        return None
+    return match[1].lower()
+
+
 def makeForgeInstallerFileName(minecraft_version: str, forge_version: str) -> str:
-    return f"forge-{minecraft_version}-{forge_version}-installer.jar"
+    return f"forge-{minecraft_version}-{forge_version}{FORGE_INSTALLER_SUFFIX}"
 
 
-def makeModLocationDownloadLink(projectID: str, fileID: str) -> str:
+def makeModLocationDownloadLink(projectID: str, fileID: str, api_url: str=CURSEFORGE_API_URL_DEFAULT) -> str:
     # Old API: https://addons-ecs.forgesvc.net/api/v2/addon/{projectID}/file/{fileID}/download-url
-    return f"https://api.curseforge.com/v1/mods/{projectID}/files/{fileID}/download-url"
+    return f"{api_url}/v1/mods/{projectID}/files/{fileID}/download-url"
+
+
+def makeModFilesBulkLink(api_url: str=CURSEFORGE_API_URL_DEFAULT) -> str:
+    return f"{api_url}/v1/mods/files"
+
+
+def makePeerModLink(peer_url: str, projectID: str, fileID: str) -> str:
+    return f"{peer_url}/{PEER_MODS_PATH}/{projectID}/{fileID}"
+
+
+def makePeerForgeLink(peer_url: str, forge_file: str) -> str:
+    return f"{peer_url}/{PEER_FORGE_PATH}/{urllib.parse.quote(forge_file)}"
+
+
+def makeModCacheKey(projectID: str, fileID: str) -> str:
+    return f"{projectID}-{fileID}"
+
+
+def makeMavenPath(name: str) -> str:
+    """
+    Returns the path of a maven artifact in a repository from its name, "group:artifact:version[:classifier][@extension]"
+    """
+    name, _, extension = name.partition("@")
+    group, artifact, version, *classifier = name.split(":")
+    file_name: str = f"{artifact}-{version}{''.join(f'-{x}' for x in classifier)}.{extension or 'jar'}"
+    return f"{group.replace('.', '/')}/{artifact}/{version}/{file_name}"
 
 
 def makeForgeVersionFolderNameV1(minecraft_version: str, forge_version: str) -> str:
@@ -924,7 +5231,279 @@ def makeForgeVersionFolderNameV2(minecraft_version: str, forge_version: str) ->
     return f"{minecraft_version}-forge-{forge_version}"
 
 
+# === Run Report ===
+class RunReport():
+    """
+    Collects timings while the installer runs: wall time for each phase of main, download details for each mod
+    and trace events for every phase, resolve batch, transfer and check.
+    Written at the end of the run as a JSON report and, if asked for, a Chrome trace event file which can be opened
+    with chrome://tracing or https://ui.perfetto.dev.
+    """
+    def __init__(self):
+        self.time_start: float = time.perf_counter()
+        self.lock: threading.Lock = threading.Lock()
+        self.phases: list[dict] = [] # {"name", "start", "seconds"} in seconds since the start of the run
+        self.phase_name: str|None = None
+        self.phase_start: float = 0.0
+        self.events: list[dict] = [] # Chrome trace events
+        self.tracks: dict[int, str] = {} # Trace track (thread or task) => name
+        self.mod_list: list[dict] = []
+        self.profiler: InstallProfiler|None = None # Told about phase boundaries if profiling
+
+
+    def phase(self, name: str|None) -> None:
+        """
+        Ends the current phase of main, if any, and starts the named one
+        """
+        now: float = time.perf_counter()
+        if self.phase_name:
+            self.phases.append({"name": self.phase_name, "start": self.phase_start - self.time_start, "seconds": now - self.phase_start})
+            self.span(self.phase_name, "phase", self.phase_start, end=now)
+            if self.profiler:
+                self.profiler.snapshot(self.phase_name)
+        self.phase_name = name
+        self.phase_start = now
+
+
+    def span(self, name: str, category: str, start: float, args: dict|None=None, end: float|None=None) -> None:
+        """
+        Adds a trace event for something on the calling thread (or asyncio task) which started at the given
+        time.perf_counter() value and ends now, or at end if given
+        """
+        end = end if end is not None else time.perf_counter()
+        track, track_name = getTraceTrack()
+        event: dict = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": track,
+                       "ts": (start - self.time_start)*1000000, "dur": (end - start)*1000000}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+            self.tracks.setdefault(track, track_name)
+
+
+    def write(self, fpath_report: str, fpath_trace: str|None=None, exit_code: int|None=None) -> None:
+        """
+        Writes the JSON report, and the trace if a path is given for it
+        """
+        self.phase(None)
+        wall_seconds: float = time.perf_counter() - self.time_start
+        mods: list[dict] = [makeModReportEntry(mod) for mod in self.mod_list]
+        transfers: list[dict] = [x for x in mods if not x["cached"] and x["transferSeconds"]]
+        report: dict = {
+            "version": REPORT_VERSION,
+            "app": appVersionStr(),
+            "exitCode": exit_code,
+            "wallSeconds": wall_seconds,
+            "peakMemory": getPeakMemoryUsage(),
+            "phases": self.phases,
+            "downloads": {
+                "mods": len(mods),
+                "cached": len([x for x in mods if x["cached"]]),
+                "peer": len([x for x in mods if x["peer"]]),
+                "failed": len([x for x in mods if x["failed"]]),
+                "retries": sum(max(x["attempts"] - 1, 0) for x in mods),
+                "bytes": sum(x["bytes"] for x in mods),
+                "resolveSecondsP50": getPercentile(sorted(x["resolveSeconds"] for x in mods if x["resolveSeconds"]), 50),
+                "transferSecondsP50": getPercentile(sorted(x["transferSeconds"] for x in transfers), 50),
+                "transferSecondsP99": getPercentile(sorted(x["transferSeconds"] for x in transfers), 99),
+            },
+            "mods": mods
+        }
+        with open(fpath_report, "w") as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Wrote run report to '{fpath_report}'")
+
+        if fpath_trace:
+            with self.lock:
+                names: list[dict] = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track, "args": {"name": name}} for track, name in self.tracks.items()]
+                trace: dict = {"traceEvents": names + self.events, "displayTimeUnit": "ms"}
+            with open(fpath_trace, "w") as f:
+                json.dump(trace, f)
+            logging.info(f"Wrote trace to '{fpath_trace}'")
+
+
+class InstallProfiler():
+    """
+    Profiles the whole install for -profile.
+    CPU: covers the main thread (which also runs the asyncio download engine) and every thread started after profiling
+    starts, such as the download and verify threads. From Python 3.12 one cProfile profiler sees every thread, and only one
+    may be active at a time. Before that each thread gets its own profiler, merged when written.
+    Memory: a tracemalloc snapshot is taken at the end of each phase of the run report, showing which lines hold the
+    most memory and which allocated the most during the phase.
+    """
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.profiles: list[cProfile.Profile] = []
+        self.profile_main: cProfile.Profile|None = None
+        self.snapshots: list[dict] = [] # {"phase", "snapshot", "current", "peak"} in phase order
+
+
+    def start(self) -> None:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.profileThread)
+        self.profileThread()
+        self.profile_main = self.profiles[0]
+
+
+    def profileThread(self, *args) -> None:
+        """
+        Starts profiling the calling thread. Before Python 3.12 this is set with threading.setprofile so it runs as each
+        new thread starts.
+        """
+        sys.setprofile(None)
+        profile: cProfile.Profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+
+    def snapshot(self, phase: str) -> None:
+        """
+        Takes a memory snapshot at the end of a phase. Must be called from the main thread.
+        """
+        # Keep the snapshot itself out of the CPU profile
+        self.profile_main.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        self.snapshots.append({"phase": phase, "snapshot": tracemalloc.take_snapshot(), "current": current, "peak": peak})
+        # Each phase gets its own peak
+        tracemalloc.reset_peak()
+        self.profile_main.enable()
+
+
+    def stop(self) -> None:
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        with self.lock:
+            for profile in self.profiles:
+                profile.create_stats()
+        tracemalloc.stop()
+
+
+    def write(self, fpath_profile: str, fpath_stats: str, fpath_memory: str) -> None:
+        """
+        Writes the top functions by cumulative and own time, the full profile in pstats format (for tools like snakeviz)
+        and the top allocators at the end of each phase
+        """
+        with self.lock:
+            profiles: list[cProfile.Profile] = [x for x in self.profiles if x.stats]
+        with open(fpath_profile, "w") as f:
+            stats: pstats.Stats = pstats.Stats(*profiles, stream=f)
+            threads: str = "all threads" if sys.version_info >= (3, 12) else f"{len(profiles)} threads"
+            f.write(f"CPU profile of {threads}. Full profile in '{fpath_stats}'.\n\n=== Top functions by cumulative time ===\n")
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_COUNT)
+            f.write("=== Top functions by own time ===\n")
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_TOP_COUNT)
+        stats.dump_stats(fpath_stats)
+
+        with open(fpath_memory, "w") as f:
+            previous: tracemalloc.Snapshot|None = None
+            for snapshot in self.snapshots:
+                snapshot["snapshot"] = snapshot["snapshot"].filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+                f.write(f"=== End of phase '{snapshot['phase']}': {snapshot['current']/MB_TO_BYTES:.1f} MB allocated, peak {snapshot['peak']/MB_TO_BYTES:.1f} MB during the phase ===\n")
+                f.write("Top lines holding memory:\n")
+                for stat in snapshot["snapshot"].statistics("lineno")[:PROFILE_TOP_COUNT]:
+                    f.write(f"\t{stat}\n")
+                if previous:
+                    f.write("Top changes since the last phase:\n")
+                    for stat in snapshot["snapshot"].compare_to(previous, "lineno")[:PROFILE_TOP_COUNT]:
+                        f.write(f"\t{stat}\n")
+                f.write("\n")
+                previous = snapshot["snapshot"]
+        logInfo(f"Wrote profile to '{fpath_profile}' and '{fpath_memory}'")
+
+
+run_report: RunReport = RunReport()
+
+
+def getTraceTrack() -> tuple[int, str]:
+    """
+    Returns an ID and name for the trace track of the caller: the asyncio task if in one, otherwise the thread
+    """
+    try:
+        task: asyncio.Task|None = asyncio.current_task()
+    except RuntimeError:
+        task = None # No event loop running
+    if task:
+        return id(task), task.get_name()
+    thread: threading.Thread = threading.current_thread()
+    return thread.ident or 0, thread.name
+
+
+def addModTiming(mod: dict, name: str, value: float) -> None:
+    """
+    Adds to one of the timings kept for the run report in the mod
+    """
+    timing: dict = mod.setdefault("timing", {})
+    timing[name] = timing.get(name, 0) + value
+
+
+def makeModReportEntry(mod: dict) -> dict:
+    timing: dict = mod.get("timing", {})
+    return {
+        "projectID": mod["projectID"],
+        "fileID": mod["fileID"],
+        "fileName": mod.get("file", {}).get("fileName") or mod.get("fileName"),
+        "bytes": mod.get("file", {}).get("size", 0),
+        "cached": bool(timing.get("cached")),
+        "peer": bool(timing.get("peer")) and timing.get("attempts") == 1 and "file" in mod, # Only the first attempt asks peers
+        "failed": "file" not in mod,
+        "attempts": int(timing.get("attempts", 0)),
+        "resolveSeconds": timing.get("resolveSeconds", 0.0),
+        "transferSeconds": timing.get("transferSeconds", 0.0),
+        "verifySeconds": timing.get("verifySeconds", 0.0),
+        "totalSeconds": mod.get("downloadSeconds")
+    }
+
+
+def getPercentile(values: list[float], percentile: float) -> float|None:
+    """
+    Returns the nearest-rank percentile of already sorted values
+    """
+    if not values:
+        return None
+    rank: int = max(int(-(-percentile*len(values) // 100)), 1)
+    return values[rank-1]
+
+
 # === Misc ===
+def getPeakMemoryUsage() -> int|None:
+    """
+    Returns the peak resident memory of this process in bytes, or None if it cannot be determined.
+    """
+    if resource:
+        peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB while macOS reports bytes
+        return peak if sys.platform == "darwin" else peak*1024
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            import ctypes.wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", ctypes.wintypes.DWORD), ("PageFaultCount", ctypes.wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except Exception:
+            logging.exception("Failed to get peak memory usage")
+    return None
+
+
+def logMemoryUsage() -> None:
+    """
+    Logs the peak memory of the process along with the memory held by download buffers
+    """
+    peak: int|None = getPeakMemoryUsage()
+    peak_str: str = f"{peak/MB_TO_BYTES:.1f} MB" if peak is not None else "unknown"
+    logInfo(f"Peak memory usage: {peak_str} (download buffers: {getDownloadBufferMemory()/MB_TO_BYTES:.2f} MB)")
+
+
 def appVersionStr() -> str:
     """
     What the script should call itself and its version
@@ -932,6 +5511,15 @@ def appVersionStr() -> str:
     return f"{APP_NAME} {APP_VERSION} by {APP_AUTHOR}"
 
 
+def printTitle() -> None:
+    """
+    Gives the user something nice to look at
+    """
+    title: str = f"| {appVersionStr()} |"
+    title_border: str = "="*len(title)
+    print(f"{title_border}\n{title}\n{title_border}")
+
+
 # ==================
 # SCRIPT STARTS HERE
 # ==================
@@ -950,15 +5538,23 @@ if __name__ == '__main__':
     try:
         arg_parser = argparse.ArgumentParser()
         # Required positional arguments.
-        arg_parser.add_argument("fpath_modpack", metavar="modpack_file_path", type=str,
-                                help="The modpack zip file to install.")
+        arg_parser.add_argument("fpath_modpack", metavar="modpack_file_path", type=str, nargs="*",
+                                help="The modpack zip file or offline bundle to install. Give several modpacks to install them all in one go, downloading the mods they share only once.")
         # Possibly useful optional arguments.
         arg_parser.add_argument("-modpackname", "-mn",
                                 help="Custom name for the modpack profile in the Minecraft launcher. By default this will be 'modpack - <modpackname>'")
         arg_parser.add_argument("-tempfolder", "-tf", default=DEFAULT_INSTALL_TEMP,
                                 help=f"Change the temporary working/download folder. Anything in this folder could be overwritten or removed. By default it is '{DEFAULT_INSTALL_TEMP}'")
         arg_parser.add_argument("-downloadthreads", "-th", default=DEFAULT_DOWNLOAD_THREADS, type=int,
-                                help=f"The number of threads to download mods with, for performance. Default is {DEFAULT_DOWNLOAD_THREADS}.")
+                                help=f"The number of threads to download mods with, for performance. With the asyncio download engine this is the number of downloads at once, which can be in the hundreds. Default is {DEFAULT_DOWNLOAD_THREADS}.")
+        arg_parser.add_argument("-adaptivethreads", "-at", action="store_true",
+                                help=f"Tune the number of downloads at once while downloading, starting from -downloadthreads. More downloads are allowed while throughput keeps up, and fewer when the server starts throttling (HTTP 429), failing or slowing down. Goes up to at most {ADAPTIVE_CONCURRENCY_MAX}, or -downloadthreads if higher. How it changed is written to the log.")
+        arg_parser.add_argument("-apirate", "-ar", default=DEFAULT_API_RATE, type=float,
+                                help=f"The most CurseForge API requests to make per second, shared by all threads. If the API throttles the installer anyway, all API requests wait as long as it asks. 0 is unlimited. Default is {DEFAULT_API_RATE}.")
+        arg_parser.add_argument("-downloadengine", "-de", default=DEFAULT_DOWNLOAD_ENGINE, choices=DOWNLOAD_ENGINES,
+                                help=f"How mods are downloaded at once: with a thread per download ({DOWNLOAD_ENGINE_THREADS}) or with asyncio tasks on a single thread ({DOWNLOAD_ENGINE_ASYNCIO}), which copes better with very many downloads at once. Default is '{DEFAULT_DOWNLOAD_ENGINE}'.")
+        arg_parser.add_argument("-resolvethreads", "-rt", default=DEFAULT_RESOLVE_THREADS, type=int,
+                                help=f"The number of threads looking up mod download locations with the CurseForge API, separately from the download threads. Default is {DEFAULT_RESOLVE_THREADS}.")
         arg_parser.add_argument(PARAM_MINECRAFT_PATH, "-mp", default=MINECRAFT_FPATH_DEFAULT,
                                 help=f"The location of your Minecraft install folder. Default is '{MINECRAFT_FPATH_DEFAULT}'")
         arg_parser.add_argument("-autoaccept", "-y", action="store_true",
@@ -969,20 +5565,48 @@ if __name__ == '__main__':
                                 help="Sets the maximum memory for the modpack to this value in GB. Anything beyond 10GB Java does not know how to use effectively.")
         arg_parser.add_argument("-javaargs", "-ja", default=DEFAULT_JAVA_ARGS,
                                 help="Sets the Java args to use with the modpack profile when launching. Only use if you know what you are doing. The inbuilt defaults in this installer should work well in most cases.")
+        arg_parser.add_argument("-cachefolder", "-cf", default=DEFAULT_CACHE_FOLDER,
+                                help=f"The folder used to cache downloaded mods between installs. By default it is '{DEFAULT_CACHE_FOLDER}'")
+        arg_parser.add_argument("-cachesize", "-cs", default=DEFAULT_CACHE_SIZE, type=float,
+                                help=f"The maximum size of the mod cache in GB. The least recently used mods are removed beyond this. Default is {DEFAULT_CACHE_SIZE}.")
+        arg_parser.add_argument("-peer", "-pr", action="append",
+                                help="The URL of another installer serving its cache with -servecache, e.g. 'http://192.168.1.20:8765'. Mods and forge installers are fetched from it before CurseForge, and checked against the hashes from CurseForge and the forge maven. Give it several times to use several peers, which are tried in order.")
+        arg_parser.add_argument("-servecache", "-sc", nargs="?", const=f"{DEFAULT_PEER_HOST}:{DEFAULT_PEER_PORT}",
+                                help=f"Instead of installing, serve the mod and forge installer cache (see -cachefolder) read only over HTTP on this host:port for other installers to use with -peer. Default is '{DEFAULT_PEER_HOST}:{DEFAULT_PEER_PORT}', which only this machine can reach. Give a host such as '0.0.0.0:{DEFAULT_PEER_PORT}' to share it with other machines on the network. Runs until stopped with Ctrl+C.")
         # Optional arguments which are only used if you know what you are doing.
+        arg_parser.add_argument("-apiurl", "-au", default=CURSEFORGE_API_URL_DEFAULT,
+                                help=f"The base URL of the CurseForge API to resolve and download mods from. Default is '{CURSEFORGE_API_URL_DEFAULT}'")
+        arg_parser.add_argument("-fullinstall", "-fi", action="store_true",
+                                help=f"Reinstall every mod instead of only the mods which changed since the last install (as recorded in '{INSTALL_LOCK_FILE}'), and run the forge installer even if the forge version is already installed.")
+        arg_parser.add_argument("-linkfiles", "-lf", action="store_true",
+                                help="Install mods and overrides by reflinking or hardlinking them from the temporary folder and mod cache instead of copying, which saves time and disk space. Files are copied where linking is not possible, such as across drives. Hardlinked files share their contents with the temporary folder and cache.")
+        arg_parser.add_argument("-synchash", "-sh", action="store_true",
+                                help="Also compare the contents of installed override files which look unchanged, rather than trusting their size and modification time. Slower, but catches files edited without changing either.")
         arg_parser.add_argument("-nounzip", "-nz", action="store_true",
-                                help="Do not unzip the modpack file and use a previous cached copy.")
+                                help="Do not read the manifest from the modpack file and use a previous cached copy. Overrides are still installed straight from the modpack file.")
         arg_parser.add_argument("-nodownload", "-nd", action="store_true",
-                                help="Do not download modpack files and use a previous cached copy.")
+                                help="Do not download mods and install the ones the previous install left in the temporary folder instead. Every mod which is not already installed has to be there. After an update only the changed mods were downloaded, so only those are there.")
         arg_parser.add_argument("-noforge", "-nf", action="store_true",
                                 help="Do not download forge and use a previous cached copy.")
+        arg_parser.add_argument("-nocache", "-nc", action="store_true",
+                                help="Do not use or update the mod and forge installer cache. Every mod and forge will be downloaded.")
         arg_parser.add_argument("-noprofile", "-np", action="store_true",
                                 help="Do not modify minecraft profile. Usually you do not want this as this will prevent the modpack from appearing/updating in your Minecraft launcher.")
+        arg_parser.add_argument("-exportbundle", "-eb",
+                                help="Instead of installing, download every mod and the forge installer and write them to this offline bundle file along with the modpack. Give the bundle in place of the modpack zip to install it without any network access.")
         # Inbuilt arguments.
+        arg_parser.add_argument("-report", "-rp", default=REPORT_FILE,
+                                help=f"Where to write the run report, a JSON file with how long each step of the install took and the download details of each mod (time to look up, transfer and check, bytes and attempts). By default it is '{REPORT_FILE}'")
+        arg_parser.add_argument("-trace", "-tr",
+                                help="Also write a Chrome trace event file of the install to this path, showing every step, resolve batch, transfer and check over time. Open it with chrome://tracing or https://ui.perfetto.dev.")
+        arg_parser.add_argument("-profile", "-pf", action="store_true",
+                                help=f"Profile the install, for finding out where a slow or memory hungry install spends its time. Writes the top functions by time to '{os.path.basename(PROFILE_FILE)}' (with the full profile in '{os.path.basename(PROFILE_STATS_FILE)}') and the top memory allocations at the end of each step to '{os.path.basename(PROFILE_MEMORY_FILE)}', next to the log. Makes the install noticeably slower.")
         arg_parser.add_argument("-version", "-v", action="version", version=appVersionStr())
 
         # Actually do the parsing
         args: argparse.Namespace = arg_parser.parse_args()
+        if not args.fpath_modpack and not args.servecache:
+            arg_parser.error("the following arguments are required: modpack_file_path")
         logging.info(f"Found args: {args}")
     except SystemExit:
         # Normal exit is an exception.
@@ -992,14 +5616,43 @@ if __name__ == '__main__':
         logging.exception("Failed to parse args. Crashing...")
         sys.exit(1)
 
+    # Profile everything from here on if asked to
+    profiler: InstallProfiler|None = None
+    if args.profile:
+        profiler = InstallProfiler()
+        run_report.profiler = profiler
+        profiler.start()
+
     # Run the main loop
     r: int = 1
     try:
         logging.info("Running installer loop")
-        r = main(vars(args))
+        if args.servecache:
+            r = serveCache(vars(args))
+        elif args.exportbundle:
+            r = exportBundle(vars(args))
+        elif len(args.fpath_modpack) > 1:
+            r = installModpacks(vars(args))
+        else:
+            r = main(vars(args) | {"fpath_modpack": args.fpath_modpack[0]})
         logging.info("=== ENDING INSTALLER ===")
     except:
         # Global exception handler so we have logs and a stack trace if anything goes wrong.
         print(f"FATAL CRASH. See {LOG_FILE} for details.")
         logging.exception("=== MAIN CRASH ===")
+    # Do not leave half deleted folders behind
+    run_report.phase("finish removing folders")
+    background_remover.wait()
+    try:
+        run_report.write(args.report, args.trace, r)
+    except Exception as e:
+        logging.exception("Failed to write run report")
+        logWarn(f"Failed to write run report: {e}")
+    if profiler:
+        try:
+            profiler.stop()
+            profiler.write(PROFILE_FILE, PROFILE_STATS_FILE, PROFILE_MEMORY_FILE)
+        except Exception as e:
+            logging.exception("Failed to write profile")
+            logWarn(f"Failed to write profile: {e}")
     sys.exit(r)
@@ -0,0 +1,867 @@
+"""
+Tests for the installer, run against the local stand-in for the CurseForge API and CDN from BenchmarkInstaller.
+Run them with: python -m pytest
+"""
+import sys
+import os
+import json
+import shutil
+import time
+import asyncio
+import email.utils
+import subprocess
+
+import pytest
+
+import InstallModPack
+import BenchmarkInstaller
+
+# CONSTANTS
+FPATH_INSTALLER: str = os.path.join(os.path.dirname(os.path.realpath(__file__)), "InstallModPack.py")
+FAKE_MOD_COUNT: int = 12
+FAKE_MOD_SIZE: int = 32*1024
+INSTALL_TIMEOUT: float = 120.0
+
+
+# === Fixtures ===
+@pytest.fixture
+def fakeMods() -> list[dict]:
+    return BenchmarkInstaller.generateFakeMods(FAKE_MOD_COUNT, FAKE_MOD_SIZE)
+
+
+@pytest.fixture
+def fakeServer(fakeMods: list[dict]):
+    fake_server: BenchmarkInstaller.FakeCurseForgeServer = BenchmarkInstaller.FakeCurseForgeServer(fakeMods)
+    fake_server.start()
+    yield fake_server
+    fake_server.stop()
+
+
+# === Helpers ===
+def runInstaller(tmp_path, fpath_modpack: str|list[str], api_url: str, *flags: str, fpath_installer: str=FPATH_INSTALLER) -> subprocess.CompletedProcess:
+    """
+    Runs the installer on a modpack (or a batch of them) in its own process, installing into tmp_path without forge or a profile.
+    Continues at the confirmation prompt and keeps the temporary files at the clean up prompt.
+    """
+    fpath_minecraft: str = os.path.join(tmp_path, "minecraft")
+    os.makedirs(fpath_minecraft, exist_ok=True)
+    command: list[str] = [sys.executable, fpath_installer, *([fpath_modpack] if isinstance(fpath_modpack, str) else fpath_modpack), "-apiurl", api_url, "-noforge", "-noprofile",
+                          "-minecraftpath", fpath_minecraft, "-tempfolder", os.path.join(tmp_path, "temp"),
+                          "-cachefolder", os.path.join(tmp_path, "cache"), "-report", os.path.join(tmp_path, "report.json"), *flags]
+    return subprocess.run(command, input="y\nn\n", capture_output=True, text=True, timeout=INSTALL_TIMEOUT)
+
+
+def makeFakeModpack(tmp_path, fake_mods: list[dict], name: str, pack_name: str|None=None) -> str:
+    """
+    Writes a fake modpack zip called name. The modpack is called pack_name if given, otherwise the usual fake name.
+    """
+    fpath_modpack: str = os.path.join(tmp_path, f"{name}.zip")
+    BenchmarkInstaller.writeFakeModpack(fpath_modpack, fake_mods)
+    if pack_name:
+        with InstallModPack.zipfile.ZipFile(fpath_modpack, "w") as f:
+            f.writestr(InstallModPack.MANIFEST_FILE, json.dumps(BenchmarkInstaller.makeFakeManifest(fake_mods) | {"name": pack_name}))
+    return fpath_modpack
+
+
+def writeOverrides(fpath_zip: str, files: dict[str, bytes], date_time: tuple=(2024, 1, 1, 12, 0, 0)) -> None:
+    """
+    Adds files to the overrides folder of a zip, all with the given modification time
+    """
+    with InstallModPack.zipfile.ZipFile(fpath_zip, "a") as f:
+        for fpath_relative, data in files.items():
+            f.writestr(InstallModPack.zipfile.ZipInfo(f"{InstallModPack.MODPACK_OVERRIDES_FOLDER}/{fpath_relative}", date_time), data)
+
+
+def getInstallFolder(tmp_path, pack_name: str|None=None) -> str:
+    return os.path.join(tmp_path, "minecraft", pack_name or BenchmarkInstaller.makeFakeManifest([])["name"])
+
+
+def readFakeModData(fake_server: BenchmarkInstaller.FakeCurseForgeServer, fake_mod: dict) -> bytes:
+    return BenchmarkInstaller.readFakeData(fake_server.block, fake_mod["offset"], fake_mod["size"])
+
+
+def makeFakeFileURL(fake_server: BenchmarkInstaller.FakeCurseForgeServer, fake_mod: dict) -> str:
+    return f"{fake_server.url()}{BenchmarkInstaller.makeFakeFilePath(fake_mod)}"
+
+
+def makeResolvedMod(fake_mod: dict, sha1: str|None) -> dict:
+    """
+    Returns a mod as the download loop has it once resolved with the API
+    """
+    return {"projectID": fake_mod["projectID"], "fileID": fake_mod["fileID"], "fileName": fake_mod["fileName"],
+            "fileLength": fake_mod["size"], "hashes": {"sha1": sha1} if sha1 else {}}
+
+
+# === Mod Cache ===
+def storeTestMod(mod_cache: InstallModPack.ModCache, tmp_path, projectID: str, data: bytes) -> str:
+    """
+    Stores a mod with the given contents in the cache. Returns its hash.
+    """
+    fpath_mod: str = os.path.join(tmp_path, f"mod-{projectID}.jar")
+    with open(fpath_mod, "wb") as f:
+        f.write(data)
+    return mod_cache.store(projectID, f"{projectID}0", fpath_mod)["sha1"]
+
+
+def testCacheEvictsLeastRecentlyUsed(tmp_path):
+    mod_cache: InstallModPack.ModCache = InstallModPack.ModCache(os.path.join(tmp_path, "cache"), 2*1024)
+    mod_cache.load()
+    hashes: list[str] = [storeTestMod(mod_cache, tmp_path, str(i), bytes([i])*1024) for i in range(3)]
+    for i, file_hash in enumerate(hashes):
+        mod_cache.files[file_hash]["lastUsed"] = 1000.0 + i
+    # Using the oldest mod makes the next oldest the one to go
+    assert mod_cache.fetch("0", "00", str(tmp_path))
+
+    mod_cache.evict()
+    assert mod_cache.lookup("1", "10") is None
+    assert not os.path.exists(mod_cache.makeFilePath(hashes[1]))
+    assert mod_cache.lookup("0", "00") and mod_cache.lookup("2", "20")
+
+
+def testCacheMergesIndexOfOtherInstallers(tmp_path):
+    fpath_cache: str = os.path.join(tmp_path, "cache")
+    cache_a: InstallModPack.ModCache = InstallModPack.ModCache(fpath_cache, InstallModPack.GB_TO_BYTES)
+    cache_b: InstallModPack.ModCache = InstallModPack.ModCache(fpath_cache, InstallModPack.GB_TO_BYTES)
+    cache_a.load()
+    cache_b.load()
+    hash_shared: str = storeTestMod(cache_a, tmp_path, "1", b"shared")
+    storeTestMod(cache_b, tmp_path, "1", b"shared")
+    storeTestMod(cache_a, tmp_path, "2", b"only a")
+    storeTestMod(cache_b, tmp_path, "3", b"only b")
+    cache_a.files[hash_shared]["lastUsed"] = 2000.0
+    cache_b.files[hash_shared]["lastUsed"] = 1000.0
+    cache_a.save()
+    cache_b.save()
+
+    # Neither installer loses what the other one cached, and the latest use of a shared file wins
+    cache: InstallModPack.ModCache = InstallModPack.ModCache(fpath_cache, InstallModPack.GB_TO_BYTES)
+    cache.load()
+    assert all(cache.lookup(x, f"{x}0") for x in ["1", "2", "3"])
+    assert cache.files[hash_shared]["lastUsed"] == 2000.0
+
+
+# === Install Lock ===
+def testDiffInstallLock(tmp_path):
+    fpath_mods: str = os.path.join(tmp_path, InstallModPack.MODS_FOLDER)
+    os.makedirs(fpath_mods)
+    with open(os.path.join(fpath_mods, "a.jar"), "wb") as f:
+        f.write(b"a"*10)
+    with open(os.path.join(fpath_mods, "b.jar"), "wb") as f:
+        f.write(b"b"*5) # Damaged, the lock says it should be 10 bytes
+    lock_a: dict = {"projectID": "1", "fileID": "11", "fileName": "a.jar", "size": 10, "sha1": "a"}
+    lock_b: dict = {"projectID": "2", "fileID": "21", "fileName": "b.jar", "size": 10, "sha1": "b"}
+    lock_c: dict = {"projectID": "3", "fileID": "31", "fileName": "c.jar", "size": 10, "sha1": "c"}
+    mod_list: list[dict] = [{"projectID": "1", "fileID": "11"}, {"projectID": "2", "fileID": "21"}, {"projectID": "4", "fileID": "41"}]
+
+    mods_download, mods_keep, mods_remove = InstallModPack.diffInstallLock(mod_list, {"mods": [lock_a, lock_b, lock_c]}, fpath_mods)
+    assert mods_download == mod_list[1:]
+    assert mods_keep == [lock_a]
+    assert mods_remove == [lock_b, lock_c]
+
+
+def testUpdateOnlyDownloadsChangedMods(tmp_path, fakeMods, fakeServer):
+    fpath_v1: str = makeFakeModpack(tmp_path, fakeMods[:10], "v1")
+    fpath_v2: str = makeFakeModpack(tmp_path, fakeMods[:8] + fakeMods[10:], "v2")
+    fpath_install_mods: str = os.path.join(getInstallFolder(tmp_path), InstallModPack.MODS_FOLDER)
+    assert runInstaller(tmp_path, fpath_v1, fakeServer.url(), "-nocache").returncode == 0
+    fakeServer.resetCounters()
+
+    assert runInstaller(tmp_path, fpath_v2, fakeServer.url(), "-nocache").returncode == 0
+    assert fakeServer.counters["bytes"] == sum(x["size"] for x in fakeMods[10:])
+    assert sorted(os.listdir(fpath_install_mods)) == sorted(x["fileName"] for x in fakeMods[:8] + fakeMods[10:])
+
+
+def testNoDownloadKeepsUnchangedMods(tmp_path, fakeMods, fakeServer):
+    fpath_v1: str = makeFakeModpack(tmp_path, fakeMods[:10], "v1")
+    fpath_v2: str = makeFakeModpack(tmp_path, fakeMods[:8] + fakeMods[10:], "v2")
+    fpath_install: str = getInstallFolder(tmp_path)
+    fpath_install_mods: str = os.path.join(fpath_install, InstallModPack.MODS_FOLDER)
+    assert runInstaller(tmp_path, fpath_v1, fakeServer.url()).returncode == 0
+    assert runInstaller(tmp_path, fpath_v2, fakeServer.url()).returncode == 0
+    # Only the changed mods were downloaded into the temporary folder by the update
+    assert sorted(os.listdir(os.path.join(tmp_path, "temp", InstallModPack.MODS_FOLDER))) == sorted(x["fileName"] for x in fakeMods[10:])
+
+    # A changed mod can be repaired from the temporary folder without touching the unchanged ones
+    os.remove(os.path.join(fpath_install_mods, fakeMods[10]["fileName"]))
+    fpath_unchanged: str = os.path.join(fpath_install_mods, fakeMods[0]["fileName"])
+    mtime_unchanged: float = os.path.getmtime(fpath_unchanged)
+    fakeServer.resetCounters()
+    assert runInstaller(tmp_path, fpath_v2, fakeServer.url(), "-nodownload").returncode == 0
+    assert fakeServer.counters["api"] == 0 and fakeServer.counters["cdn"] == 0
+    assert sorted(os.listdir(fpath_install_mods)) == sorted(x["fileName"] for x in fakeMods[:8] + fakeMods[10:])
+    assert os.path.getmtime(fpath_unchanged) == mtime_unchanged
+    install_lock: dict = InstallModPack.readInstallLock(fpath_install)
+    assert sorted(x["fileID"] for x in install_lock["mods"]) == sorted(x["fileID"] for x in fakeMods[:8] + fakeMods[10:])
+
+    # An unchanged mod was never in the temporary folder, so it cannot be installed without downloading
+    os.remove(fpath_unchanged)
+    assert runInstaller(tmp_path, fpath_v2, fakeServer.url(), "-nodownload").returncode == 1
+    assert len(os.listdir(fpath_install_mods)) == 9
+    assert InstallModPack.readInstallLock(fpath_install) == install_lock
+
+
+# === Mod Files ===
+@pytest.mark.parametrize("file_name, expected", [("jei-1.20.1.jar", "jei-1.20.1.jar"), ("../../evil.jar", "..-..-evil.jar"),
+                                                 ("..\\evil.jar", "..-evil.jar"), ("C:evil.jar", "C-evil.jar"), ("a*b?.jar", "a-b-.jar")])
+def testModFileNameIsSafe(file_name, expected):
+    mod: dict = {"projectID": "1", "fileID": "11", "fileName": file_name}
+    assert InstallModPack.makeModFileName(mod, "") == expected
+
+
+@pytest.mark.parametrize("file_name", [".", "..", " "])
+def testModFileNameRejectsUnusableNames(file_name):
+    with pytest.raises(Exception):
+        InstallModPack.makeModFileName({"projectID": "1", "fileID": "11", "fileName": file_name}, "")
+
+
+def testModFileNameFromURL():
+    assert InstallModPack.makeModFileName({"projectID": "1", "fileID": "11"}, "https://edge.forgecdn.net/files/1/11/a%2F..%2Fb.jar") == "a-..-b.jar"
+    with pytest.raises(Exception):
+        InstallModPack.makeModFileName({"projectID": "1", "fileID": "11"}, "https://edge.forgecdn.net/files/1/11/..")
+
+
+@pytest.mark.parametrize("engine", InstallModPack.DOWNLOAD_ENGINES)
+def testResolveFallsBackToSingleMods(tmp_path, monkeypatch, fakeMods, fakeServer, engine):
+    def requestModFiles(*args, **kwargs) -> dict[str, dict]:
+        raise InstallModPack.DownloadError("HTTP ERROR 500", 500)
+    async def requestModFilesAsync(*args, **kwargs) -> dict[str, dict]:
+        return requestModFiles()
+    monkeypatch.setattr(InstallModPack, "requestModFiles", requestModFiles)
+    monkeypatch.setattr(InstallModPack, "requestModFilesAsync", requestModFilesAsync)
+    mod_list: list[dict] = InstallModPack.readManifestModList(BenchmarkInstaller.makeFakeManifest(fakeMods))
+    fpath_install_temp: str = os.path.join(tmp_path, "temp")
+    os.makedirs(fpath_install_temp)
+
+    # The bulk lookup fails, so every mod is looked up on its own instead
+    assert InstallModPack.downloadModList(mod_list, fpath_install_temp, 4, True, api_url=fakeServer.url(), http_pool=InstallModPack.HTTPConnectionPool(), download_engine=engine)
+    assert fakeServer.counters["api"] == len(fakeMods)
+    assert sorted(os.listdir(os.path.join(fpath_install_temp, InstallModPack.MODS_FOLDER))) == sorted(x["fileName"] for x in fakeMods)
+
+
+@pytest.mark.parametrize("engine", InstallModPack.DOWNLOAD_ENGINES)
+def testHashMismatchIsRetried(tmp_path, monkeypatch, fakeMods, fakeServer, engine):
+    verify_mod_file = InstallModPack.verifyModFile
+    damaged: list[str] = []
+    def verifyModFile(mod: dict, fpath_mod: str) -> dict:
+        # Damage the first download of the first mod, keeping its size
+        if mod["fileID"] == fakeMods[0]["fileID"] and not damaged:
+            damaged.append(fpath_mod)
+            with open(fpath_mod, "r+b") as f:
+                f.write(b"damaged")
+        return verify_mod_file(mod, fpath_mod)
+    monkeypatch.setattr(InstallModPack, "verifyModFile", verifyModFile)
+    monkeypatch.setattr(InstallModPack, "DOWNLOAD_RETRY_BACKOFF_BASE", 0.01)
+    mod_list: list[dict] = InstallModPack.readManifestModList(BenchmarkInstaller.makeFakeManifest(fakeMods))
+    fpath_install_temp: str = os.path.join(tmp_path, "temp")
+    os.makedirs(fpath_install_temp)
+
+    assert InstallModPack.downloadModList(mod_list, fpath_install_temp, 4, True, api_url=fakeServer.url(), http_pool=InstallModPack.HTTPConnectionPool(), download_engine=engine)
+    assert damaged
+    # The damaged mod went back into the queue and was downloaded again
+    assert mod_list[0]["timing"]["attempts"] == 2
+    assert all(x["timing"]["attempts"] == 1 for x in mod_list[1:])
+    assert fakeServer.counters["bytes"] == sum(x["size"] for x in fakeMods) + fakeMods[0]["size"]
+    fpath_mod: str = os.path.join(fpath_install_temp, InstallModPack.MODS_FOLDER, fakeMods[0]["fileName"])
+    assert InstallModPack.hashFile(fpath_mod) == fakeMods[0]["sha1"]
+
+
+# === Linking Files ===
+def testFileInstallerLinks(tmp_path):
+    fpath_src: str = os.path.join(tmp_path, "source.jar")
+    writeTestFile(fpath_src, b"mod data")
+    file_installer: InstallModPack.FileInstaller = InstallModPack.FileInstaller(link=True)
+
+    method: str = file_installer.install(fpath_src, os.path.join(tmp_path, "linked.jar"))
+    assert method in ("reflink", "hardlink")
+    if method == "hardlink":
+        assert os.path.samefile(fpath_src, os.path.join(tmp_path, "linked.jar"))
+    assert file_installer.reflinked_bytes + file_installer.hardlinked_bytes == len(b"mod data")
+    assert file_installer.copied_bytes == 0
+
+    assert InstallModPack.FileInstaller().install(fpath_src, os.path.join(tmp_path, "copied.jar")) == "copy"
+    assert not os.path.samefile(fpath_src, os.path.join(tmp_path, "copied.jar"))
+
+
+def testFileInstallerStopsTryingFailedLinks(tmp_path, monkeypatch):
+    tried: list[str] = []
+    def reflinkFile(fpath_src: str, fpath_dst: str) -> bool:
+        tried.append("reflink")
+        return False
+    def link(fpath_src: str, fpath_dst: str) -> None:
+        tried.append("hardlink")
+        raise OSError("Links not supported")
+    monkeypatch.setattr(InstallModPack, "reflinkFile", reflinkFile)
+    monkeypatch.setattr(InstallModPack.os, "link", link)
+    fpath_src: str = os.path.join(tmp_path, "source.jar")
+    writeTestFile(fpath_src, b"mod data")
+    file_installer: InstallModPack.FileInstaller = InstallModPack.FileInstaller(link=True)
+
+    assert file_installer.install(fpath_src, os.path.join(tmp_path, "first.jar")) == "copy"
+    assert file_installer.install(fpath_src, os.path.join(tmp_path, "second.jar")) == "copy"
+    # Neither link method is tried again on the same drives once it failed
+    assert tried == ["reflink", "hardlink"]
+    assert file_installer.copied_bytes == 2*len(b"mod data")
+    with open(os.path.join(tmp_path, "second.jar"), "rb") as f:
+        assert f.read() == b"mod data"
+
+
+def testLinkFilesInstall(tmp_path, fakeMods, fakeServer):
+    fpath_modpack: str = makeFakeModpack(tmp_path, fakeMods, "pack")
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, fpath_modpack, fakeServer.url(), "-linkfiles")
+    assert result.returncode == 0, result.stdout + result.stderr
+    installed: str = next(x for x in result.stdout.splitlines() if "Installed files:" in x)
+    assert "MB linked" in installed and "0.0 MB copied" in installed, installed
+    for fake_mod in fakeMods:
+        with open(os.path.join(getInstallFolder(tmp_path), InstallModPack.MODS_FOLDER, fake_mod["fileName"]), "rb") as f:
+            assert f.read() == readFakeModData(fakeServer, fake_mod)
+
+
+# === Overrides ===
+@pytest.mark.parametrize("threaded", [False, True])
+def testSyncOverridesFromZip(tmp_path, monkeypatch, threaded):
+    if threaded:
+        monkeypatch.setattr(InstallModPack, "ZIP_EXTRACT_THREADED_FILES", 1)
+    fpath_zip: str = os.path.join(tmp_path, "pack.zip")
+    writeOverrides(fpath_zip, {"config/a.cfg": b"a=1\n", "config/nested/b.cfg": b"b=1\n", "../escape.cfg": b"bad\n", "options.txt": b"fov=70\n"})
+    fpath_install: str = os.path.join(tmp_path, "install")
+    files: dict[str, dict] = InstallModPack.listZipFolder(fpath_zip, InstallModPack.MODPACK_OVERRIDES_FOLDER)
+    # Parent folder references are dropped, so the entry stays inside the install folder
+    assert sorted(files) == ["config/a.cfg", "config/nested/b.cfg", "escape.cfg", "options.txt"]
+
+    assert InstallModPack.syncZipFolder(fpath_zip, InstallModPack.MODPACK_OVERRIDES_FOLDER, files, fpath_install, thread_count=2) == (4, 19)
+    with open(os.path.join(fpath_install, "config", "nested", "b.cfg"), "rb") as f:
+        assert f.read() == b"b=1\n"
+    assert os.path.getmtime(os.path.join(fpath_install, "options.txt")) == files["options.txt"]["mtime"]
+    assert not os.path.exists(os.path.join(tmp_path, "escape.cfg"))
+
+    # Nothing is extracted again while the files are unchanged
+    assert InstallModPack.syncZipFolder(fpath_zip, InstallModPack.MODPACK_OVERRIDES_FOLDER, files, fpath_install) == (0, 0)
+
+    # A rebuilt zip with the same contents only has the times fixed, while changed files are extracted again
+    fpath_rebuilt: str = os.path.join(tmp_path, "rebuilt.zip")
+    writeOverrides(fpath_rebuilt, {"config/a.cfg": b"a=1\n", "config/nested/b.cfg": b"b=2\n", "options.txt": b"fov=70\n"}, (2025, 6, 1, 12, 0, 0))
+    files = InstallModPack.listZipFolder(fpath_rebuilt, InstallModPack.MODPACK_OVERRIDES_FOLDER)
+    assert InstallModPack.syncZipFolder(fpath_rebuilt, InstallModPack.MODPACK_OVERRIDES_FOLDER, files, fpath_install) == (1, 4)
+    assert os.path.getmtime(os.path.join(fpath_install, "config", "a.cfg")) == files["config/a.cfg"]["mtime"]
+    with open(os.path.join(fpath_install, "config", "nested", "b.cfg"), "rb") as f:
+        assert f.read() == b"b=2\n"
+
+
+@pytest.mark.parametrize("lock", [True, False])
+def testUpdateRemovesOldOverrides(tmp_path, fakeMods, fakeServer, lock):
+    fpath_modpack: str = makeFakeModpack(tmp_path, fakeMods, "pack")
+    writeOverrides(fpath_modpack, {"config/a.cfg": b"a=1\n", "config/old.cfg": b"old=1\n"})
+    assert runInstaller(tmp_path, fpath_modpack, fakeServer.url()).returncode == 0
+    fpath_install: str = getInstallFolder(tmp_path)
+    writeTestFile(os.path.join(fpath_install, "config", "user.cfg"), b"user=1\n")
+    writeTestFile(os.path.join(fpath_install, "saves", "world", "level.dat"), b"world")
+    if not lock:
+        os.remove(os.path.join(fpath_install, InstallModPack.INSTALL_LOCK_FILE))
+
+    fpath_modpack_new: str = makeFakeModpack(tmp_path, fakeMods, "pack_new")
+    writeOverrides(fpath_modpack_new, {"config/a.cfg": b"a=2\n"}, (2025, 6, 1, 12, 0, 0))
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, fpath_modpack_new, fakeServer.url())
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert not os.path.exists(os.path.join(fpath_install, "config", "old.cfg"))
+    with open(os.path.join(fpath_install, "config", "a.cfg"), "rb") as f:
+        assert f.read() == b"a=2\n"
+    assert os.path.isfile(os.path.join(fpath_install, "config", "fake.cfg"))
+    # Files the user added are only known to be safe to keep when the lock says what the last install put there.
+    # Folders the modpack has no overrides in are never touched.
+    assert os.path.isfile(os.path.join(fpath_install, "config", "user.cfg")) == lock
+    assert os.path.isfile(os.path.join(fpath_install, "saves", "world", "level.dat"))
+    assert f"> Removed {1 if lock else 2} old override files" in result.stdout
+
+
+# === Batch Installs ===
+def testBatchDownloadsSharedModsOnce(tmp_path, fakeMods, fakeServer):
+    fpath_a: str = makeFakeModpack(tmp_path, fakeMods[:8], "a", "Pack A")
+    fpath_b: str = makeFakeModpack(tmp_path, fakeMods[4:], "b", "Pack B")
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, [fpath_a, fpath_b], fakeServer.url(), "-autoaccept")
+    assert result.returncode == 0, result.stdout
+
+    # The mods both modpacks share are only downloaded once
+    assert fakeServer.counters["bytes"] == sum(x["size"] for x in fakeMods)
+    for pack_name, pack_mods in [("Pack A", fakeMods[:8]), ("Pack B", fakeMods[4:])]:
+        fpath_install_mods: str = os.path.join(getInstallFolder(tmp_path, pack_name), InstallModPack.MODS_FOLDER)
+        assert sorted(os.listdir(fpath_install_mods)) == sorted(x["fileName"] for x in pack_mods)
+
+
+def testBatchRejectsSameInstallFolder(tmp_path, fakeMods, fakeServer):
+    fpath_a: str = makeFakeModpack(tmp_path, fakeMods[:6], "a")
+    fpath_b: str = makeFakeModpack(tmp_path, fakeMods[6:], "b")
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, [fpath_a, fpath_b], fakeServer.url(), "-autoaccept")
+    assert result.returncode == 1
+    assert not os.path.exists(getInstallFolder(tmp_path))
+    assert fakeServer.counters["api"] == 0 and fakeServer.counters["cdn"] == 0
+
+
+# === Retries ===
+def testParseRetryAfter():
+    assert InstallModPack.parseRetryAfter("120") == 120.0
+    assert InstallModPack.parseRetryAfter(None) is None
+    assert InstallModPack.parseRetryAfter("soon") is None
+    http_date: str = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55.0 <= InstallModPack.parseRetryAfter(http_date) <= 60.0
+    # A date in the past means there is no need to wait
+    assert InstallModPack.parseRetryAfter(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def testRateLimiterSpreadsRequests():
+    rate_limiter: InstallModPack.RateLimiter = InstallModPack.RateLimiter(10.0)
+    # A second's worth of requests go straight away, the rest wait for their turn
+    assert all(rate_limiter.reserve() == pytest.approx(0.0, abs=0.02) for _ in range(10))
+    assert rate_limiter.reserve() == pytest.approx(0.1, abs=0.02)
+    assert rate_limiter.reserve() == pytest.approx(0.2, abs=0.02)
+    assert rate_limiter.requests == 12
+    # Unlimited
+    assert InstallModPack.RateLimiter(0.0).reserve() == 0.0
+
+
+@pytest.mark.parametrize("rate", [10.0, 0.0])
+def testRateLimiterPause(rate):
+    rate_limiter: InstallModPack.RateLimiter = InstallModPack.RateLimiter(rate)
+    rate_limiter.pause(2.0)
+    assert rate_limiter.getPause() == pytest.approx(2.0, abs=0.02)
+    # A shorter pause while paused changes nothing, a longer one makes it longer without counting as a new pause
+    rate_limiter.pause(1.0)
+    assert rate_limiter.getPause() == pytest.approx(2.0, abs=0.02)
+    rate_limiter.pause(3.0)
+    assert rate_limiter.getPause() == pytest.approx(3.0, abs=0.02)
+    assert rate_limiter.pauses == 1
+    # Requests wait out the pause, then are spread out at the normal rate rather than all sent at once
+    spacing: float = 1/rate if rate else 0.0
+    assert rate_limiter.reserve() == pytest.approx(3.0 + spacing, abs=0.02)
+    assert rate_limiter.reserve() == pytest.approx(3.0 + 2*spacing, abs=0.02)
+
+    rate_limiter = InstallModPack.RateLimiter(rate)
+    rate_limiter.pause(None)
+    assert rate_limiter.getPause() == pytest.approx(InstallModPack.API_RATE_PAUSE_DEFAULT, abs=0.02)
+
+
+def testRetryDelayBacksOff():
+    for attempt in range(1, 10):
+        delay: float = min(InstallModPack.DOWNLOAD_RETRY_BACKOFF_BASE * 2**(attempt-1), InstallModPack.DOWNLOAD_RETRY_BACKOFF_MAX)
+        for _ in range(20):
+            assert delay/2 <= InstallModPack.getRetryDelay(attempt) <= delay
+    # The server asking for a longer wait wins, even past the cap
+    assert InstallModPack.getRetryDelay(1, 300.0) == 300.0
+    assert InstallModPack.getRetryDelay(1, 0.0) >= InstallModPack.DOWNLOAD_RETRY_BACKOFF_BASE/2
+
+
+# === Adaptive Concurrency ===
+def runControllerWindow(controller: InstallModPack.ConcurrencyController, latency: float, size: int=1024, error: Exception|None=None, busy: bool=True) -> int:
+    """
+    Runs one measuring interval of downloads through the controller, with every allowed worker busy if busy.
+    Returns the limit after the adjustment.
+    """
+    # The downloads have to start after the last cut, or their failures count as already dealt with
+    time.sleep(latency)
+    held: int = controller.limit if busy else 0
+    for _ in range(held):
+        assert controller.tryAcquire()
+    for _ in range(InstallModPack.ADAPTIVE_SAMPLES_MIN):
+        controller.record(latency, size, error)
+    for _ in range(held):
+        controller.release()
+    controller.update()
+    return controller.limit
+
+
+def testConcurrencyIncreases(monkeypatch):
+    monkeypatch.setattr(InstallModPack, "ADAPTIVE_INTERVAL", 0.0)
+    controller: InstallModPack.ConcurrencyController = InstallModPack.ConcurrencyController(2, maximum=10)
+    # Slow start doubles while every worker is busy, up to the maximum
+    assert [runControllerWindow(controller, 0.01) for _ in range(3)] == [4, 8, 10]
+    # Nothing changes while some workers are idle
+    controller = InstallModPack.ConcurrencyController(2)
+    assert runControllerWindow(controller, 0.01, busy=False) == 2
+    # Workers past the limit are not allowed to start
+    assert controller.tryAcquire() and controller.tryAcquire()
+    assert not controller.tryAcquire()
+
+
+def testConcurrencyDecreases(monkeypatch):
+    monkeypatch.setattr(InstallModPack, "ADAPTIVE_INTERVAL", 0.0)
+    controller: InstallModPack.ConcurrencyController = InstallModPack.ConcurrencyController(8)
+    # A 429 halves the limit and ends slow start, so it grows one at a time afterwards
+    assert runControllerWindow(controller, 0.01, error=InstallModPack.DownloadError("Throttled", 429)) == 4
+    assert runControllerWindow(controller, 0.01) == 5
+    # Missing files are not the server being overloaded, server errors are
+    assert runControllerWindow(controller, 0.01, error=InstallModPack.DownloadError("Not found", 404)) == 6
+    assert runControllerWindow(controller, 0.01, error=InstallModPack.DownloadError("Server error", 503)) == 3
+    # Failures of downloads started before the cut were already dealt with by it
+    controller.record(60.0, 0, InstallModPack.DownloadError("Server error", 503))
+    assert controller.window_errors == 0
+    controller.resetWindow()
+    # Latency growing without more throughput drops the limit by one
+    assert runControllerWindow(controller, 0.01) == 4
+    assert runControllerWindow(controller, 0.1, size=0) == 3
+    # Never below the minimum
+    for _ in range(4):
+        runControllerWindow(controller, 0.01, error=InstallModPack.DownloadError("Throttled", 429))
+    assert controller.limit == InstallModPack.ADAPTIVE_CONCURRENCY_MIN
+    assert [x[1] for x in controller.history][:5] == [8, 4, 5, 6, 3]
+
+
+# === Downloads ===
+def testResumeDownload(tmp_path, fakeMods, fakeServer):
+    fake_mod: dict = max(fakeMods, key=lambda x: x["size"])
+    data: bytes = readFakeModData(fakeServer, fake_mod)
+    url: str = makeFakeFileURL(fakeServer, fake_mod)
+    fpath_part: str = os.path.join(tmp_path, "mod.part")
+    offset: int = fake_mod["size"]//3
+    with open(fpath_part, "wb") as f:
+        f.write(data[:offset])
+    InstallModPack.writePartialDownloadInfo(fpath_part, url, f"\"{fake_mod['sha1']}\"")
+
+    InstallModPack.downloadURLToFile(url, fpath_part, pool=InstallModPack.HTTPConnectionPool(), tries=1)
+    assert InstallModPack.hashFile(fpath_part) == fake_mod["sha1"]
+    assert fakeServer.counters["bytes"] == fake_mod["size"] - offset
+
+
+def testRestartAfterRangeNotSatisfiable(tmp_path, fakeMods, fakeServer):
+    fake_mod: dict = fakeMods[0]
+    url: str = makeFakeFileURL(fakeServer, fake_mod)
+    fpath_part: str = os.path.join(tmp_path, "mod.part")
+    with open(fpath_part, "wb") as f:
+        f.write(b"x"*(fake_mod["size"] + 10)) # Already longer than the file, so the server answers 416
+    InstallModPack.writePartialDownloadInfo(fpath_part, url, f"\"{fake_mod['sha1']}\"")
+
+    InstallModPack.downloadURLToFile(url, fpath_part, pool=InstallModPack.HTTPConnectionPool(), tries=1)
+    assert InstallModPack.hashFile(fpath_part) == fake_mod["sha1"]
+    assert fakeServer.counters["bytes"] == fake_mod["size"]
+
+
+def testTruncatedDownloadResumes(tmp_path, fakeMods, fakeServer):
+    fake_mod: dict = max(fakeMods, key=lambda x: x["size"])
+    url: str = makeFakeFileURL(fakeServer, fake_mod)
+    fpath_part: str = os.path.join(tmp_path, "mod.part")
+    pool: InstallModPack.HTTPConnectionPool = InstallModPack.HTTPConnectionPool()
+    fakeServer.truncate_rate = 1.0
+    with pytest.raises(InstallModPack.DownloadError):
+        InstallModPack.downloadURLToFile(url, fpath_part, pool=pool, tries=1)
+    offset: int = os.path.getsize(fpath_part)
+    assert 0 < offset < fake_mod["size"]
+
+    fakeServer.truncate_rate = 0.0
+    fakeServer.resetCounters()
+    InstallModPack.downloadURLToFile(url, fpath_part, pool=pool, tries=1)
+    assert InstallModPack.hashFile(fpath_part) == fake_mod["sha1"]
+    assert fakeServer.counters["bytes"] == fake_mod["size"] - offset
+
+
+@pytest.mark.parametrize("engine", InstallModPack.DOWNLOAD_ENGINES)
+@pytest.mark.parametrize("truncate_rate", [0.0, 0.5])
+def testSegmentedDownload(tmp_path, monkeypatch, fakeMods, fakeServer, engine, truncate_rate):
+    fake_mod: dict = max(fakeMods, key=lambda x: x["size"])
+    url: str = makeFakeFileURL(fakeServer, fake_mod)
+    fpath_part: str = os.path.join(tmp_path, "mod.part")
+    monkeypatch.setattr(InstallModPack, "SEGMENTED_DOWNLOAD_THRESHOLD", fake_mod["size"]//2)
+    fakeServer.truncate_rate = truncate_rate
+
+    if engine == InstallModPack.DOWNLOAD_ENGINE_ASYNCIO:
+        async def download() -> None:
+            pool: InstallModPack.AsyncHTTPConnectionPool = InstallModPack.AsyncHTTPConnectionPool()
+            await InstallModPack.downloadURLToFileAsync(url, fpath_part, pool, size=fake_mod["size"])
+            await pool.close()
+        asyncio.run(download())
+    else:
+        InstallModPack.downloadURLToFile(url, fpath_part, pool=InstallModPack.HTTPConnectionPool(), size=fake_mod["size"])
+    assert InstallModPack.hashFile(fpath_part) == fake_mod["sha1"]
+    if truncate_rate:
+        assert fakeServer.counters["truncated"] > 0
+    else:
+        # One request to check the server does ranges, then one for each segment
+        assert fakeServer.counters["cdn"] == 1 + InstallModPack.SEGMENTED_DOWNLOAD_SEGMENTS
+
+
+def testAsyncWritesDoNotBlockLoop(tmp_path, monkeypatch, fakeMods, fakeServer):
+    fake_mod: dict = fakeMods[0]
+    fpath_part: str = os.path.join(tmp_path, "mod.part")
+    open_partial_file = InstallModPack.openPartialFile
+
+    class SlowFile():
+        """
+        A file on a slow disk
+        """
+        def __init__(self, f):
+            self.f = f
+
+        def write(self, data: bytes) -> int:
+            time.sleep(0.05)
+            return self.f.write(data)
+
+        def close(self) -> None:
+            self.f.close()
+    monkeypatch.setattr(InstallModPack, "openPartialFile", lambda *args: SlowFile(open_partial_file(*args)))
+
+    async def download() -> int:
+        ticks: int = 0
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+        ticker: asyncio.Task = asyncio.create_task(tick())
+        pool: InstallModPack.AsyncHTTPConnectionPool = InstallModPack.AsyncHTTPConnectionPool()
+        await InstallModPack.downloadURLToFileAsync(makeFakeFileURL(fakeServer, fake_mod), fpath_part, pool, tries=1)
+        await pool.close()
+        ticker.cancel()
+        return ticks
+    ticks: int = asyncio.run(download())
+    assert InstallModPack.hashFile(fpath_part) == fake_mod["sha1"]
+    # Other tasks carry on while the file is written
+    assert ticks >= 5
+
+
+# === Cache Peers ===
+@pytest.fixture
+def peerCache(tmp_path, fakeMods, fakeServer):
+    """
+    A cache served to other installers, holding the first fake mod under the key of the second
+    """
+    fpath_cache: str = os.path.join(tmp_path, "peer_cache")
+    mod_cache: InstallModPack.ModCache = InstallModPack.ModCache(fpath_cache, InstallModPack.GB_TO_BYTES)
+    mod_cache.load()
+    fpath_mod: str = os.path.join(tmp_path, fakeMods[1]["fileName"])
+    with open(fpath_mod, "wb") as f:
+        f.write(readFakeModData(fakeServer, fakeMods[0]))
+    mod_cache.store(fakeMods[1]["projectID"], fakeMods[1]["fileID"], fpath_mod)
+    mod_cache.save()
+    cache_server: InstallModPack.CacheServer = InstallModPack.CacheServer(fpath_cache, "127.0.0.1", 0)
+    cache_server.start()
+    yield cache_server
+    cache_server.stop()
+
+
+def testCacheServerNeedsCache(tmp_path):
+    fpath_cache: str = os.path.join(tmp_path, "cache")
+    with pytest.raises(Exception):
+        InstallModPack.CacheServer(fpath_cache, "127.0.0.1", 0)
+    os.makedirs(fpath_cache)
+    with pytest.raises(Exception):
+        InstallModPack.CacheServer(fpath_cache, "127.0.0.1", 0)
+
+    # Serving only reads the cache, so it makes no folders in it
+    os.makedirs(os.path.join(fpath_cache, InstallModPack.FORGE_CACHE_FOLDER))
+    cache_server: InstallModPack.CacheServer = InstallModPack.CacheServer(fpath_cache, "127.0.0.1", 0)
+    try:
+        assert cache_server.lookupMod("1", "11") is None
+    finally:
+        cache_server.server.server_close()
+    assert os.listdir(fpath_cache) == [InstallModPack.FORGE_CACHE_FOLDER]
+
+
+def testPeerRejectsWrongHash(tmp_path, fakeMods, peerCache):
+    fpath_mods: str = os.path.join(tmp_path, "mods")
+    os.makedirs(fpath_mods)
+    peers: InstallModPack.CachePeers = InstallModPack.CachePeers([peerCache.url()])
+
+    # The peer says it has different contents to what the API says the mod should be
+    assert peers.fetchMod(makeResolvedMod(fakeMods[1], fakeMods[1]["sha1"]), fpath_mods, str(tmp_path)) is None
+    assert os.listdir(fpath_mods) == []
+    assert peers.hits == 0 and peers.misses == 1
+
+
+def testPeerNotAskedWithoutApiHash(tmp_path, fakeMods, peerCache):
+    fpath_mods: str = os.path.join(tmp_path, "mods")
+    os.makedirs(fpath_mods)
+    peers: InstallModPack.CachePeers = InstallModPack.CachePeers([peerCache.url()])
+
+    # Only the hash the peer sends about itself would say if it sent the right file, so the peer is not asked
+    assert peers.fetchMod(makeResolvedMod(fakeMods[1], None), fpath_mods, str(tmp_path)) is None
+    assert os.listdir(fpath_mods) == []
+    assert peerCache.requests == 0
+    assert peers.misses == 1
+
+
+@pytest.mark.parametrize("engine", InstallModPack.DOWNLOAD_ENGINES)
+def testPeerDamagedFileFailsVerify(tmp_path, fakeMods, peerCache, engine):
+    fpath_mods: str = os.path.join(tmp_path, "mods")
+    os.makedirs(fpath_mods)
+    peers: InstallModPack.CachePeers = InstallModPack.CachePeers([peerCache.url()])
+    fpath_cached: str = peerCache.mod_cache.makeFilePath(fakeMods[0]["sha1"])
+    with open(fpath_cached, "r+b") as f:
+        f.write(b"damaged")
+
+    # The peer sends the hash from its index, which matches the API, but the file itself is checked like any download
+    mod: dict = makeResolvedMod(fakeMods[0], fakeMods[0]["sha1"]) | {"projectID": fakeMods[1]["projectID"], "fileID": fakeMods[1]["fileID"]}
+    if engine == "asyncio":
+        async def fetchMod() -> str|None:
+            pool: InstallModPack.AsyncHTTPConnectionPool = InstallModPack.AsyncHTTPConnectionPool()
+            try:
+                return await peers.fetchModAsync(mod, fpath_mods, str(tmp_path), pool)
+            finally:
+                await pool.close()
+        mod_name: str|None = asyncio.run(fetchMod())
+    else:
+        mod_name = peers.fetchMod(mod, fpath_mods, str(tmp_path))
+    assert mod_name == fakeMods[0]["fileName"]
+    with pytest.raises(Exception):
+        InstallModPack.verifyModFile(mod, os.path.join(fpath_mods, mod_name))
+
+
+def testPeerForgeMustMatchMavenHash(tmp_path, peerCache):
+    fpath_forge: str = os.path.join(tmp_path, InstallModPack.makeForgeInstallerFileName("1.20.1", "47.2.0"))
+    with InstallModPack.zipfile.ZipFile(fpath_forge, "w") as f:
+        f.writestr(InstallModPack.FORGE_INSTALL_PROFILE_FILE, "{}")
+    InstallModPack.storeForgeInstaller(peerCache.fpath_forge_cache, fpath_forge)
+    fpath_temp: str = os.path.join(tmp_path, "temp")
+    os.makedirs(fpath_temp)
+    peers: InstallModPack.CachePeers = InstallModPack.CachePeers([peerCache.url()])
+    forge_file: str = os.path.basename(fpath_forge)
+
+    assert not peers.fetchForge(forge_file, "0"*40, fpath_temp)
+    assert os.listdir(fpath_temp) == []
+    assert peers.fetchForge(forge_file, InstallModPack.hashFile(fpath_forge), fpath_temp)
+    assert os.listdir(fpath_temp) == [forge_file]
+
+
+# === Forge ===
+def writeTestFile(fpath_file: str, data: bytes) -> str:
+    """
+    Writes a file, making its folder. Returns its SHA1 hash.
+    """
+    os.makedirs(os.path.dirname(fpath_file), exist_ok=True)
+    with open(fpath_file, "wb") as f:
+        f.write(data)
+    return InstallModPack.hashFile(fpath_file)
+
+
+@pytest.fixture
+def forgeInstall(tmp_path) -> dict:
+    """
+    A fake forge 47.2.0 install for Minecraft 1.20.1 with one library, the vanilla jar and one processor output,
+    along with the cached installer which made it
+    """
+    fpath_minecraft: str = os.path.join(tmp_path, "minecraft")
+    fpath_libraries: str = os.path.join(fpath_minecraft, InstallModPack.MINECRAFT_LIBRARIES_FOLDER)
+    fpath_versions: str = os.path.join(fpath_minecraft, InstallModPack.MINECRAFT_VERSIONS_FOLDER)
+    fpath_library: str = os.path.join(fpath_libraries, *InstallModPack.makeMavenPath("net.minecraftforge:fmlcore:1.20.1-47.2.0").split("/"))
+    library_hash: str = writeTestFile(fpath_library, b"library")
+    fpath_vanilla: str = os.path.join(fpath_versions, "1.20.1", "1.20.1.jar")
+    vanilla_hash: str = writeTestFile(fpath_vanilla, b"vanilla")
+    fpath_patched: str = os.path.join(fpath_libraries, *InstallModPack.makeMavenPath("net.minecraft:client:1.20.1-20230612.114412:srg").split("/"))
+    patched_hash: str = writeTestFile(fpath_patched, b"patched")
+    writeTestFile(os.path.join(fpath_versions, "1.20.1", "1.20.1.json"), json.dumps({"downloads": {"client": {"sha1": vanilla_hash, "size": 7}}}).encode())
+    version: dict = {"inheritsFrom": "1.20.1", "libraries": [{"name": "net.minecraftforge:fmlcore:1.20.1-47.2.0", "downloads": {"artifact": {"path": InstallModPack.makeMavenPath("net.minecraftforge:fmlcore:1.20.1-47.2.0"), "sha1": library_hash, "size": 7}}}]}
+    forge_name: str = InstallModPack.makeForgeVersionFolderNameV2("1.20.1", "47.2.0")
+    writeTestFile(os.path.join(fpath_versions, forge_name, f"{forge_name}.json"), json.dumps(version).encode())
+
+    fpath_forge_cache: str = os.path.join(tmp_path, "forge_cache")
+    os.makedirs(fpath_forge_cache)
+    profile: dict = {"data": {"MC_SRG": {"client": "[net.minecraft:client:1.20.1-20230612.114412:srg]", "server": "[net.minecraft:server:1.20.1:srg]"},
+                              "MC_SRG_SHA": {"client": f"'{patched_hash}'", "server": "'0'"}},
+                     "processors": [{"jar": "net.minecraftforge:installertools:1.3.0", "outputs": {"{MC_SRG}": "{MC_SRG_SHA}"}},
+                                    {"sides": ["server"], "jar": "net.minecraftforge:installertools:1.3.0", "outputs": {"[net.minecraft:server:1.20.1:srg]": "'0'"}}]}
+    with InstallModPack.zipfile.ZipFile(os.path.join(fpath_forge_cache, InstallModPack.makeForgeInstallerFileName("1.20.1", "47.2.0")), "w") as f:
+        f.writestr(InstallModPack.FORGE_INSTALL_PROFILE_FILE, json.dumps(profile))
+    return {"minecraft": fpath_minecraft, "forgeCache": fpath_forge_cache, "name": forge_name, "library": fpath_library, "vanilla": fpath_vanilla, "patched": fpath_patched}
+
+
+def testForgeInstallComplete(forgeInstall):
+    assert InstallModPack.isForgeInstallComplete(forgeInstall["minecraft"], "1.20.1", "47.2.0", forgeInstall["forgeCache"]) == forgeInstall["name"]
+    # Without the installer, the files its processors made cannot be checked
+    assert InstallModPack.isForgeInstallComplete(forgeInstall["minecraft"], "1.20.1", "47.2.0") == ""
+
+
+@pytest.mark.parametrize("damage", ["library", "vanilla", "patched"])
+def testForgeInstallIncomplete(forgeInstall, damage):
+    writeTestFile(forgeInstall[damage], b"damaged")
+    assert InstallModPack.isForgeInstallComplete(forgeInstall["minecraft"], "1.20.1", "47.2.0", forgeInstall["forgeCache"]) == ""
+    os.remove(forgeInstall[damage])
+    assert InstallModPack.isForgeInstallComplete(forgeInstall["minecraft"], "1.20.1", "47.2.0", forgeInstall["forgeCache"]) == ""
+
+
+# === Run Report ===
+def testRunReport(tmp_path, fakeMods, fakeServer):
+    fpath_modpack: str = makeFakeModpack(tmp_path, fakeMods, "pack")
+    fpath_trace: str = os.path.join(tmp_path, "trace.json")
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, fpath_modpack, fakeServer.url(), "-trace", fpath_trace)
+    assert result.returncode == 0, result.stdout + result.stderr
+    with open(os.path.join(tmp_path, "report.json"), "r") as f:
+        report: dict = json.load(f)
+    assert report["version"] == InstallModPack.REPORT_VERSION and report["exitCode"] == 0
+    phases: list[str] = [x["name"] for x in report["phases"]]
+    for phase in ("read manifest", "download mods", "install mods", "install overrides", "clean up"):
+        assert phase in phases
+    assert sum(x["seconds"] for x in report["phases"]) <= report["wallSeconds"]
+    downloads: dict = report["downloads"]
+    assert [downloads[x] for x in ("mods", "cached", "peer", "failed", "retries", "bytes")] == [len(fakeMods), 0, 0, 0, 0, sum(x["size"] for x in fakeMods)]
+    assert downloads["resolveSecondsP50"] > 0 and 0 < downloads["transferSecondsP50"] <= downloads["transferSecondsP99"]
+    mods: dict[str, dict] = {x["fileID"]: x for x in report["mods"]}
+    for fake_mod in fakeMods:
+        mod: dict = mods[fake_mod["fileID"]]
+        assert (mod["fileName"], mod["bytes"], mod["attempts"], mod["failed"]) == (fake_mod["fileName"], fake_mod["size"], 1, False)
+        assert mod["transferSeconds"] > 0 and mod["totalSeconds"] >= mod["transferSeconds"]
+
+    with open(fpath_trace, "r") as f:
+        events: list[dict] = json.load(f)["traceEvents"]
+    categories: set[str] = {x.get("cat") for x in events}
+    assert {"phase", "resolve", "transfer", "verify"} <= categories
+    assert len([x for x in events if x.get("cat") == "transfer"]) == len(fakeMods)
+
+    # Mods taken from the cache are reported as such
+    assert runInstaller(tmp_path, fpath_modpack, fakeServer.url(), "-fullinstall").returncode == 0
+    with open(os.path.join(tmp_path, "report.json"), "r") as f:
+        report = json.load(f)
+    assert report["downloads"]["cached"] == len(fakeMods) and report["downloads"]["transferSecondsP50"] is None
+
+
+# === Profiling ===
+def testProfileInstall(tmp_path, fakeMods, fakeServer):
+    # The profile is written next to the installer, so run a copy of it
+    fpath_installer: str = os.path.join(tmp_path, "installer", os.path.basename(FPATH_INSTALLER))
+    os.makedirs(os.path.dirname(fpath_installer))
+    shutil.copy(FPATH_INSTALLER, fpath_installer)
+    fpath_modpack: str = makeFakeModpack(tmp_path, fakeMods, "pack")
+
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, fpath_modpack, fakeServer.url(), "-profile", fpath_installer=fpath_installer)
+    assert result.returncode == 0, result.stdout
+    assert len(os.listdir(os.path.join(getInstallFolder(tmp_path), InstallModPack.MODS_FOLDER))) == len(fakeMods)
+    fpath_profile: str = os.path.join(os.path.dirname(fpath_installer), os.path.basename(InstallModPack.PROFILE_FILE))
+    with open(fpath_profile) as f:
+        profile: str = f.read()
+    # The download threads show up in the profile, not just the main thread
+    assert "downloadURLToFile" in profile
+    assert os.path.getsize(os.path.join(os.path.dirname(fpath_installer), os.path.basename(InstallModPack.PROFILE_MEMORY_FILE))) > 0
+
+
+# === Offline Bundles ===
+def testBundleRoundTrip(tmp_path, fakeMods, fakeServer):
+    fpath_modpack: str = makeFakeModpack(tmp_path, fakeMods, "pack")
+    fpath_bundle: str = os.path.join(tmp_path, "bundle.zip")
+    assert runInstaller(tmp_path, fpath_modpack, fakeServer.url(), "-exportbundle", fpath_bundle, "-autoaccept").returncode == 0
+    assert InstallModPack.isBundle(fpath_bundle)
+    assert not os.path.exists(getInstallFolder(tmp_path))
+
+    # Installing the bundle needs nothing from the network, or the cache the export used
+    fakeServer.stop()
+    shutil.rmtree(os.path.join(tmp_path, "cache"))
+    fakeServer.resetCounters()
+    result: subprocess.CompletedProcess = runInstaller(tmp_path, fpath_bundle, "http://127.0.0.1:1", "-autoaccept")
+    assert result.returncode == 0, result.stdout
+    fpath_install_mods: str = os.path.join(getInstallFolder(tmp_path), InstallModPack.MODS_FOLDER)
+    installed: dict[str, str] = {x: InstallModPack.hashFile(os.path.join(fpath_install_mods, x)) for x in os.listdir(fpath_install_mods)}
+    assert installed == {x["fileName"]: x["sha1"] for x in fakeMods}
+    assert fakeServer.counters["api"] == 0 and fakeServer.counters["cdn"] == 0
+
+
+@pytest.mark.parametrize("file_name", ["../../x.jar", "/tmp/x.jar", "mods\\..\\..\\x.jar", "..", ""])
+@pytest.mark.parametrize("entry", ["modpack", "forge", "mods"])
+def testBundleRejectsUnsafeFileNames(tmp_path, file_name, entry):
+    index: dict = {"version": InstallModPack.BUNDLE_INDEX_VERSION, "minecraftVersion": "1.20.1", "forgeVersion": "47.2.0",
+                   "modpack": {"fileName": "pack.zip", "sha1": "0"*40},
+                   "forge": {"fileName": InstallModPack.makeForgeInstallerFileName("1.20.1", "47.2.0"), "sha1": "0"*40},
+                   "mods": [{"projectID": "1", "fileID": "11", "fileName": "a.jar", "size": 1, "sha1": "0"*40}]}
+    if entry == "mods":
+        index["mods"][0]["fileName"] = file_name
+    else:
+        index[entry]["fileName"] = file_name
+    fpath_bundle: str = os.path.join(tmp_path, "bundle.zip")
+    with InstallModPack.zipfile.ZipFile(fpath_bundle, "w") as f:
+        f.writestr(InstallModPack.BUNDLE_INDEX_FILE, json.dumps(index))
+
+    with pytest.raises(Exception):
+        InstallModPack.readBundleIndex(fpath_bundle)